@@ -4,9 +4,28 @@ import plotly.io as pio
 import datetime
 import os
 import zipfile
+from leitor_planilhas import filtrar_periodo
+from filtros import FiltroSpec
 
 
-def bar_chart_desvios(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def filtrar_desvios(dataframe: pd.DataFrame, anos, meses, estudos, categoria_selecionada, setor_selecionado):
+    """
+    Desvios com os filtros da barra lateral (categoria, setor, estudo, ano e mês da submissão).
+
+    A página calcula o recorte uma vez por estado dos filtros e o passa pronto para todos os gráficos de desvios,
+    que só agrupam e contam.
+
+    Args:
+        dataframe (pd.DataFrame): Planilha de desvios tratada (Coord_Treats.process_excel_file).
+
+    Returns:
+        pd.DataFrame: Os desvios selecionados.
+    """
+    selecoes = {'Categoria': categoria_selecionada, 'Setor': setor_selecionado, 'Estudo': estudos}
+    return FiltroSpec(anos, meses, selecoes).aplicar(dataframe, 'Data da submissão')
+
+
+def bar_chart_desvios(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de barras mostrando a quantidade de categorias por setor.
 
@@ -14,40 +33,15 @@ def bar_chart_desvios(dataframe: pd.DataFrame, anos: None, meses: None, estudos:
     gráfico de barras usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'Setor' e
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'Setor' e
                            'Categoria'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-        
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-        
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
-        
+
+    if df.empty:
+        return None
 
     # Agrupar e contar o número de categorias por setor
     sector_category_count = df.groupby('Setor', observed=False).size().reset_index(name='Número de Categorias')
@@ -63,7 +57,7 @@ def bar_chart_desvios(dataframe: pd.DataFrame, anos: None, meses: None, estudos:
     return fig
 
 
-def donut_chart_prejuizos(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def donut_chart_prejuizos(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de rosca mostrando a distribuição dos valores na coluna 'Houve prejuízos para o participante?'.
 
@@ -71,38 +65,14 @@ def donut_chart_prejuizos(dataframe: pd.DataFrame, anos: None, meses: None, estu
     gráfico de rosca usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-    
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-            
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
+
+    if df.empty:
+        return None
 
     # Agrupar e contar o número de ocorrências de cada valor na coluna 'Houve prejuízos para o participante?'
     prejuizos_count = df['Houve prejuízos para o participante?'].value_counts().reset_index()
@@ -118,7 +88,7 @@ def donut_chart_prejuizos(dataframe: pd.DataFrame, anos: None, meses: None, estu
     return fig
 
 
-def donut_chart_desv_viol(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def donut_chart_desv_viol(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de rosca mostrando a distribuição dos valores na coluna 'Houve prejuízos para o participante?'.
 
@@ -126,38 +96,14 @@ def donut_chart_desv_viol(dataframe: pd.DataFrame, anos: None, meses: None, estu
     gráfico de rosca usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-    
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-            
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
+
+    if df.empty:
+        return None
 
     # Agrupar e contar o número de ocorrências de cada valor na coluna 'Houve prejuízos para o participante?'
     desv_viol_count = df['Desvio ou Violação'].value_counts().reset_index()
@@ -173,7 +119,7 @@ def donut_chart_desv_viol(dataframe: pd.DataFrame, anos: None, meses: None, estu
     return fig
 
 
-def donut_chart_just(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def donut_chart_just(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de rosca mostrando a distribuição dos valores na coluna 'Houve prejuízos para o participante?'.
 
@@ -181,38 +127,14 @@ def donut_chart_just(dataframe: pd.DataFrame, anos: None, meses: None, estudos:
     gráfico de rosca usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'Houve prejuízos para o participante?'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-    
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-            
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
+
+    if df.empty:
+        return None
 
     # Agrupar e contar o número de ocorrências de cada valor na coluna 'Houve prejuízos para o participante?'
     justificavel = df['Justificável'].value_counts().reset_index()
@@ -228,7 +150,7 @@ def donut_chart_just(dataframe: pd.DataFrame, anos: None, meses: None, estudos:
     return fig
 
 
-def bar_chart_desvios_por_estudo(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def bar_chart_desvios_por_estudo(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de barras mostrando a quantidade de desvios por estudo.
 
@@ -236,39 +158,15 @@ def bar_chart_desvios_por_estudo(dataframe: pd.DataFrame, anos: None, meses: Non
     O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'estudo' e 'Data do desvio'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'estudo' e 'Data do desvio'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-    
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-        
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
-    
+
+    if df.empty:
+        return None
+
     # Agrupar e contar o número de desvios por estudo
     desvios_count = df.groupby('Estudo', observed=False).size().reset_index(name='Número de Desvios')
     desvios_count = desvios_count.sort_values(by='Número de Desvios', ascending=False)
@@ -283,7 +181,7 @@ def bar_chart_desvios_por_estudo(dataframe: pd.DataFrame, anos: None, meses: Non
     return fig
 
 
-def bar_chart_count_por_categoria(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def bar_chart_count_por_categoria(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de barras mostrando a contagem de desvios por categoria.
 
@@ -291,39 +189,15 @@ def bar_chart_count_por_categoria(dataframe: pd.DataFrame, anos: None, meses: No
     usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter a coluna 'Categoria'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter a coluna 'Categoria'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-        
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-            
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
-        
+
+    if df.empty:
+        return None
+
     # Agrupar e contar o número de ocorrências de cada categoria
     categorias_count = df['Categoria'].value_counts().reset_index()
     categorias_count.columns = ['Categoria', 'Número de Ocorrências']
@@ -338,7 +212,7 @@ def bar_chart_count_por_categoria(dataframe: pd.DataFrame, anos: None, meses: No
     return fig
 
 # Não usado
-def bar_chart_desvios_por_setor_categoria(dataframe: pd.DataFrame, anos: None, meses: None, estudos: None, categoria_selecionada: None, setor_selecionado: None):
+def bar_chart_desvios_por_setor_categoria(df: pd.DataFrame):
     """
     Cria e exibe um gráfico de barras agrupadas mostrando a contagem de desvios por setor e categoria.
 
@@ -346,39 +220,15 @@ def bar_chart_desvios_por_setor_categoria(dataframe: pd.DataFrame, anos: None, m
     agrupadas usando Plotly Express. O gráfico é exibido interativamente.
 
     Args:
-        df (pd.DataFrame): O DataFrame a ser usado para criar o gráfico, que deve conter as colunas 'Setor' e 'Categoria'.
+        df (pd.DataFrame): Os desvios já filtrados (`filtrar_desvios`) usados para criar o gráfico, que deve conter as colunas 'Setor' e 'Categoria'.
 
     Returns:
         None: A função exibe o gráfico diretamente e não retorna nenhum valor.
     """
-    
-    df = dataframe.copy()
-        
-    if categoria_selecionada:
-        df = df[df['Categoria'].isin(categoria_selecionada)]
-        if df.empty:
-            return None
-            
-    if setor_selecionado:
-        df = df[df['Setor'].isin(setor_selecionado)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da submissão'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da submissão'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
-    
+
+    if df.empty:
+        return None
+
     # Agrupar e contar o número de ocorrências de cada combinação de setor e categoria
     setor_categoria_count = df.groupby(['Setor', 'Categoria'], observed=False).size().reset_index(name='Número de Desvios')
 
@@ -403,15 +253,10 @@ def bar_chart_media_tempos_desvios(dataframe, meses, anos, tempo_desv_cien):
     
     df = dataframe.copy()
 
-    if anos:
-        df = df[df['Data da ciência'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-    
-    if meses:
-        df = df[df['Data da ciência'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    df = filtrar_periodo(df, 'Data da ciência', anos, meses)
+    if df.empty:
+        return None
+
         
     cols = ['Tempo Desvio_Ciencia'] if tempo_desv_cien else ['Tempo Ciencia_Sub']
 
@@ -436,15 +281,10 @@ def bar_chart_media_tempos_desvios(dataframe, meses, anos, tempo_desv_cien):
 def bar_chart_control_qual_tempos(dataframe: pd.DataFrame, meses: None, anos: None):
     df = dataframe.copy()
 
-    if anos:
-        df = df[df['Data Registro'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-    
-    if meses:
-        df = df[df['Data Registro'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    df = filtrar_periodo(df, 'Data Registro', anos, meses)
+    if df.empty:
+        return None
+
         
     media_por_mes = round(df.groupby(['Mês', 'Ano'])[['Tempo Coordenação vs Entrega Auditoria', 'Tempo total do processo']].mean(),2).reset_index(names=['Mes', 'Ano'])
     media_por_mes['Ano'] = media_por_mes['Ano'].astype(str)
@@ -472,15 +312,10 @@ def bar_chart_control_qual_tempos(dataframe: pd.DataFrame, meses: None, anos: No
 def bar_chart_media_tot_proc(dataframe: pd.DataFrame, meses: None, anos: None):
     df = dataframe.copy()
 
-    if anos:
-        df = df[df['Data Registro'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-    
-    if meses:
-        df = df[df['Data Registro'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    df = filtrar_periodo(df, 'Data Registro', anos, meses)
+    if df.empty:
+        return None
+
         
     media_por_mes = round(df.groupby(['Mês', 'Ano'])[['Tempo total do processo']].mean(),2).reset_index(names=['Mes', 'Ano'])
     media_por_mes['Ano'] = media_por_mes['Ano'].astype(str)
@@ -509,8 +344,9 @@ def gerar_grafico_relatorio(dataframe: pd.DataFrame, estudo, setor, categoria):
     hoje = datetime.datetime.today()
     mes_atual, ano_atual = hoje.month, hoje.year
 
-    desv_categ = bar_chart_count_por_categoria(dataframe=dataframe, meses=[mes_atual], anos=[ano_atual], estudos=estudo, setor_selecionado=setor, categoria_selecionada=categoria)
-    desv_setor = bar_chart_desvios(dataframe=dataframe, meses=[mes_atual], anos=[ano_atual], estudos=estudo, setor_selecionado=setor, categoria_selecionada=categoria)
+    df = filtrar_desvios(dataframe, anos=[ano_atual], meses=[mes_atual], estudos=estudo, categoria_selecionada=categoria, setor_selecionado=setor)
+    desv_categ = bar_chart_count_por_categoria(df)
+    desv_setor = bar_chart_desvios(df)
 
 
     if desv_categ and desv_setor:
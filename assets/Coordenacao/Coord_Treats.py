@@ -1,6 +1,31 @@
+import io
 import pandas as pd
 import streamlit as st
 from progress_bar import ProgressBar
+from leitor_planilhas import MAX_PROCESSOS, adicionar_chaves_calendario, cache_abas, cache_por_aba, cache_por_conteudo, chave_ano, chave_mes, colunas_faltantes, converter_texto_livre, ler_excel, listar_abas, mapear_em_processos, ordenar_por_data, validar_planilha
+
+
+# Abas da planilha de desvios que não são de estudos
+ABAS_IGNORADAS = ['modelo', 'folha', 'operacionais', 'validação']
+
+# Colunas lidas de cada aba (estudo) da planilha de desvios
+COLUNAS_DESVIOS = ['Categoria', 'Desvio ou Violação', 'Setor', 'Justificável','Houve prejuízos para o participante?', 'Data do desvio', 'Data da ciência', 'Data da submissão', 'Descrição']
+
+# Abas da Tabela Coordenação-Qualidade que não seguem o formato "Mês Ano"
+ABAS_IGNORADAS_QUAL_COORD = ['Outubro 23', 'Novembro 23', 'Agosto', 'Setembro', 'Planilha1']
+
+# Colunas (já normalizadas) usadas no cálculo de tempos da Tabela Coordenação-Qualidade
+COLUNAS_QUAL_COORD = ['Data consulta', 'Data recebimento coordenação', 'Data entrega qualidade para coordenação', 'Data entrega para auditoria',
+                      'Data entrega para qualidade', 'Data entrega para arquivo', 'Data entrega supervisão para arquivo', 'Data entrega qualidade para arquivo']
+
+# Colunas de data usadas nos filtros de ano e mês, com as chaves de calendário criadas na leitura
+COLUNAS_DATA_DESVIOS = ['Data da ciência', 'Data da submissão']
+
+# Dimensões dos filtros dos gráficos de desvios, com índice de bitmaps (`filtros.indexar`)
+DIMENSOES_FILTRO_DESVIOS = ['Estudo', 'Categoria', 'Setor']
+
+# A partir deste número de estudos (abas), elas são tratadas em paralelo, em vários processos
+MIN_ABAS_PARALELO = 8
 
 # Função para verificar se um valor pode ser convertido para datetime
 def verificar_data(valor):
@@ -11,6 +36,7 @@ def verificar_data(valor):
         return pd.NA
 
 
+@cache_por_conteudo(versao='4')
 def process_excel_file(excel_file) -> pd.DataFrame:
     """
     Processa um arquivo Excel contendo várias planilhas e combina os dados em um único DataFrame.
@@ -28,49 +54,110 @@ def process_excel_file(excel_file) -> pd.DataFrame:
                       uma coluna adicional 'estudo' que indica a origem dos dados.
     """
     
-    # Carregar todas as planilhas do arquivo Excel
-    df = pd.read_excel(excel_file, sheet_name=None).copy()
+    # Ignorar a planilha 'MODELO' e as demais que não são de estudos
+    abas = [sheet_name for sheet_name in listar_abas(excel_file) if not aba_ignorada(sheet_name)]
+
+    if MAX_PROCESSOS > 1 and len(abas) >= MIN_ABAS_PARALELO:
+        # Cada processo lê e trata um grupo de abas; os grupos voltam na ordem original.
+        # As abas que já estão no cache (não mudaram desde o último upload) não são tratadas nos processos
+        conteudo = excel_file.getvalue()
+        conhecidas = frozenset(cache_abas.chaves())
+        grupos = [(conteudo, abas[i::MAX_PROCESSOS], conhecidas) for i in range(MAX_PROCESSOS)]
+
+        resultados = {}
+        for grupo in mapear_em_processos(tratar_grupo_abas, grupos):
+            for sheet_name, chave, new_df in grupo:
+                if new_df is None:
+                    new_df = cache_abas.obter(chave)
+                    if new_df is None:
+                        # A aba saiu do cache enquanto os processos trabalhavam
+                        new_df = tratar_aba(sheet_name, ler_excel(excel_file, sheet_name=sheet_name))
+                else:
+                    cache_abas.guardar(chave, new_df)
+                resultados[sheet_name] = new_df
+
+        processed_dfs = [resultados[sheet_name] for sheet_name in abas]
+    else:
+        # Carregar as planilhas do arquivo Excel. As abas que não mudaram desde o último upload vêm do cache
+        df = ler_excel(excel_file, sheet_name=abas)
+        processed_dfs = [tratar_aba(sheet_name, sheet_df) for sheet_name, sheet_df in df.items()]
 
-    # Inicializar uma lista para armazenar os DataFrames processados
-    processed_dfs = []
+    # Concatenar todos os DataFrames da lista em um único DataFrame
+    final_df = pd.concat(processed_dfs, ignore_index=True)
 
-    # Iterar sobre cada planilha
-    for sheet_name, sheet_df in df.items():
-        # Ignorar a planilha 'MODELO'
-        if any(palavra in sheet_name.lower() for palavra in ['modelo', 'folha', 'operacionais', 'validação']):
-            continue
+    # Ordenado pela data de submissão, a dos filtros de período dos gráficos
+    return ordenar_por_data(final_df, 'Data da submissão')
 
-        
-        # Selecionar as colunas de interesse
-        new_df = sheet_df[['Categoria', 'Desvio ou Violação', 'Setor', 'Justificável','Houve prejuízos para o participante?', 'Data do desvio', 'Data da ciência', 'Data da submissão', 'Descrição']].copy()
-        
-        # Adicionar uma coluna 'estudo' com o nome da planilha
-        new_df['Estudo'] = sheet_name
 
-        new_df = new_df[new_df['Data da submissão'] != "Em duplicata"]
+def verificar_cabecalhos_desvios(cabecalhos):
+    '''Confere se cada aba de estudo da planilha de desvios tem as colunas usadas no tratamento'''
+    abas = [sheet_name for sheet_name in cabecalhos if not aba_ignorada(sheet_name)]
+    if not abas:
+        return ['Nenhuma aba de estudo foi encontrada.']
 
-        dates = ['Data do desvio', 'Data da ciência', 'Data da submissão']
-        for date in dates:
-            new_df[date] = new_df[date].apply(verificar_data)
-            
-            new_df[date] = pd.to_datetime(new_df[date], errors='coerce', dayfirst=True)
+    problemas = []
+    for sheet_name in abas:
+        problemas += colunas_faltantes(sheet_name, cabecalhos[sheet_name], COLUNAS_DESVIOS)
 
-        new_df['Data da submissão'] = new_df['Data da submissão'].fillna(new_df['Data da ciência'])
+    return problemas
 
-        new_df['Houve prejuízos para o participante?'] = new_df['Houve prejuízos para o participante?'].str.strip().str.capitalize()
 
-        # Adicionar o DataFrame processado à lista
-        processed_dfs.append(new_df)
+def validar_planilha_desvios(excel_file):
+    '''Valida o upload da planilha de desvios pelos cabeçalhos. Retorna a lista de problemas (vazia se estiver tudo certo)'''
+    return validar_planilha(excel_file, verificar_cabecalhos_desvios)
 
-    # Concatenar todos os DataFrames da lista em um único DataFrame
-    final_df = pd.concat(processed_dfs, ignore_index=True)
 
-    return final_df
+def aba_ignorada(sheet_name):
+    return any(palavra in sheet_name.lower() for palavra in ABAS_IGNORADAS)
+
+
+@cache_por_aba(versao='3')
+def tratar_aba(sheet_name, sheet_df) -> pd.DataFrame:
+    '''Seleciona as colunas de interesse de uma aba (estudo) da planilha de desvios e converte as datas'''
+    # Selecionar as colunas de interesse
+    new_df = sheet_df[COLUNAS_DESVIOS].copy()
+
+    # Adicionar uma coluna 'estudo' com o nome da planilha
+    new_df['Estudo'] = sheet_name
+
+    new_df = new_df[new_df['Data da submissão'] != "Em duplicata"]
+
+    dates = ['Data do desvio', 'Data da ciência', 'Data da submissão']
+    for date in dates:
+        new_df[date] = new_df[date].apply(verificar_data)
+
+        new_df[date] = pd.to_datetime(new_df[date], errors='coerce', dayfirst=True)
+
+    new_df['Data da submissão'] = new_df['Data da submissão'].fillna(new_df['Data da ciência'])
+
+    new_df['Houve prejuízos para o participante?'] = new_df['Houve prejuízos para o participante?'].str.strip().str.capitalize()
+
+    new_df = adicionar_chaves_calendario(new_df, COLUNAS_DATA_DESVIOS)
+
+    return converter_texto_livre(new_df, ['Descrição'])
+
+
+def tratar_grupo_abas(grupo):
+    '''Executado em um processo do pool: lê e trata as abas do grupo, retornando tuplas (aba, chave do cache, DataFrame).
+    Para as abas cuja chave já é conhecida pelo processo principal, o DataFrame volta como None'''
+    conteudo, abas, conhecidas = grupo
+    if not abas:
+        return []
+
+    df = ler_excel(io.BytesIO(conteudo), sheet_name=abas)
+
+    resultados = []
+    for sheet_name, sheet_df in df.items():
+        chave = tratar_aba.chave_cache(sheet_name, sheet_df)
+        new_df = None if chave in conhecidas else tratar_aba.__wrapped__(sheet_name, sheet_df)
+        resultados.append((sheet_name, chave, new_df))
+
+    return resultados
 
 
 def dict_dataframe(excel_file):
     '''Recebe upload da planilha, pelo streamlit, para gerar o `dict_dataframe` a fim de ser utilizado em `process_tab_qual_coord`'''
-    df = pd.read_excel(excel_file, sheet_name=None)
+    df = ler_excel(excel_file, sheet_name=None)
     return df
 
 
@@ -78,7 +165,7 @@ def process_tab_qual_coord(dict_dataframe: dict) -> pd.DataFrame:
     df_list = []
 
     for sheet_name, sheet_df in dict_dataframe.items():
-        if sheet_name in ['Outubro 23', 'Novembro 23', 'Agosto', 'Setembro', 'Planilha1']:
+        if sheet_name in ABAS_IGNORADAS_QUAL_COORD:
             continue
 
         # Renomeia as colunas para remover espaços extras
@@ -172,12 +259,12 @@ def gerar_calculo_tempos(dataframe_desvios):
     'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
     ]
 
-    df['Mês'] = df['Data da ciência'].dt.month.map(meses_dict)
+    df['Mês'] = df[chave_mes('Data da ciência')].map(meses_dict)
 
     # Converte a coluna 'Mes' em uma categoria com a ordem definida
     df['Mês'] = pd.Categorical(df['Mês'], categories=ordem_meses, ordered=True)
 
-    df['Ano'] = df['Data da ciência'].dt.year
+    df['Ano'] = df[chave_ano('Data da ciência')]
 
 
     df['Tempo Desvio_Ciencia'] = (df['Data da ciência'] - df['Data do desvio']).dt.days
@@ -187,6 +274,29 @@ def gerar_calculo_tempos(dataframe_desvios):
     return registros_apagados, df
 
 
+def verificar_cabecalhos_tab_qual_coord(cabecalhos):
+    '''Confere se as abas da Tabela Coordenação-Qualidade estão no formato "Mês Ano" e se, juntas, têm as colunas de datas'''
+    abas = [sheet_name for sheet_name in cabecalhos if sheet_name not in ABAS_IGNORADAS_QUAL_COORD]
+    if not abas:
+        return ['Nenhuma aba de mês foi encontrada.']
+
+    problemas = [f'Aba "{sheet_name}": o nome deve estar no formato "Mês Ano".' for sheet_name in abas if len(sheet_name.split()) != 2]
+
+    # Mesma normalização dos nomes das colunas feita em `tratar_tab_qual_coord`
+    colunas = pd.Index([coluna for sheet_name in abas for coluna in cabecalhos[sheet_name]], dtype=object)
+    colunas = set(colunas.str.replace(r'\s+', ' ', regex=True).str.strip().str.capitalize())
+    faltantes = [coluna for coluna in COLUNAS_QUAL_COORD if coluna not in colunas]
+    if faltantes:
+        problemas.append(f'Nenhuma aba tem as colunas {", ".join(repr(coluna) for coluna in faltantes)}.')
+
+    return problemas
+
+
+def validar_tab_qual_coord(file):
+    '''Valida o upload da Tabela Coordenação-Qualidade pelos cabeçalhos. Retorna a lista de problemas (vazia se estiver tudo certo)'''
+    return validar_planilha(file, verificar_cabecalhos_tab_qual_coord)
+
+
 def carregar_dados_tab_qual_coord(file):
     '''Esse é para o cálculo de tempos da Auditoria da Coordenação - O tempo que levou entre os processos da Coordenação até a Qualidade e Arquivo.
     - A tabela é a Tabela Coordenação-Qualidade'''
@@ -194,12 +304,22 @@ def carregar_dados_tab_qual_coord(file):
     barra = ProgressBar()
     barra.iniciar_carregamento()
 
-    dict_df = pd.read_excel(file, sheet_name=None).copy()
+    df_final = tratar_tab_qual_coord(file)
+
+    barra.finalizar_carregamento(emoji='🎉')
+
+    return df_final
+
+
+@cache_por_conteudo(versao='2')
+def tratar_tab_qual_coord(file):
+    '''Lê e trata a Tabela Coordenação-Qualidade. O resultado fica em cache pelo conteúdo do arquivo.'''
+    dict_df = ler_excel(file, sheet_name=None).copy()
     
     df_list = []
 
     for sheet_name, sheet_df in dict_df.items():
-        if sheet_name in ['Outubro 23', 'Novembro 23', 'Agosto', 'Setembro', 'Planilha1']:
+        if sheet_name in ABAS_IGNORADAS_QUAL_COORD:
             continue
 
         # Renomeia as colunas para remover espaços extras
@@ -284,8 +404,5 @@ def carregar_dados_tab_qual_coord(file):
 
     df_final['Ano'] = df_final['Data Registro'].dt.year
 
-    barra.finalizar_carregamento(emoji='🎉')
-
-
-    return df_final
+    return adicionar_chaves_calendario(df_final, ['Data Registro'])
 
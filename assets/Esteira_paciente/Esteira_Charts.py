@@ -1,5 +1,6 @@
 import pandas as pd
 import plotly.express as px
+from leitor_planilhas import filtrar_periodo
 
 
 def bar_chart_medias_tempo_processo(dataframe_tempos, anos=None, meses=None):
@@ -14,15 +15,9 @@ def bar_chart_medias_tempo_processo(dataframe_tempos, anos=None, meses=None):
     """
     df_tempos = dataframe_tempos.copy()
 
-    if anos:
-        df_tempos = df_tempos[df_tempos['Data de Recebimento (início/encaminhamento)'].dt.year.isin(anos)]
-        if df_tempos.empty:
-            return None
-
-    if meses:
-        df_tempos = df_tempos[df_tempos['Data de Recebimento (início/encaminhamento)'].dt.month.isin(meses)]
-        if df_tempos.empty:
-            return None
+    df_tempos = filtrar_periodo(df_tempos, 'Data de Recebimento (início/encaminhamento)', anos, meses)
+    if df_tempos.empty:
+        return None
 
     # Filtrando apenas os valores positivos para cada coluna, evitando erro de digitação
     media_eligibilidade = round(df_tempos.loc[df_tempos['Tempo Eligibilidade - Recebimento'] >= 0, 'Tempo Eligibilidade - Recebimento'].mean(), 2)
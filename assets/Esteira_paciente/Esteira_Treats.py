@@ -1,5 +1,13 @@
 import pandas as pd
 import datetime
+from leitor_planilhas import adicionar_chaves_calendario, cache_por_conteudo, chave_ano, chave_mes, colunas_calendario, colunas_faltantes, filtrar_periodo, ler_excel, validar_planilha
+
+
+# Colunas da aba 'TCLE' usadas nos checkpoints, nos tempos e nas taxas
+COLUNAS_ESTEIRA = ['ID processo', 'Potencial Elegível (Sim/Não)', 'Tem interesse em participar?', 'Consentido (Sim/Não)',
+                   'Status Final (Randomizado/Falha)', 'Houve extensão ou re-screening deste paciente? (Sim/Não)', 'Tempo real de SCR',
+                   'Data de Recebimento (início/encaminhamento)', 'Data de Avaliação Elegibilidade', 'Data do contato',
+                   'Data Consentimento', 'Data randomização/falha']
 
 # Primeiro checkpoint - Elegibilidade
 def check_eleg(row):
@@ -61,10 +69,23 @@ def aplicar_checkpoints(data_frame, funcoes):
 
     return df_final
 
+def verificar_cabecalhos(cabecalhos):
+    '''Confere se existe a aba 'TCLE' e se ela tem as colunas usadas no tratamento'''
+    if 'TCLE' not in cabecalhos:
+        return ['A aba "TCLE" não foi encontrada.']
+
+    return colunas_faltantes('TCLE', cabecalhos['TCLE'], COLUNAS_ESTEIRA)
+
+
+def validar_arquivo(upload):
+    '''Valida o upload pelos cabeçalhos, antes do processamento. Retorna a lista de problemas (vazia se estiver tudo certo)'''
+    return validar_planilha(upload, verificar_cabecalhos)
+
 # Aplica as funções acima
+@cache_por_conteudo(versao='2')
 def tratar_dados_upload(upload):
     '''Aqui deve ser feito o upload do arquivo Excel, pelo file `st.file_uploader` e aplica o tratamento'''
-    df_inicial = pd.read_excel(upload, sheet_name=None)
+    df_inicial = ler_excel(upload, sheet_name=None)
     df = df_inicial['TCLE'].copy()
 
     funcoes=[check_eleg, check_interesse, check_consent, check_rando, check_extensao]
@@ -73,6 +94,10 @@ def tratar_dados_upload(upload):
     df_preenchido = df_preenchido.replace('-', 'Não se aplica')
     df_preenchido = df_preenchido.drop(columns='Tempo real de SCR', axis=0)
 
+    # Ano e mês do recebimento, usados nos filtros das taxas e dos tempos
+    df_preenchido['Data de Recebimento (início/encaminhamento)'] = pd.to_datetime(df_preenchido['Data de Recebimento (início/encaminhamento)'], errors='coerce', dayfirst=True, format='%d/%m/%Y')
+    df_preenchido = adicionar_chaves_calendario(df_preenchido, ['Data de Recebimento (início/encaminhamento)'])
+
     return df_preenchido
 
 # Retorna Df_tempos - média do processo
@@ -90,7 +115,7 @@ def dataframe_para_calculo_tempos(data_frame):
     colunas = ['Data de Recebimento (início/encaminhamento)',
                       'Data de Avaliação Elegibilidade', 'Data do contato', 'Data Consentimento', 'Data randomização/falha']
     
-    df_tempos = data_frame[colunas].copy()
+    df_tempos = data_frame[colunas + colunas_calendario(['Data de Recebimento (início/encaminhamento)'])].copy()
 
     # Convertendo para datetime    
     for data in colunas:
@@ -128,7 +153,7 @@ def totais_brutos_dados(dataframe_taxas, anos=None):
 
     anos = datetime.datetime.today().year if anos == None else anos
 
-    df_taxas = df_taxas[df_taxas['Data de Recebimento (início/encaminhamento)'].dt.year.isin(anos)]
+    df_taxas = filtrar_periodo(df_taxas, 'Data de Recebimento (início/encaminhamento)', anos)
 
     # Número total de pacientes encaminhados
     total_encaminhados = df_taxas['ID processo'].nunique()
@@ -198,12 +223,10 @@ def calcular_taxas_mensais(dataframe_taxas, anos=None):
     Retorna as taxas de conversão mensais, a fim de criar o gráfico de linhas.
     '''
 
-    dataframe_taxas = dataframe_taxas.copy()
-    dataframe_taxas['Data de Recebimento (início/encaminhamento)'] = pd.to_datetime(dataframe_taxas['Data de Recebimento (início/encaminhamento)'], errors='coerce', dayfirst=True, format='%d/%m/%Y')
-
-    # Extraímos o ano e mês da coluna 'Data de Recebimento (início/encaminhamento)'
-    dataframe_taxas['Ano'] = dataframe_taxas['Data de Recebimento (início/encaminhamento)'].dt.year
-    dataframe_taxas['Mês'] = dataframe_taxas['Data de Recebimento (início/encaminhamento)'].dt.month
+    # Ano e mês da coluna 'Data de Recebimento (início/encaminhamento)', calculados na leitura (0 quando não há data)
+    dataframe_taxas = dataframe_taxas[dataframe_taxas[chave_ano('Data de Recebimento (início/encaminhamento)')] > 0].copy()
+    dataframe_taxas['Ano'] = dataframe_taxas[chave_ano('Data de Recebimento (início/encaminhamento)')]
+    dataframe_taxas['Mês'] = dataframe_taxas[chave_mes('Data de Recebimento (início/encaminhamento)')]
 
     if anos:
         dataframe_taxas = dataframe_taxas[dataframe_taxas['Ano'].isin(anos)]
@@ -2,30 +2,19 @@ import plotly.express as px
 import pandas as pd
 import zipfile
 import os
+from leitor_planilhas import filtrar_periodo
+from filtros import filtrar_dimensoes
 
 
 def bar_chart_achados_protocolo(dataframe: pd.DataFrame, anos: list=None, meses: list=None, estudos: list=None, responsavel: list=None):
-    df = dataframe.copy()
+    df = filtrar_dimensoes(dataframe, {'Protocolo': estudos, 'Responsável': responsavel})
+    if df.empty:
+        return None
+
+    df = filtrar_periodo(df, 'Data da Verificação', anos, meses)
+    if df.empty:
+        return None
 
-    if anos:
-        df = df[df['Data da Verificação'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da Verificação'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Protocolo'].isin(estudos)]
-        if df.empty:
-            return None
-        
-    if responsavel:
-        df = df[df['Responsável'].isin(responsavel)]
-        if df.empty:
-            return None
         
     data = df.groupby('Protocolo', observed=False).count()['Achados'].reset_index(name='Contagem de Achados')
     data = data.sort_values(by='Contagem de Achados', ascending=False)
@@ -49,27 +38,14 @@ def bar_chart_achados_protocolo(dataframe: pd.DataFrame, anos: list=None, meses:
 
 
 def bar_chart_resp_achados(dataframe: pd.DataFrame, anos: list=None, meses: list=None, estudos: list=None, responsavel: list=None):
-    df = dataframe.copy()
+    df = filtrar_dimensoes(dataframe, {'Protocolo': estudos, 'Responsável': responsavel})
+    if df.empty:
+        return None
+
+    df = filtrar_periodo(df, 'Data da Verificação', anos, meses)
+    if df.empty:
+        return None
 
-    if anos:
-        df = df[df['Data da Verificação'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da Verificação'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Protocolo'].isin(estudos)]
-        if df.empty:
-            return None
-        
-    if responsavel:
-        df = df[df['Responsável'].isin(responsavel)]
-        if df.empty:
-            return None
         
     resps = df.groupby('Responsável', observed=False).count()['Achados'].reset_index(name='Contagem de Achados')
     resps = resps.sort_values(by='Contagem de Achados', ascending=False)
@@ -103,27 +79,14 @@ def bar_chart_resp_achados(dataframe: pd.DataFrame, anos: list=None, meses: list
 
 
 def bar_chart_achados_frequentes(dataframe: pd.DataFrame, anos: list=None, meses: list=None, estudos: list=None, responsavel: list=None, tamanho: dict={'w':1280, 'h':720}):
-    df = dataframe.copy()
+    df = filtrar_dimensoes(dataframe, {'Protocolo': estudos, 'Responsável': responsavel})
+    if df.empty:
+        return None
+
+    df = filtrar_periodo(df, 'Data da Verificação', anos, meses)
+    if df.empty:
+        return None
 
-    if anos:
-        df = df[df['Data da Verificação'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da Verificação'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if estudos:
-        df = df[df['Protocolo'].isin(estudos)]
-        if df.empty:
-            return None
-        
-    if responsavel:
-        df = df[df['Responsável'].isin(responsavel)]
-        if df.empty:
-            return None
         
     if tamanho:
         width = tamanho['w']
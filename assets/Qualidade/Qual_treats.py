@@ -3,6 +3,12 @@ import streamlit as st
 import time
 import io
 from progress_bar import ProgressBar
+from leitor_planilhas import adicionar_chaves_calendario, cache_por_conteudo, colunas_faltantes, converter_texto_livre, filtrar_periodo, ler_excel, ordenar_por_data, validar_planilha
+from filtros import filtrar_dimensoes
+
+
+# Dimensões dos filtros dos gráficos de achados, com índice de bitmaps (`filtros.indexar`)
+DIMENSOES_FILTRO = ['Protocolo', 'Responsável']
 
 
 def load_qualidade_file(file: io.BytesIO):
@@ -10,7 +16,17 @@ def load_qualidade_file(file: io.BytesIO):
     barra = ProgressBar()
     barra.iniciar_carregamento()
 
-    df = pd.read_excel(file, sheet_name=None).copy()
+    final_df = tratar_qualidade_file(file)
+
+    barra.finalizar_carregamento()
+
+    return final_df
+
+
+@cache_por_conteudo(versao='4')
+def tratar_qualidade_file(file: io.BytesIO):
+    '''Lê e trata a planilha de achados. O resultado fica em cache pelo conteúdo do arquivo.'''
+    df = ler_excel(file, sheet_name=None).copy()
     
     dfs = []
 
@@ -37,34 +53,43 @@ def load_qualidade_file(file: io.BytesIO):
     final_df = final_df.dropna(subset='Protocolo')
     final_df = final_df.dropna(subset='Responsável')
 
-    barra.finalizar_carregamento()
+    final_df = adicionar_chaves_calendario(final_df, ['Data da Verificação'])
+    final_df = ordenar_por_data(final_df, 'Data da Verificação')
 
-    return final_df
+    return converter_texto_livre(final_df, ['Achados'])
 
 # Função para verificar a validade do arquivo
+def verificar_cabecalhos(cabecalhos):
+    '''Confere se as abas de achados têm as colunas usadas em `tratar_qualidade_file`'''
+    abas = [sheet_name for sheet_name in cabecalhos if sheet_name != 'Achados']
+    if not abas:
+        return ['Nenhuma aba de verificações foi encontrada.']
+
+    # Sem a data da verificação a aba não pode ser tratada. As demais colunas precisam existir em ao menos uma
+    # aba (abas sem 'Data Consulta' já são ignoradas no tratamento)
+    problemas = []
+    for sheet_name in abas:
+        problemas += colunas_faltantes(sheet_name, cabecalhos[sheet_name], ['Data da Verificação'])
+
+    colunas = {coluna for sheet_name in abas for coluna in cabecalhos[sheet_name]}
+    faltantes = [coluna for coluna in ['Data Consulta', 'Protocolo', 'Responsável'] if coluna not in colunas]
+    if faltantes:
+        problemas.append(f'Nenhuma aba tem as colunas {", ".join(repr(coluna) for coluna in faltantes)}.')
+
+    return problemas
+
+
 def verificar_arquivo(file):
-    try:
-        # Tente carregar o arquivo em um DataFrame
-        df = pd.read_excel(file)
-        # Verifique se o DataFrame contém colunas esperadas, por exemplo:
-        colunas_esperadas = ['Data da Verificação', 'Protocolo', 'Achados']  # Atualize com suas colunas esperadas
-        if all(coluna in df.columns for coluna in colunas_esperadas):
-            return True, df
-        else:
-            return False, None
-    except Exception as e:
-        return False, None
+    '''Valida o upload lendo só os cabeçalhos das abas (sem carregar os dados).
+    Retorna a lista de problemas encontrados, vazia se o arquivo estiver no formato esperado'''
+    return validar_planilha(file, verificar_cabecalhos)
     
 
 def show_table(dataframe: pd.DataFrame, anos: None, meses: None, responsaveis: list):
 
     df = dataframe.copy()
 
-    df = df[df['Data da Verificação'].dt.year.isin(anos)]
-    if df.empty:
-        return None
-
-    df = df[df['Data da Verificação'].dt.month.isin(meses)]
+    df = filtrar_periodo(df, 'Data da Verificação', anos, meses)
     if df.empty:
         return None
 
@@ -94,24 +119,15 @@ def show_table(dataframe: pd.DataFrame, anos: None, meses: None, responsaveis: l
 
 def contar_visitas_unicas(dataframe, anos, meses, respons):
 
-    df = dataframe.copy()
+    df = filtrar_dimensoes(dataframe, {'Responsável': respons})
+    if df.empty:
+        return None
 
-    if anos:
-        df = df[df['Data da Verificação'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    if meses:
-        df = df[df['Data da Verificação'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-        
-    if respons:
-        df = df[df['Responsável'].isin(respons)]
-        if df.empty:
-            return None
-        
+    df = filtrar_periodo(df, 'Data da Verificação', anos, meses)
+    if df.empty:
+        return None
 
+        
     # Remover "duplicatas" considerando as colunas especificadas
     registros_unicos = df.drop_duplicates(subset=['Paciente', 'Protocolo', 'Data Consulta', 'Documento']).copy()
 
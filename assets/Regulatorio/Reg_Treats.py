@@ -1,6 +1,20 @@
 import pandas as pd
 import numpy as np
 import holidays
+from leitor_planilhas import adicionar_chaves_calendario, cache_por_conteudo, colunas_faltantes, converter_texto_livre, ler_excel, ordenar_por_data, validar_planilha
+
+
+# Colunas de data usadas no cálculo dos tempos
+DATAS_COLUNAS = [
+    'Data de Solicitação',
+    'Data de Submissão',
+    'Data de Aceite do PP',
+    'Parecer CEP',
+    'Parecer CONEP',
+    'SIV',
+    'ATIVAÇÃO',
+    'Data de Implementação'
+]
 
 
 def calcular_dias_uteis(data_inicial, data_final, feriados):
@@ -10,22 +24,29 @@ def calcular_dias_uteis(data_inicial, data_final, feriados):
     return np.busday_count(data_inicial.date(), data_final.date(), holidays=feriados)
 
 
+def verificar_cabecalhos(cabecalhos):
+    '''Confere se a primeira aba (a lida em `calcular_tempos`) tem as colunas de datas e de identificação do estudo'''
+    if not cabecalhos:
+        return ['A planilha não tem abas.']
+
+    sheet_name, colunas = next(iter(cabecalhos.items()))
+    colunas = [coluna.strip() for coluna in colunas]
+    return colunas_faltantes(sheet_name, colunas, DATAS_COLUNAS + ['Status', 'PI', 'Estudo', 'Patrocinador'])
+
+
+def validar_arquivo(arquivo):
+    '''Valida o upload pelos cabeçalhos, antes do processamento. Retorna a lista de problemas (vazia se estiver tudo certo)'''
+    return validar_planilha(arquivo, verificar_cabecalhos)
+
+
+@cache_por_conteudo(versao='4')
 def calcular_tempos(df):
     '''Esta é a função para carregar a planilha inicial'''
-    df = pd.read_excel(df)
+    df = ler_excel(df)
     df.columns = df.columns.str.strip() # Remover espaços nas colunas
     
     # Identificar intervalo de anos
-    datas_colunas = [
-        'Data de Solicitação',
-        'Data de Submissão',
-        'Data de Aceite do PP',
-        'Parecer CEP',
-        'Parecer CONEP',
-        'SIV',
-        'ATIVAÇÃO',
-        'Data de Implementação'
-    ]
+    datas_colunas = DATAS_COLUNAS
 
     # Garante que são datetime
     try:
@@ -70,8 +91,15 @@ def calcular_tempos(df):
         df[col] = df[col].str.strip()
 
     df = df.dropna(how='any', subset=['Status', 'PI', 'Estudo', 'Patrocinador',])
-    
-    return df
+
+    # Campos de justificativa (texto livre) no tipo de texto do Arrow
+    justificativas = [col for col in df.columns if str(col).lower().startswith('justificativa')]
+    df = converter_texto_livre(df, justificativas)
+
+    # Ano e mês da solicitação, usados nos filtros da página, com os dados ordenados por ela
+    df = adicionar_chaves_calendario(df, ['Data de Solicitação'])
+
+    return ordenar_por_data(df, 'Data de Solicitação')
 
 
 def metricas_card(dataframe):
@@ -1,6 +1,7 @@
 import pandas as pd
 import plotly.express as px
 import assets.Screening.Screening_Treatments as SCR_Treats
+from filtros import FiltroSpec
 
 
 def pie_chart_motivos(dataframe, estudo=None, medico=None, anos=None, meses=None, show_value_label=False):
@@ -10,30 +11,12 @@ def pie_chart_motivos(dataframe, estudo=None, medico=None, anos=None, meses=None
     Dataframe esperado = Compilado_Motivos_Categoria (Screening_Treatments.Compilado_Motivos_Categoria)    
     Retorna uma fig com estes dados.
     '''
-    df = dataframe.copy()
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Estudo': estudo, 'Médico que assinou': medico})
+    if contagens.vazio():
+        return None
 
-    if estudo:
-        df = df[df['Estudo'].isin(estudo)]
-        if df.empty:
-            return None
-        
-    if medico:
-        df = df[df['Médico que assinou'] == medico]
-        if df.empty:
-            return None
-
-    if anos:
-        df = df[df['Data da falha'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    if meses:
-        df = df[df['Data da falha'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
     # Contando os motivos por categoria
-    cat_count = df['Categoria'].value_counts()
+    cat_count = contagens.contar_valores('Categoria')
 
     # Criando o gráfico de rosca/donut com Plotly
     fig = px.pie(names=cat_count.index, values=cat_count.values, hole=0.5,
@@ -64,20 +47,11 @@ def bar_chart_contagem_motivo_estudos(dataframe, anos=None, meses=None):
     Retorna uma fig com estes dados.
     '''
 
-    df = dataframe.copy()
-    df['Data da falha'] = pd.to_datetime(df['Data da falha'], dayfirst=True)
-
-    if anos:
-        df = df[df['Data da falha'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    if meses:
-        df = df[df['Data da falha'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    df = FiltroSpec(anos, meses).aplicar(dataframe, 'Data da falha')
+    if df.empty:
+        return None
 
-    estudo_count = df.groupby('Estudo', observed=False)['Motivo'].count().reset_index()
+    estudo_count = df.groupby('Estudo', observed=True)['Motivo'].count().reset_index()
     estudo_count = estudo_count.sort_values(by='Motivo', ascending=False)
 
 # Criando o gráfico de barras com Plotly Express
@@ -99,29 +73,13 @@ def bar_chart_motivo_em_estudo(dataframe, categoria_especifica=None, anos=None,
     Dataframe esperado = Compilado_Motivos_Categoria (Screening_Treatments.Compilado_Motivos_Categoria)
     Retorna uma fig com estes dados.
     '''
-    # Copiar o dataframe para evitar modificações no original
-    df = dataframe.copy()
+    # Filtrar pela categoria e pelo período
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Categoria': categoria_especifica})
+    if contagens.vazio():
+        return None
 
-    # Filtrar por categoria específico
-    if categoria_especifica:
-        df = df[df['Categoria'] == categoria_especifica]
-        if df.empty:
-            return None
-
-    # Filtrar por anos, se fornecido
-    if anos:
-        df = df[df['Data da falha'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    # Filtrar por meses, se fornecido
-    if meses:
-        df = df[df['Data da falha'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
     # Contar falhas por estudo
-    df_count = df.groupby('Estudo', observed=False).size().reset_index(name='Contagem')
+    df_count = contagens.contar(['Estudo']).reset_index(name='Contagem')
 
     df_count = df_count.sort_values(by='Contagem', ascending=False)
     
@@ -142,25 +100,11 @@ def bar_chart_contagem_categoria_em_estudo(dataframe, estudo_selecionado=None, a
     A galera preferiu este gráfico, de barras.
     Dataframe esperado = Compilado_Motivos_Categoria (Screening_Treatments.Compilado_Motivos_Categoria)
     '''
-    df = dataframe.copy()
-    df['Data da falha'] = pd.to_datetime(df['Data da falha'], dayfirst=True)
-
-    if estudo_selecionado:
-        df = df[df['Estudo'] == estudo_selecionado]
-        if df.empty:
-            return None
-
-    if anos:
-        df = df[df['Data da falha'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    if meses:
-        df = df[df['Data da falha'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Estudo': estudo_selecionado})
+    if contagens.vazio():
+        return None
 
-    contagem = df['Categoria'].value_counts()
+    contagem = contagens.contar_valores('Categoria')
     fig = px.bar(x=contagem.index, y=contagem.values, 
                  labels={'x': 'Categoria', 'y': 'Número de Ocorrências'},
                  color=contagem.index,
@@ -183,27 +127,11 @@ def pie_chart_meta_atingida(dataframe, estudos_tempo_scr=None, anos=None, meses=
     Dataframe esperado = Espera_Total_pct (Screening_Treatments.Espera_Total_pct)    
     Retorna uma fig com estes dados.
     '''
-    df = dataframe.copy()
-    df['Data assinatura'] = pd.to_datetime(df['Data assinatura'], dayfirst=True)
-
-    if estudos_tempo_scr:
-        # Filtrar estudos que possuam o tempo de Scr específico
-        df = df[df['Tempo de SCR (dias)'].isin(estudos_tempo_scr)]
-        if df.empty:
-            return None
-
-    if anos:
-        df = df[df['Data assinatura'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    if meses:
-        df = df[df['Data assinatura'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-
+    df = FiltroSpec(anos, meses, {'Tempo de SCR (dias)': estudos_tempo_scr}).aplicar(dataframe, 'Data assinatura')
+    if df.empty:
+        return None
 
-    df.loc[:,'Meta'] = df.loc[:,'Tempo corrido'].apply(lambda tempo: 'Meta atingida' if tempo <=meta else 'Não atingiram a meta')
+    df = df.assign(Meta=df['Tempo corrido'].apply(lambda tempo: 'Meta atingida' if tempo <=meta else 'Não atingiram a meta'))
     count_meta = df['Meta'].value_counts().reset_index()
     count_meta.columns = ['Meta', 'Quantidade']
     
@@ -233,30 +161,12 @@ def bar_chart_tempo_medio(dataframe, estudos_tempo_scr=None, anos=None, meses=No
     Dataframe esperado = Espera_Total_pct (Screening_Treatments.Espera_Total_pct)
     Retorna a figura (fig) com esses dados.
     '''
-    df = dataframe.copy()
-    df['Data assinatura'] = pd.to_datetime(df['Data assinatura'], dayfirst=True)
-    
-    if estudos_tempo_scr:
-        # Filtrar estudos que possuam o tempo de Scr específico
-        df = df[df['Tempo de SCR (dias)'].isin(estudos_tempo_scr)]
-        if df.empty:
-            return None
-
-    if anos:
-        # Filtrar pelo ano específico
-        df = df[df['Data assinatura'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
-    if meses:
-        # Filtrar pelo ano específico
-        df = df[df['Data assinatura'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-
+    df = FiltroSpec(anos, meses, {'Tempo de SCR (dias)': estudos_tempo_scr}).aplicar(dataframe, 'Data assinatura')
+    if df.empty:
+        return None
 
     # Calcular média e desvio padrão de tempo corrido por estudo
-    df_final = round(df.groupby('Estudo', observed=False)['Tempo corrido'].agg(['mean', 'std']).reset_index(), 0)
+    df_final = round(df.groupby('Estudo', observed=True)['Tempo corrido'].agg(['mean', 'std']).reset_index(), 0)
     df_final = df_final.rename(columns={'mean':'Média', 'std':'Desvio Padrão'})
 
     # Organizar os valores para ficar de forma decrescente (maior-menor)
@@ -306,38 +216,19 @@ def pie_chart_porcentagem_status_pcts(dataframe, estudo=None, anos=None, meses=N
     Retorna a figura (fig) com esses dados.
     '''
 
-    # Copia o dataframe original para não modificar o original
-    df = dataframe.copy()
-
-    if 'Data limite - Rando' in df.columns:
-        df = df.rename(columns={'Data limite - Rando': 'Datas'})
+    if 'Data limite - Rando' in dataframe.columns:
+        coluna_data = 'Data limite - Rando'
 
-    elif 'Data assinatura' in df.columns:
-        df = df.rename(columns={'Data assinatura': 'Datas'})
+    elif 'Data assinatura' in dataframe.columns:
+        coluna_data = 'Data assinatura'
 
-    df['Datas'] = pd.to_datetime(df['Datas'])
-    
-    df['Status'] = df['Status'].str.title()
-
-    if estudo:
-        df = df[df['Estudo'] == estudo]
-        if df.empty:
-            return None
-        
-    # Filtra por anos, se especificados
-    if anos:
-        df = df[df['Datas'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-    
-    # Filtra por meses, se especificados
-    if meses:
-        df = df[df['Datas'].dt.month.isin(meses)]
-        if df.empty:
-            return None
+    # Filtra pelo estudo e pelo período no cubo de contagens da coluna de data
+    contagens = SCR_Treats.cubo_contagens(dataframe, coluna_data).recortar(anos, meses, {'Estudo': estudo})
+    if contagens.vazio():
+        return None
 
     # Contagem de pacientes por status ('randomizado' e 'falha')
-    contagem_status = df['Status'].value_counts()
+    contagem_status = contagens.contar_valores('Status')
     
     # Verifica se há 'randomizado' e 'falha' na contagem
     if 'Randomizado' not in contagem_status.index:
@@ -387,49 +278,32 @@ def line_chart_assinaturas_randomizados_por_mes(dataframe, estudos=None, meses=N
     Retorna a figura (fig) com esses dados.
     '''
 
-    df = dataframe.copy()
-
-
     tcle_principal = False
     pre_tcle = False
+    coluna_data = None
 
-    if 'Data limite - Rando' in df.columns:
-        df = df.rename(columns={'Data limite - Rando': 'Datas'})
+    if 'Data limite - Rando' in dataframe.columns:
+        coluna_data = 'Data limite - Rando'
         tcle_principal = True
 
-    elif 'Data pré-TCLE' in df.columns:
-        df = df.rename(columns={'Data pré-TCLE': 'Datas'})
+    elif 'Data pré-TCLE' in dataframe.columns:
+        coluna_data = 'Data pré-TCLE'
         pre_tcle = True
 
-    df['Status'] = df['Status'].str.title()
-    df['Datas'] = pd.to_datetime(df['Datas'], dayfirst=True)
+    if not coluna_data:
+        return None, None
 
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None, None
-        
-    if meses:
-        df = df[df['Datas'].dt.month.isin(meses)]
-        if df.empty:
-            return None, None
-        
-    if anos:
-        df = df[df['Datas'].dt.year.isin(anos)]
-        if df.empty:
-            return None, None
+    contagens = SCR_Treats.cubo_contagens(dataframe, coluna_data).recortar(anos, meses, {'Estudo': estudos})
+    if contagens.vazio():
+        return None, None
 
     if tcle_principal:
-        df['Randomizado'] = df['Status'].apply(lambda status: status == 'Randomizado')
-    
-        # Agrupar por mês e contar o número de assinaturas e randomizados por mês
-        df_agregado = df.resample('ME', on='Datas').agg({
-            'Status': 'size',         # Conta o número de eventos por mês (assinaturas)
-            'Randomizado': 'sum'         # Soma dos valores booleanos, contando quantos são True (randomizados)
-        }).reset_index()
+        # Contar o número de assinaturas e randomizados por mês
+        assinaturas = contagens.por_mes()
+        randomizados = contagens.recortar(selecoes={'Status': 'Randomizado'}).por_mes().reindex(assinaturas.index, fill_value=0)
+        df_agregado = pd.DataFrame({'Datas': assinaturas.index, 'Assinaturas': assinaturas.to_numpy(), 'Randomizados': randomizados.to_numpy()})
 
         df_agregado['Mês'] = df_agregado['Datas'].dt.strftime('%b')
-        df_agregado = df_agregado.rename(columns={'Status':'Assinaturas', 'Randomizado':'Randomizados'})
 
         labels = {'value':'Quantidade', 'Mês': 'Mês', 'variable': 'Variável'}
         fig = px.line(df_agregado, x='Mês', y=['Randomizados', 'Assinaturas'],
@@ -450,16 +324,12 @@ def line_chart_assinaturas_randomizados_por_mes(dataframe, estudos=None, meses=N
 
 
     elif pre_tcle:
-        df['Segue Tcle Principal'] = df['Status'].apply(lambda status: status == 'Segue Tcle Principal')
-
-        # Agrupar por mês e contar o número de assinaturas e randomizados por mês
-        df_agregado = df.resample('ME', on='Datas').agg({
-            'Status': 'size',         # Conta o número de eventos por mês (assinaturas)
-            'Segue Tcle Principal': 'sum'         # Soma dos valores booleanos, contando quantos são True (randomizados)
-        }).reset_index()
+        # Contar o número de assinaturas e dos que seguiram para o TCLE principal por mês
+        assinaturas = contagens.por_mes()
+        seguiram = contagens.recortar(selecoes={'Status': 'Segue Tcle Principal'}).por_mes().reindex(assinaturas.index, fill_value=0)
+        df_agregado = pd.DataFrame({'Datas': assinaturas.index, 'Assinaturas': assinaturas.to_numpy(), 'Seguiram p/ TCLE Principal': seguiram.to_numpy()})
 
         df_agregado['Mês'] = df_agregado['Datas'].dt.strftime('%b')
-        df_agregado = df_agregado.rename(columns={'Status':'Assinaturas', 'Segue Tcle Principal':'Seguiram p/ TCLE Principal'})
 
         labels = {'value':'Quantidade', 'Mês': 'Mês', 'variable': 'Variável'}
         fig = px.line(df_agregado, x='Mês', y=['Seguiram p/ TCLE Principal', 'Assinaturas'],
@@ -487,33 +357,21 @@ def bar_chart_status_estudo(dataframe, meses=None, anos=None):
     Retorna a figura (fig) com esses dados.
     '''    
     
-    df = dataframe.copy()
-
-    if 'Data limite - Rando' in df.columns:
-        df = df.rename(columns={'Data limite - Rando': 'Datas'})
+    if 'Data limite - Rando' in dataframe.columns:
+        coluna_data = 'Data limite - Rando'
         status_order = ['Falha, Andamento, Randomizado']
 
-    elif 'Data assinatura' in df.columns:
-        df = df.rename(columns={'Data assinatura': 'Datas'})
+    elif 'Data assinatura' in dataframe.columns:
+        coluna_data = 'Data assinatura'
         status_order = ['Segue Tcle Principal, Andamento, Falha']
 
-    df['Datas'] = pd.to_datetime(df['Datas'], dayfirst=True)
-
-    df['Status'] = df['Status'].str.title()
+    contagens = SCR_Treats.cubo_contagens(dataframe, coluna_data).recortar(anos, meses)
+    if contagens.vazio():
+        return None
 
-    if meses:
-        df = df[df['Datas'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Datas'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    df_grouped = df.groupby(['Estudo', 'Status'], observed=False).size().reset_index(name='Contagem')
+    df_grouped = contagens.contar(['Estudo', 'Status']).reset_index(name='Contagem')
 
-    contagem_total = df_grouped.groupby('Estudo', observed=False)['Contagem'].sum().reset_index(name='Contagem Total')
+    contagem_total = df_grouped.groupby('Estudo', observed=True)['Contagem'].sum().reset_index(name='Contagem Total')
 
     df_grouped = pd.merge(df_grouped, contagem_total, on='Estudo')
 
@@ -555,36 +413,15 @@ def bar_chart_assinaturas_medicos(dataframe, estudo=None, meses=None, anos=None,
     Retorna a figura (fig) com esses dados.
     ''' 
 
-    df = dataframe.copy()
-
-    if 'Data assinatura' in df.columns:
-        df = df.rename(columns={'Data assinatura': 'Datas'})
-        status_order = ['Falha, Andamento, Randomizado']
-
-    elif 'Data pré-TCLE' in df.columns:
-        df = df.rename(columns={'Data pré-TCLE': 'Datas'})
-        status_order = ['Segue Tcle Principal, Andamento, Falha']
-
-    df['Datas'] = pd.to_datetime(df['Datas'], dayfirst=True)
+    # O TCLE e o pré-TCLE tratados têm a data em 'Data assinatura' (`agrupar_info` renomeia a 'Data pré-TCLE')
+    coluna_data = 'Data assinatura'
+    status_order = ['Falha, Andamento, Randomizado']
 
-    df['Status'] = df['Status'].str.title()
+    contagens = SCR_Treats.cubo_contagens(dataframe, coluna_data).recortar(anos, meses, {'Estudo': estudo})
+    if contagens.vazio():
+        return None
 
-    if estudo:
-        df = df[df['Estudo'] == estudo]
-        if df.empty:
-            return None
-    
-    if meses:
-        df = df[df['Datas'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Datas'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-        
-    df_grouped = df.groupby(['Médico que assinou'], observed=False)['Estudo'].size().reset_index(name='Contagem')
+    df_grouped = contagens.contar(['Médico que assinou']).reset_index(name='Contagem')
     df_grouped = df_grouped.sort_values(by='Contagem', ascending=False)
 
 
@@ -608,39 +445,23 @@ def bar_chart_assinaturas_medicos_estudo_status(dataframe, estudos=None, meses=N
     Retorna a figura (fig) com esses dados.
     '''    
 
-    df = dataframe.copy()
-
-    if 'Data limite - Rando' in df.columns:
-        df = df.rename(columns={'Data limite - Rando': 'Datas'})
+    if 'Data limite - Rando' in dataframe.columns:
+        coluna_data = 'Data limite - Rando'
         status_order = ['Falha', 'Randomizado', 'Andamento']
 
-    elif 'Data assinatura' in df.columns:
-        df = df.rename(columns={'Data assinatura': 'Datas'})
+    elif 'Data assinatura' in dataframe.columns:
+        coluna_data = 'Data assinatura'
         status_order = ['Falha', 'Segue Tcle Principal', 'Andamento']
 
-
-    if estudos:
-        df = df[df['Estudo'].isin(estudos)]
-        if df.empty:
-            return None
-        
-    
-    df['Datas'] = pd.to_datetime(df['Datas'], dayfirst=True)
-    if meses:
-        df = df[df['Datas'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Datas'].dt.year.isin(anos)]
-        if df.empty:
-            return None
+    contagens = SCR_Treats.cubo_contagens(dataframe, coluna_data).recortar(anos, meses, {'Estudo': estudos})
+    if contagens.vazio():
+        return None
 
     # Agrupar por Médico e Status e contar as ocorrências
-    contagem_status = df.groupby(['Médico que assinou', 'Status'], observed=False).size().reset_index(name='Contagem')
+    contagem_status = contagens.contar(['Médico que assinou', 'Status']).reset_index(name='Contagem')
 
     # Calcular a contagem total por médico
-    contagem_total = contagem_status.groupby('Médico que assinou', observed=False)['Contagem'].sum().reset_index(name='Contagem Total')
+    contagem_total = contagem_status.groupby('Médico que assinou', observed=True)['Contagem'].sum().reset_index(name='Contagem Total')
 
     # Mesclar a contagem total de volta ao DataFrame original
     contagem_status = pd.merge(contagem_status, contagem_total, on='Médico que assinou')
@@ -666,24 +487,11 @@ def bar_chart_falha_estudo_medico(dataframe, medico, meses=None, anos=None, larg
     Dataframe esperado = Compilado_Motivos_Categoria (Screening_Treatments.Compilado_Motivos_Categoria)    
     Retorna uma fig com estes dados.
     '''
-    df = dataframe.copy()
-
-    df = df[df['Médico que assinou'] == medico]
-    if df.empty:
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Médico que assinou': medico})
+    if contagens.vazio():
         return None
-    
-    if meses:
-        df = df[df['Data da falha'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
-    if anos:
-        df = df[df['Data da falha'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-
 
-    estudo_count = df['Estudo'].value_counts().reset_index()
+    estudo_count = contagens.contar_valores('Estudo').reset_index()
     estudo_count.columns = ['Estudo', 'Contagem']
 
     fig = px.bar(estudo_count, x='Estudo', y='Contagem', 
@@ -704,21 +512,11 @@ def relatorio_randomizados_do_mes(dataframe, df_pacientes, meses, anos, download
     Dataframe esperado =  TCLE_agrupado (Screening_Treatments.TCLE_agrupado).\n
     Retorna a figura (fig) com esses dados (para exibição) e o PGN temporário para download.
     '''
-    df = dataframe.copy()
-
-    df = df[df['Status'] == 'Randomizado'][['Estudo','Data da falha']]
-
-    df = df.rename(columns={'Data da falha':'Data da Randomização'})
-    
-    df = df[df['Data da Randomização'].dt.year.isin(anos)]
-    if df.empty:
-        return None
-    
-    df = df[df['Data da Randomização'].dt.month.isin(meses)]
-    if df.empty:
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Status': 'Randomizado'})
+    if contagens.vazio():
         return None
 
-    contagem_estudos = df['Estudo'].value_counts().reset_index()
+    contagem_estudos = contagens.contar_valores('Estudo').reset_index()
     contagem_estudos.columns = ['Estudo', 'Contagem']
 
     total_contagem = contagem_estudos['Contagem'].sum()
@@ -803,33 +601,19 @@ def relatorio_randomizados_do_mes(dataframe, df_pacientes, meses, anos, download
     
 
 def panorama_randomizados_do_mes(dataframe: pd.DataFrame, meses: None, anos: None):
-    df = dataframe.copy()
-
-    df = df[df['Status'] == 'Randomizado'][['Estudo','Data da falha']]
-    df = df.rename(columns={'Data da falha':'Data da Randomização'})
+    contagens = SCR_Treats.cubo_contagens(dataframe, 'Data da falha').recortar(anos, meses, {'Status': 'Randomizado'})
+    if contagens.vazio():
+        return None
 
-    df['Mes'] = df['Data da Randomização'].dt.month_name()
-    
-    if anos:
-        df = df[df['Data da Randomização'].dt.year.isin(anos)]
-        if df.empty:
-            return None
-    
-    if meses:
-        df = df[df['Data da Randomização'].dt.month.isin(meses)]
-        if df.empty:
-            return None
-    
     ordem_meses = [
         'January', 'February', 'March', 'April', 'May', 'June',
         'July', 'August', 'September', 'October', 'November', 'December'
     ]
 
-    # Converte a coluna 'Mes' em uma categoria com a ordem definida
-    df['Mes'] = pd.Categorical(df['Mes'], categories=ordem_meses, ordered=True)
-
-    # Agrupa e conta os meses
-    new_df = df.groupby('Mes', observed=False).size().reset_index(name='Randomizados')
+    # Conta os meses (todos, na ordem definida)
+    randomizados = contagens.contar(['Mês']).reindex(range(1, 13), fill_value=0)
+    new_df = pd.DataFrame({'Mes': pd.Categorical(ordem_meses, categories=ordem_meses, ordered=True),
+                           'Randomizados': randomizados.to_numpy(dtype='int64')})
     soma = new_df['Randomizados'].sum()
 
     fig = px.line(data_frame=new_df, x='Mes', y='Randomizados', text='Randomizados',
@@ -861,6 +645,9 @@ def panorama_randomizados_do_mes(dataframe: pd.DataFrame, meses: None, anos: Non
 
 
 def bar_chart_acompanhamento_completo(dados, anos, meses):
+    # Só os status que aparecem viram colunas (os meses, categóricos, continuam todos)
+    dados = dados.astype({'Status': object})
+
     # Agrupar os dados de forma que cada ano e mês tenha suas contagens de status separadas
     dados_pivotados = dados.pivot_table(index='Mes', columns=['Ano TCLE', 'Status'], values='Contagem', fill_value=0, observed=False)
 
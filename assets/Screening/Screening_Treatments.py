@@ -1,6 +1,45 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
+import filtros
 from progress_bar import ProgressBar
+from leitor_planilhas import ATRIBUTO_ORDEM_DATA, LIMITE_LEITURA_EM_BLOCOS, adicionar_chaves_calendario, cache_por_aba, cache_por_conteudo, chave_ano, chave_mes, colunas_calendario, colunas_faltantes, concatenar_blocos, converter_texto_livre, digest_arquivo, ler_abas_em_blocos, ler_abas_projetadas, linhas_do_periodo, ordenar_por_data, tratar_em_paralelo, validar_planilha
+
+
+# Colunas usadas por `gerar_mot_cat` e `agrupar_info` nas abas de TCLE/Pré-TCLE/SCREENING.
+# As demais colunas (anotações) não são lidas do Excel
+COLUNAS_TCLE = ['Médico que assinou', 'Motivo', 'Categoria', 'Estudo', 'Onco/multi', 'Status', 'Data TCLE', 'Data pré-TCLE',
+                'Data falha/rando', 'Data real falha/rando', 'Data da falha', 'Tempo de SCR (dias)']
+
+# Dimensões guardadas como categóricas (os filtros e agrupamentos dos gráficos usam os códigos inteiros) e a caixa
+# em que o texto de cada uma é padronizado na leitura. Os gráficos comparam direto com os valores padronizados
+CAIXA_DIMENSOES = {
+    'Estudo': 'upper',
+    'Status': 'title',
+    'Médico que assinou': 'title',
+    'Onco/multi': 'title',
+    'Categoria': None,
+    'Processo': None,
+    'fonte': None,
+}
+
+# Colunas de texto livre, guardadas no tipo de texto do Arrow (`TIPO_TEXTO_LIVRE`)
+COLUNAS_TEXTO_LIVRE = ['Motivo']
+
+# Colunas de data usadas nos filtros de ano e mês, com as chaves de calendário criadas na leitura
+COLUNAS_DATA = ['Data assinatura', 'Data da falha', 'Data limite - Rando']
+
+# Data principal dos filtros de período de cada dataframe: a união dos arquivos fica ordenada por ela
+COLUNA_ORDEM = {'mot_cat': 'Data da falha', 'tcle': 'Data assinatura', 'pre_tcle': 'Data assinatura'}
+
+# Dimensões dos filtros dos gráficos, com índice de bitmaps (`filtros.indexar`)
+DIMENSOES_FILTRO = ['Estudo', 'Médico que assinou', 'Categoria', 'Status']
+
+# Dimensões dos cubos de contagem (`filtros.construir_cubos`), um cubo por coluna de `COLUNAS_DATA`
+DIMENSOES_CUBO = ['Estudo', 'Status', 'Categoria', 'Médico que assinou', 'Processo', 'Onco/multi']
+
+# Eventos da tabela de pacientes do TCLE (`EventosPacientes`) e a coluna com a data de cada um
+EVENTOS_PACIENTE = {'Assinatura': 'Data assinatura', 'Desfecho': 'Data da falha'}
 
 
 def gerar_mot_cat(sheet_df, nome_dt_falha):
@@ -27,10 +66,7 @@ def gerar_mot_cat(sheet_df, nome_dt_falha):
             mot_cat['Data da falha'] = pd.to_datetime(mot_cat['Data da falha'], errors='coerce')
             mot_cat['Data assinatura'] = pd.to_datetime(mot_cat['Data assinatura'], errors='coerce')
 
-            mot_cat['Médico que assinou'] = mot_cat['Médico que assinou'].str.title()
-            mot_cat['Estudo'] = mot_cat['Estudo'].str.upper()
-
-            return mot_cat
+            return adicionar_chaves_calendario(padronizar_dimensoes(mot_cat), COLUNAS_DATA)
         except Exception as e:
             st.error('Erro ao agrupar os dados de falha. Verifique se o arquivo enviado está correto.')
             print(f'[ERRO gerar_mot_cat] - {e}')
@@ -62,8 +98,7 @@ def agrupar_info(sheet_df, nome_dt_falha):
 
         tcle_agrupado['Médico que assinou'] = tcle_agrupado['Médico que assinou'].fillna('Não especificado')
 
-        tcle_agrupado['Médico que assinou'] = tcle_agrupado['Médico que assinou'].str.title()
-        tcle_agrupado['Estudo'] = tcle_agrupado['Estudo'].str.upper()
+        tcle_agrupado = padronizar_dimensoes(tcle_agrupado)
 
 
         cols_to_datetime = [nome_tcle_ou_pre, nome_dt_falha]
@@ -75,6 +110,7 @@ def agrupar_info(sheet_df, nome_dt_falha):
         else:
             tcle_agrupado = tcle_agrupado.rename(columns={nome_tcle_ou_pre: 'Data assinatura'})
 
+        tcle_agrupado = adicionar_chaves_calendario(tcle_agrupado, COLUNAS_DATA)
         
         return nome_tcle_ou_pre, tcle_agrupado
     
@@ -84,6 +120,40 @@ def agrupar_info(sheet_df, nome_dt_falha):
         return None, None
 
 
+def padronizar_dimensoes(df):
+    '''Padroniza a caixa do texto das dimensões (`CAIXA_DIMENSOES`) e as converte para categóricas.
+    As colunas de texto livre (`COLUNAS_TEXTO_LIVRE`) são convertidas para o tipo de texto do Arrow'''
+    for coluna, caixa in CAIXA_DIMENSOES.items():
+        if coluna not in df.columns:
+            continue
+        if caixa and pd.api.types.is_string_dtype(df[coluna].dtype):
+            df[coluna] = getattr(df[coluna].str, caixa)()
+        elif df[coluna].isna().all():
+            # Coluna sem nenhum valor na planilha: o pandas a lê como float, então vira texto antes da categórica
+            df[coluna] = df[coluna].astype(object)
+        df[coluna] = df[coluna].astype('category')
+
+    return converter_texto_livre(df, COLUNAS_TEXTO_LIVRE)
+
+
+def categorizar_dimensoes(df):
+    '''Depois de um `pd.concat`, as dimensões com categorias diferentes em cada parte viram texto: volta a convertê-las'''
+    for coluna in CAIXA_DIMENSOES:
+        if coluna in df.columns:
+            df[coluna] = df[coluna].astype('category')
+
+    return df
+
+
+def contar_valores(serie):
+    '''`value_counts` só com os valores que aparecem. Em colunas categóricas o pandas também conta (com zero)
+    as categorias sem nenhuma linha, o que criaria barras e fatias vazias nos gráficos'''
+    contagem = serie.value_counts()
+    contagem = contagem[contagem > 0]
+    contagem.index = contagem.index.astype(object)
+    return contagem
+
+
 def tratamento_pacientes_sheet(sheet_df):
     df_pacientes_sheet = sheet_df.copy()
 
@@ -96,40 +166,307 @@ def tratamento_pacientes_sheet(sheet_df):
     return df_pacientes_sheet[['Nome', 'Ano']]
 
 
+def verificar_cabecalhos(cabecalhos):
+    '''Confere se as abas de TCLE/SCREENING e de pacientes têm as colunas usadas no tratamento'''
+    problemas = []
+
+    abas_tcle = [sheet_name for sheet_name in cabecalhos if 'TCLE' in sheet_name or 'SCREENING' in sheet_name]
+    if not abas_tcle:
+        problemas.append('Nenhuma aba de TCLE ou SCREENING foi encontrada.')
+
+    for sheet_name in abas_tcle:
+        colunas = cabecalhos[sheet_name]
+        if 'Data TCLE' in colunas:
+            falha_rando_nome = 'Data falha/rando' if 'TCLE' in sheet_name else 'Data real falha/rando'
+            esperadas = ['Estudo', 'Status', 'Médico que assinou', 'Motivo', 'Categoria', 'Data TCLE', falha_rando_nome, 'Tempo de SCR (dias)']
+        else:
+            esperadas = ['Estudo', 'Status', 'Médico que assinou', 'Motivo', 'Categoria', 'Data pré-TCLE', 'Data da falha']
+        problemas += colunas_faltantes(sheet_name, colunas, esperadas)
+
+    for sheet_name, colunas in cabecalhos.items():
+        if 'Pacientes' in sheet_name:
+            if not any('Nome' in coluna for coluna in colunas):
+                problemas.append(f'Aba "{sheet_name}": nenhuma coluna de nome do paciente foi encontrada.')
+            problemas += colunas_faltantes(sheet_name, colunas, ['Ano'])
+
+    return problemas
+
+
+def validar_arquivo(arquivo):
+    '''Valida o upload pelos cabeçalhos, antes do processamento. Retorna a lista de problemas (vazia se estiver tudo certo)'''
+    return validar_planilha(arquivo, verificar_cabecalhos)
+
+
+def aba_necessaria(sheet_name):
+    return 'TCLE' in sheet_name or 'SCREENING' in sheet_name or 'Pacientes' in sheet_name
+
+
+def coluna_necessaria(sheet_name, coluna):
+    if ('TCLE' in sheet_name or 'SCREENING' in sheet_name) and coluna in COLUNAS_TCLE:
+        return True
+
+    # Aba de pacientes: a primeira coluna com 'Nome' é renomeada em `tratamento_pacientes_sheet`
+    return 'Pacientes' in sheet_name and (coluna == 'Ano' or 'Nome' in str(coluna))
+
+
+@cache_por_conteudo(versao='5')
+def tratar_planilha(arquivo):
+    '''Lê o Excel de screening e gera os dataframes tratados (sem a coluna `fonte`).
+    Só as abas e colunas usadas no tratamento são lidas do arquivo. Arquivos grandes são lidos e tratados
+    em blocos de linhas: as abas brutas nunca ficam inteiras na memória, só o resultado tratado e um bloco
+    (os blocos tratados são juntados coluna a coluna, sem uma segunda cópia do resultado).
+    O resultado fica em cache pelo conteúdo do arquivo, então o mesmo upload não é lido duas vezes.'''
+    if arquivo.getbuffer().nbytes > LIMITE_LEITURA_EM_BLOCOS:
+        abas = ler_abas_em_blocos(arquivo, selecionar_aba=aba_necessaria, selecionar_coluna=coluna_necessaria)
+        # Os blocos não passam pelo cache de abas: cada bloco ocuparia uma entrada
+        tratar = tratar_aba.__wrapped__
+        juntar = concatenar_blocos
+    else:
+        abas = ler_abas_projetadas(arquivo, selecionar_aba=aba_necessaria, selecionar_coluna=coluna_necessaria).items()
+        # Abas que não mudaram desde o último upload vêm direto do cache (e não podem ser desmontadas)
+        tratar = tratar_aba
+        juntar = lambda dfs: pd.concat(dfs, ignore_index=True)
+
+    partes = {'mot_cat': [], 'tcle': [], 'pre_tcle': [], 'pcts': []}
+    for sheet_name, sheet_df in abas:
+        for chave, df in tratar(sheet_name, sheet_df).items():
+            partes[chave].append(df)
+
+    dados = dados_vazios()
+    for chave, dfs in partes.items():
+        if dfs:
+            _definir_df(dados, chave, categorizar_dimensoes(juntar(dfs)))
+
+    return dados
+
+
+@cache_por_aba(versao='4')
+def tratar_aba(sheet_name, sheet_df):
+    '''Trata uma aba da planilha de screening. Retorna um dicionário só com os dataframes que a aba gera
+    (`mot_cat` e `tcle` ou `pre_tcle` para as abas de TCLE/SCREENING, `pcts` para a de pacientes)'''
+    dados_aba = {}
+    falha_rando_nome = 'Data falha/rando' if 'TCLE' in sheet_name else 'Data real falha/rando'
+
+    if 'TCLE' in sheet_name or 'SCREENING' in sheet_name:
+        mot_cat = gerar_mot_cat(sheet_df, falha_rando_nome)
+        tcle_ou_pre_tcle, dados_agrupados = agrupar_info(sheet_df, falha_rando_nome)
+
+        if mot_cat is None or dados_agrupados is None:
+            raise ValueError(f'A aba "{sheet_name}" não está no formato esperado')
+
+        dados_aba['mot_cat'] = mot_cat
+        if tcle_ou_pre_tcle == 'Data TCLE':
+            dados_aba['tcle'] = dados_agrupados
+        else:
+            dados_aba['pre_tcle'] = dados_agrupados
+
+    if 'Pacientes' in sheet_name:
+        dados_aba['pcts'] = tratamento_pacientes_sheet(sheet_df)
+
+    return dados_aba
+
+
+def marcar_fonte(dados, nome_arquivo):
+    '''Retorna os dataframes tratados de um arquivo com a coluna `fonte` (nome do upload)'''
+    # A fonte depende do nome do upload, não do conteúdo, por isso é adicionada fora do cache.
+    # Os dados tratados são compartilhados entre as sessões (`registro_dados`), então são copiados, nunca alterados
+    marcados = dados_vazios()
+    for chave, df in _achatar_dfs(dados).items():
+        if not df.columns.empty:
+            df = df.assign(fonte=pd.Categorical([nome_arquivo] * len(df)))
+        _definir_df(marcados, chave, df)
+
+    return marcados
+
+
+def adicionar_dados_arquivo(dados, nome_arquivo, dicionario):
+    '''Adiciona a coluna `fonte` aos dados tratados de um arquivo e os concatena ao `dicionario`'''
+    dados = marcar_fonte(dados, nome_arquivo)
+
+    dicionario['mot_cat'] = pd.concat([dicionario['mot_cat'], dados['mot_cat']], ignore_index=True)
+    dicionario['tcles']['tcle'] = pd.concat([dicionario['tcles']['tcle'], dados['tcles']['tcle']], ignore_index=True)
+    dicionario['tcles']['pre_tcle'] = pd.concat([dicionario['tcles']['pre_tcle'], dados['tcles']['pre_tcle']], ignore_index=True)
+    dicionario['pcts'] = pd.concat([dicionario['pcts'], dados['pcts']], ignore_index=True)
+
+    return dicionario
+
+
 def tratamento_dados(arquivo, dicionario):
     barra = ProgressBar()
     barra.iniciar_carregamento(progress_text=f'Processando {arquivo.name}...')
 
-    df = pd.read_excel(arquivo, sheet_name=None)
+    dicionario = adicionar_dados_arquivo(tratar_planilha(arquivo), arquivo.name, dicionario)
 
-    for sheet_name, sheet_df in df.items():
-        falha_rando_nome = 'Data falha/rando' if 'TCLE' in sheet_name else 'Data real falha/rando'
+    barra.finalizar_carregamento(progress_text=f'{arquivo.name} finalizado!', emoji='🎉')
 
-        if 'TCLE' in sheet_name or 'SCREENING' in sheet_name:
-            mot_cat = gerar_mot_cat(sheet_df, falha_rando_nome)
-            tcle_ou_pre_tcle, dados_agrupados = agrupar_info(sheet_df, falha_rando_nome)
+    return dicionario
 
-            mot_cat['fonte'] = arquivo.name
-            dados_agrupados['fonte'] = arquivo.name
 
-            dicionario['mot_cat'] = pd.concat([dicionario['mot_cat'], mot_cat], ignore_index=True)
-            if tcle_ou_pre_tcle == 'Data TCLE':
-                dicionario['tcles']['tcle'] = pd.concat([dicionario['tcles']['tcle'], dados_agrupados], ignore_index=True)
-            else:
-                dicionario['tcles']['pre_tcle'] = pd.concat([dicionario['tcles']['pre_tcle'], dados_agrupados], ignore_index=True)
-        
-        if 'Pacientes' in sheet_name:
-            pacientes_sheet = tratamento_pacientes_sheet(sheet_df)
-            pacientes_sheet['fonte'] = arquivo.name
-            dicionario['pcts'] = pd.concat([dicionario['pcts'], pacientes_sheet], ignore_index=True)
+def tratamento_dados_paralelo(arquivos):
+    """
+    Trata vários uploads de screening ao mesmo tempo (um processo por arquivo).
 
-    barra.finalizar_carregamento(progress_text=f'{arquivo.name} finalizado!', emoji='🎉')
+    Args:
+        arquivos (list): Uploads do `st.file_uploader`.
 
-    return dicionario
+    Returns:
+        Iterador de tuplas (arquivo, dicionário de dataframes sem a coluna `fonte`), na ordem em que cada arquivo
+        termina de ser processado, para que os dados possam ser juntados enquanto os outros ainda são lidos.
+    """
+    # Os arquivos começam a ser processados já aqui, enquanto a barra de progresso é exibida
+    resultados = tratar_em_paralelo(tratar_planilha, arquivos)
+
+    barra = ProgressBar()
+    barra.iniciar_carregamento(progress_text=f'Processando {", ".join(arquivo.name for arquivo in arquivos)}...')
+
+    for arquivo, dados in resultados:
+        yield arquivo, dados
+
+    barra.finalizar_carregamento(progress_text='Arquivos finalizados!', emoji='🎉')
+
+
+def identificar_uploads(arquivos):
+    """
+    Identifica os uploads pelo conteúdo (SHA-256 calculado direto no buffer do upload, sem copiar os bytes).
+
+    Se dois uploads têm o mesmo nome, vale o último (a planilha corrigida enviada de novo). Se têm o mesmo
+    conteúdo com nomes diferentes (ex.: "PLAN_SCR_2024 (1).xlsx"), só o primeiro é usado, para não contar os dados duas vezes.
+
+    Args:
+        arquivos (list): Uploads do `st.file_uploader`.
+
+    Returns:
+        tuple: Dicionário {digest: upload} com os uploads que serão usados e lista de tuplas
+        (upload ignorado, upload com o mesmo conteúdo).
+    """
+    por_nome = {arquivo.name: arquivo for arquivo in arquivos}
+
+    uploads = {}
+    repetidos = []
+    for arquivo in por_nome.values():
+        digest = digest_arquivo(arquivo)
+        if digest in uploads:
+            repetidos.append((arquivo, uploads[digest]))
+        else:
+            uploads[digest] = arquivo
+
+    return uploads, repetidos
+
+
+class DadosScreening():
+    '''
+    Dados de screening guardados por arquivo (uma partição por upload, no formato de `tratar_planilha`),
+    identificados pelo digest do conteúdo.
+
+    Adicionar ou remover um arquivo mexe só na partição dele. A união de todos os arquivos (o dicionário
+    usado pelos gráficos) é montada na primeira vez em que é pedida e fica guardada até a próxima mudança.
+
+    As partições são os próprios dados do registro compartilhado entre as sessões (`registro_dados`):
+    a coluna `fonte`, que depende do nome do upload, só é criada na união.
+    '''
+    def __init__(self):
+        self.particoes = {}
+        self.nomes = {}
+        self._uniao = None
+
+
+    @classmethod
+    def a_partir_da_uniao(cls, dfs):
+        '''Separa um dicionário já unido (ex.: reaberto de um snapshot) em partições, pela coluna `fonte`.
+        Sem o conteúdo dos arquivos, as partições ficam identificadas pelo nome'''
+        dados_screening = cls()
+        for chave, df in _achatar_dfs(dfs).items():
+            if df.empty:
+                continue
+            for fonte, df_fonte in df.groupby('fonte', sort=False, observed=True):
+                if fonte not in dados_screening:
+                    dados_screening.adicionar(fonte, dados_vazios(), fonte)
+                _definir_df(dados_screening.particoes[fonte], chave, df_fonte.reset_index(drop=True))
+
+        return dados_screening
+
+
+    def __contains__(self, digest):
+        return digest in self.particoes
+
+
+    def digests(self):
+        '''Identificadores dos arquivos, na ordem em que foram adicionados'''
+        return list(self.particoes)
+
+
+    def adicionar(self, digest, dados, nome_arquivo):
+        self.particoes[digest] = dados
+        self.nomes[digest] = nome_arquivo
+        self._uniao = None
+
+
+    def remover(self, digest):
+        if self.particoes.pop(digest, None) is not None:
+            del self.nomes[digest]
+            self._uniao = None
+
+
+    def uniao(self):
+        '''Dicionário com os dataframes de todos os arquivos concatenados (calculado só quando algo mudou)'''
+        if self._uniao is None:
+            uniao = dados_vazios()
+            for chave in _achatar_dfs(uniao):
+                partes = [(self.nomes[digest], _achatar_dfs(dados)[chave]) for digest, dados in self.particoes.items()]
+                partes = [(nome, df) for nome, df in partes if not df.empty]
+                if partes:
+                    df_uniao = pd.concat([df for _, df in partes], ignore_index=True)
+                    df_uniao['fonte'] = pd.Categorical(np.repeat([nome for nome, _ in partes], [len(df) for _, df in partes]))
+                    df_uniao = categorizar_dimensoes(df_uniao)
+                    if chave in COLUNA_ORDEM:
+                        df_uniao = ordenar_por_data(df_uniao, COLUNA_ORDEM[chave])
+                        df_uniao = filtros.construir_cubos(df_uniao, COLUNAS_DATA, DIMENSOES_CUBO)
+                        filtros.guardar_derivado(df_uniao, 'relatorio_mensal', RelatorioMensal(df_uniao))
+                    if chave == 'tcle':
+                        filtros.guardar_derivado(df_uniao, 'eventos', EventosPacientes(df_uniao))
+                    _definir_df(uniao, chave, df_uniao)
+
+            # O mesmo paciente pode estar em mais de uma planilha: fica o do primeiro arquivo
+            if not uniao['pcts'].empty:
+                uniao['pcts'] = uniao['pcts'].drop_duplicates(subset=['Nome'], keep='first')
+
+            self._uniao = uniao
+
+        return self._uniao
+
+
+def dados_vazios():
+    return {
+        'mot_cat': pd.DataFrame(),
+        'tcles': {'tcle': pd.DataFrame(), 'pre_tcle': pd.DataFrame()},
+        'pcts': pd.DataFrame()
+    }
+
+
+def _achatar_dfs(dados):
+    '''Acesso aos quatro dataframes do dicionário de screening por uma chave só'''
+    return {
+        'mot_cat': dados['mot_cat'],
+        'tcle': dados['tcles']['tcle'],
+        'pre_tcle': dados['tcles']['pre_tcle'],
+        'pcts': dados['pcts'],
+    }
+
+
+def _definir_df(dados, chave, df):
+    if chave in ('tcle', 'pre_tcle'):
+        dados['tcles'][chave] = df
+    else:
+        dados[chave] = df
+
+
+def cubo_contagens(dataframe, coluna_data):
+    '''Cubo de contagem do dataframe de screening na coluna de data (criado na união dos arquivos)'''
+    return filtros.cubo_de(dataframe, coluna_data, DIMENSOES_CUBO)
 
 
 def gerar_df_espera_total(df_tcle_agrupado):
-    Espera_total_pct = df_tcle_agrupado[['Data assinatura', 'Data da falha', 'Estudo', 'Tempo de SCR (dias)', 'fonte']]
+    Espera_total_pct = df_tcle_agrupado[['Data assinatura', 'Data da falha', 'Estudo', 'Tempo de SCR (dias)', 'fonte'] + colunas_calendario(['Data assinatura'])]
     Espera_total_pct = Espera_total_pct.dropna(subset=['Data assinatura', 'Data da falha'])
 
     Espera_total_pct['Tempo corrido'] = (Espera_total_pct['Data da falha'] - Espera_total_pct['Data assinatura']).dt.days
@@ -140,48 +477,82 @@ def gerar_df_espera_total(df_tcle_agrupado):
     return Espera_total_pct
 
 
-def get_andamentos(dataframe, anos, meses):
-    df = dataframe.copy()
+class EventosPacientes():
+    '''
+    Tabela longa de eventos dos pacientes do TCLE: uma linha por paciente e evento (`EVENTOS_PACIENTE`), com a
+    data do evento, o estudo, o status e a data de assinatura.
 
-    final_df = df[(df['Data assinatura'].dt.month.isin(meses)) & 
-                  (df['Data assinatura'].dt.year.isin(anos))]
+    Cada tipo de evento é um bloco contínuo da tabela, ordenado pela data do evento: os pacientes de um período
+    saem de uma busca binária nas chaves de calendário (`linhas_do_periodo`), sem copiar nem filtrar o dataframe
+    inteiro. A coluna `Linha` é a posição do paciente no dataframe de origem.
+    '''
+    def __init__(self, df):
+        partes = []
+        for evento, coluna in EVENTOS_PACIENTE.items():
+            parte = pd.DataFrame({
+                'Linha': np.arange(len(df), dtype='int32'),
+                'Evento': evento,
+                'Data do evento': df[coluna].to_numpy(),
+                'Estudo': df['Estudo'].array,
+                'Status': df['Status'].array,
+                'Data assinatura': df['Data assinatura'].to_numpy(),
+            })
+            partes.append(ordenar_por_data(adicionar_chaves_calendario(parte, ['Data do evento']), 'Data do evento'))
 
-    final_df = final_df[final_df['Status'].str.capitalize() == 'Andamento']
-    final_df['Mes TCLE'] = final_df['Data assinatura'].dt.month_name()
-    final_df['Ano TCLE'] = final_df['Data assinatura'].dt.year
+        self.tabela = pd.concat(partes, ignore_index=True)
+        self.tabela['Evento'] = pd.Categorical(self.tabela['Evento'], categories=list(EVENTOS_PACIENTE))
+        # A tabela toda não está ordenada pela data, só cada bloco
+        self.tabela.attrs = {}
 
-    return final_df
+        self.blocos = {}
+        inicio = 0
+        for evento, parte in zip(EVENTOS_PACIENTE, partes):
+            self.blocos[evento] = (inicio, inicio + len(parte))
+            inicio += len(parte)
 
 
-def get_randomizados(dataframe, anos, meses):
-    df = dataframe.copy()
+    def do_periodo(self, evento, status, anos, meses):
+        '''Eventos do tipo no período (pela data do evento), só dos pacientes com o status'''
+        inicio, fim = self.blocos[evento]
+        bloco = self.tabela.iloc[inicio:fim]
+        bloco.attrs = {ATRIBUTO_ORDEM_DATA: 'Data do evento'}
 
-    final_df = df[(df['Data da falha'].dt.month.isin(meses)) &
-                  (df['Data da falha'].dt.year.isin(anos))]
-    
-    final_df = final_df[final_df['Status'].str.capitalize() == 'Randomizado']
-    final_df['Mes TCLE'] = final_df['Data assinatura'].dt.month_name()
-    final_df['Ano TCLE'] = final_df['Data assinatura'].dt.year
+        linhas = linhas_do_periodo(bloco, 'Data do evento', anos, meses)
+        eventos = bloco if linhas is None else bloco.iloc[linhas]
 
-    return final_df
+        return eventos[eventos['Status'] == status]
 
 
-def get_falhas(dataframe, anos, meses):
-    df = dataframe.copy()
+def eventos_pacientes(dataframe):
+    '''Tabela de eventos do dataframe do TCLE (criada na união dos arquivos)'''
+    return filtros.derivado_de(dataframe, 'eventos', EventosPacientes)
+
+
+def _pacientes_do_evento(dataframe, evento, status, anos, meses):
+    '''Linhas do dataframe dos pacientes com o evento no período, com o mês e o ano da assinatura do TCLE'''
+    linhas = np.sort(eventos_pacientes(dataframe).do_periodo(evento, status, anos, meses)['Linha'].to_numpy())
+    final_df = dataframe.iloc[linhas]
+
+    return final_df.assign(**{'Mes TCLE': final_df['Data assinatura'].dt.month_name(),
+                              'Ano TCLE': final_df['Data assinatura'].dt.year})
+
+
+def get_andamentos(dataframe, anos, meses):
+    return _pacientes_do_evento(dataframe, 'Assinatura', 'Andamento', anos, meses)
+
+
+def get_randomizados(dataframe, anos, meses):
+    return _pacientes_do_evento(dataframe, 'Desfecho', 'Randomizado', anos, meses)
 
-    final_df = df[(df['Data da falha'].dt.month.isin(meses)) &
-                  (df['Data da falha'].dt.year.isin(anos))]
-    
-    final_df = final_df[final_df['Status'].str.capitalize() == 'Falha']
-    final_df['Mes TCLE'] = final_df['Data assinatura'].dt.month_name()
-    final_df['Ano TCLE'] = final_df['Data assinatura'].dt.year
 
-    return final_df
+def get_falhas(dataframe, anos, meses):
+    return _pacientes_do_evento(dataframe, 'Desfecho', 'Falha', anos, meses)
 
 
 def gerar_dados_rel_completo(dados_relatorio, anos, meses):
-    '''Essa função gera as contagens a partir do dataframe principal `Dados Relatório` para ser passado aos gráficos'''
-    df = dados_relatorio.copy()
+    '''Essa função gera as contagens a partir do dataframe principal `Dados Relatório` para ser passado aos gráficos.
+    As contagens saem direto da tabela de eventos dos pacientes (`EventosPacientes`)'''
+    eventos = eventos_pacientes(dados_relatorio)
 
     ordem_meses = [
         'January', 'February', 'March', 'April', 'May', 'June',
@@ -190,93 +561,155 @@ def gerar_dados_rel_completo(dados_relatorio, anos, meses):
     
     ordem_meses_invertida = ordem_meses[::-1]
 
+    # Andamentos pela data de assinatura. Com um mês só, também os randomizados e as falhas pela data da falha
     if len(meses) > 1:
-        andamento = get_andamentos(dataframe=df, anos=anos, meses=meses)
-        
-        contagem_final = andamento.groupby(by=['Ano TCLE', 'Mes TCLE', 'Status'], observed=False).size().reset_index(name='Contagem')
-        contagem_final['Mes'] = pd.Categorical(contagem_final['Mes TCLE'], categories=ordem_meses, ordered=True)
-
-        return contagem_final
-        
+        selecoes = [('Assinatura', 'Andamento')]
     else:
-        andamento = get_andamentos(dataframe=df, anos=anos, meses=meses)
-        randomizados = get_randomizados(dataframe=df, anos=anos, meses=meses)
-        falhas = get_falhas(dataframe=df, anos=anos, meses=meses)
-
-        final_df = pd.concat([andamento, randomizados, falhas], ignore_index=True)
+        selecoes = [('Assinatura', 'Andamento'), ('Desfecho', 'Randomizado'), ('Desfecho', 'Falha')]
 
-        contagem_final = final_df.groupby(by=['Ano TCLE', 'Mes TCLE', 'Status'], observed=False).size().reset_index(name='Contagem')
+    final_df = pd.concat([eventos.do_periodo(evento, status, anos, meses) for evento, status in selecoes], ignore_index=True)
+    final_df['Mes TCLE'] = final_df['Data assinatura'].dt.month_name()
+    final_df['Ano TCLE'] = final_df['Data assinatura'].dt.year
 
-        contagem_final['Mes'] = pd.Categorical(contagem_final['Mes TCLE'], categories=ordem_meses_invertida, ordered=True)
+    contagem_final = final_df.groupby(by=['Ano TCLE', 'Mes TCLE', 'Status'], observed=True).size().reset_index(name='Contagem')
+    contagem_final['Mes'] = pd.Categorical(contagem_final['Mes TCLE'], categories=ordem_meses if len(meses) > 1 else ordem_meses_invertida, ordered=True)
 
-        return contagem_final
+    return contagem_final
 
 
 def get_inicio_triagem(dataframe, anos, meses):
-    df = dataframe
-
-    final_df = df[(df['Data assinatura'].dt.month.isin(meses)) & 
-                   (df['Data assinatura'].dt.year.isin(anos))].copy()
-    
-    final_df['Mes'] = final_df['Data assinatura'].dt.month_name()
-    final_df['Ano'] = final_df['Data assinatura'].dt.year
+    contagens = cubo_contagens(dataframe, 'Data assinatura').recortar(anos, meses).contagens
 
     ordem_meses = [
         'January', 'February', 'March', 'April', 'May', 'June',
         'July', 'August', 'September', 'October', 'November', 'December'
     ]
 
-    # Converte a coluna 'Mes' em uma categoria com a ordem definida
-    final_df['Mes'] = pd.Categorical(final_df['Mes'], categories=ordem_meses, ordered=True)
+    # Todos os meses (na ordem) para cada ano com assinaturas. Só contam as linhas com Status
+    datadas = contagens[contagens['Ano'] > 0]
+    anos_assinatura = np.sort(datadas['Ano'].unique()).astype('int32' if len(datadas) == len(contagens) else 'float64')
+    contagem = datadas[datadas['Status'].notna()].groupby(['Mês', 'Ano'])['Contagem'].sum()
 
-    contagem_assinaturas = final_df.groupby(by=['Mes', 'Ano'], observed=False).count()['Status'].reset_index(name='Contagem')
+    indice = pd.MultiIndex.from_product([range(1, 13), anos_assinatura.astype(int)])
+    contagem_assinaturas = pd.DataFrame({
+        'Mes': pd.Categorical(np.repeat(ordem_meses, len(anos_assinatura)), categories=ordem_meses, ordered=True),
+        'Ano': np.tile(anos_assinatura, 12),
+        'Contagem': contagem.reindex(indice, fill_value=0).to_numpy(dtype='int64'),
+    })
 
     return contagem_assinaturas
 
 
 def gerar_dataframes(df_tcle_agrupado):
-    '''Produz os dataframes restantes que são um fragmento do TCLE agrupado'''
+    '''Produz os dataframes restantes que são um fragmento do TCLE agrupado.
+    Eles são calculados uma vez por TCLE agrupado e guardados com ele (não devem ser alterados)'''
+    return filtros.derivado_de(df_tcle_agrupado, 'dataframes', _gerar_dataframes)
 
+
+def _gerar_dataframes(df_tcle_agrupado):
     df_Espera_Total_pcts = gerar_df_espera_total(df_tcle_agrupado)
-    df_Dados_relatorio = df_tcle_agrupado[['Status', 'Estudo', 'Data assinatura', 'Data da falha', 'Data limite - Rando', 'Tempo de SCR (dias)', 'fonte']].copy()
+    df_Dados_relatorio = df_tcle_agrupado[['Status', 'Estudo', 'Data assinatura', 'Data da falha', 'Data limite - Rando', 'Tempo de SCR (dias)', 'fonte'] + colunas_calendario(['Data assinatura', 'Data da falha'])].copy()
+    df_Dados_relatorio = filtros.compartilhar_derivados(df_tcle_agrupado, df_Dados_relatorio)
     
     return df_Espera_Total_pcts, df_Dados_relatorio
 
 
-def gerar_relatorio_mes(df_tcle_ori, df_pre_tcle_ori, df_mot_cat_ori, mes, ano, tipo=None):
+class RelatorioMensal():
+    '''
+    Relatório mensal pré-calculado de um dataframe de screening, para todos os anos, meses e tipos (Onco/multi)
+    de uma vez, logo depois do upload.
+
+    - `status`: uma matriz por coluna de data (falha e assinatura), com uma linha por (Ano, Mês, Tipo) e uma coluna
+      por Status, com o número de pacientes (TCLE e Pré-TCLE).
+    - `categorias`: contagem de falhas por (Ano, Mês, Tipo, Processo, Categoria), pela data da falha (Motivos).
+
+    Trocar o período ou o tipo do relatório só soma as linhas guardadas. Datas vazias ficam no ano e mês 0 e
+    pacientes sem Onco/multi no tipo vazio: entram no relatório sem filtro, como nos dataframes.
+    '''
+    def __init__(self, df):
+        self.tem_tipo = 'Onco/multi' in df.columns
+        tipo = df['Onco/multi'].astype(object).fillna('').to_numpy() if self.tem_tipo else ''
+
+        self.status = {}
+        if 'Status' in df.columns:
+            for coluna_data in ('Data da falha', 'Data assinatura'):
+                if chave_ano(coluna_data) in df.columns:
+                    chaves = pd.DataFrame({'Ano': df[chave_ano(coluna_data)].to_numpy(), 'Mês': df[chave_mes(coluna_data)].to_numpy(),
+                                           'Tipo': tipo, 'Status': df['Status'].astype(object).to_numpy()})
+                    self.status[coluna_data] = (chaves.dropna(subset=['Status'])
+                                                .groupby(['Ano', 'Mês', 'Tipo', 'Status']).size()
+                                                .unstack('Status', fill_value=0))
+
+        self.categorias = None
+        if 'Categoria' in df.columns and 'Processo' in df.columns:
+            chaves = pd.DataFrame({'Ano': df[chave_ano('Data da falha')].to_numpy(), 'Mês': df[chave_mes('Data da falha')].to_numpy(),
+                                   'Tipo': tipo, 'Processo': df['Processo'].array, 'Categoria': df['Categoria'].array})
+            self.categorias = (chaves.groupby(['Ano', 'Mês', 'Tipo', 'Processo', 'Categoria'], observed=True, dropna=False)
+                               .size().reset_index(name='Contagem'))
 
-    df_princ_andamentos = df_tcle_ori[df_tcle_ori['Data assinatura'].dt.year.isin(ano)].copy()
-    df_pre_andamentos = df_pre_tcle_ori[df_pre_tcle_ori['Data assinatura'].dt.year.isin(ano) & df_pre_tcle_ori['Data assinatura'].dt.month.isin(mes)].copy()
 
-    df_tcle = df_tcle_ori[df_tcle_ori['Data da falha'].dt.year.isin(ano) & df_tcle_ori['Data da falha'].dt.month.isin(mes)].copy()
-    df_pre_tcle = df_pre_tcle_ori[df_pre_tcle_ori['Data da falha'].dt.year.isin(ano) & df_pre_tcle_ori['Data da falha'].dt.month.isin(mes)].copy()
-    df_mot_cat = df_mot_cat_ori[df_mot_cat_ori['Data da falha'].dt.year.isin(ano) & df_mot_cat_ori['Data da falha'].dt.month.isin(mes)].copy()
+    def _selecao(self, ano, mes, tipo, anos, meses, tipos):
+        if tipo and not self.tem_tipo:
+            raise KeyError('Onco/multi')
 
-    if tipo:
-        df_tcle = df_tcle[df_tcle['Onco/multi'].str.lower() == tipo.lower()]
-        df_pre_tcle = df_pre_tcle[df_pre_tcle['Onco/multi'].str.lower() == tipo.lower()]
-        df_mot_cat = df_mot_cat[df_mot_cat['Onco/multi'].str.lower() == tipo.lower()]
-        df_princ_andamentos = df_princ_andamentos[df_princ_andamentos['Onco/multi'].str.lower() == tipo.lower()]
-        df_pre_andamentos = df_pre_andamentos[df_pre_andamentos['Onco/multi'].str.lower() == tipo.lower()]
+        # None é o período todo (ex.: os andamentos do ano inteiro). Uma lista vazia não seleciona nada, como o `isin([])`
+        selecao = np.ones(len(anos), dtype=bool)
+        if ano is not None:
+            selecao &= np.isin(anos, ano)
+        if mes is not None:
+            selecao &= np.isin(meses, mes)
+        if tipo:
+            selecao &= tipos == tipo.title()
 
-    # Contagens TCLE
-    num_rando_princ = df_tcle[df_tcle['Status'].str.lower() == 'randomizado'].shape[0]
-    num_falha_princ = df_tcle[df_tcle['Status'].str.lower() == 'falha'].shape[0]
-    num_andamento_princ = df_princ_andamentos[df_princ_andamentos['Status'].str.lower() == 'andamento'].shape[0]
+        return selecao
+
+
+    def contar_status(self, coluna_data, ano, mes, tipo=None):
+        '''Pacientes por Status com a data no período (anos e meses; None não filtra, vazios não selecionam nada) e do tipo'''
+        matriz = self.status[coluna_data]
+        selecao = self._selecao(ano, mes, tipo, matriz.index.get_level_values('Ano'), matriz.index.get_level_values('Mês'),
+                                matriz.index.get_level_values('Tipo'))
+        return matriz[selecao].sum()
+
+
+    def contar_categorias(self, ano, mes, tipo=None):
+        '''Falhas por Processo e Categoria no período e do tipo, como `df.groupby(['Processo', 'Categoria']).size()`'''
+        selecao = self._selecao(ano, mes, tipo, self.categorias['Ano'].to_numpy(), self.categorias['Mês'].to_numpy(),
+                                self.categorias['Tipo'].to_numpy())
+        return self.categorias[selecao].groupby(['Processo', 'Categoria'], observed=True)['Contagem'].sum().reset_index(name='Contagem')
+
+
+def relatorio_mensal(dataframe):
+    '''Relatório mensal pré-calculado do dataframe de screening (criado na união dos arquivos)'''
+    return filtros.derivado_de(dataframe, 'relatorio_mensal', RelatorioMensal)
+
+
+def gerar_relatorio_mes(df_tcle_ori, df_pre_tcle_ori, df_mot_cat_ori, mes, ano, tipo=None):
+    relatorio_tcle = relatorio_mensal(df_tcle_ori)
+    relatorio_pre = relatorio_mensal(df_pre_tcle_ori)
+
+    # Contagens TCLE (os andamentos são os do ano todo)
+    status_princ = relatorio_tcle.contar_status('Data da falha', ano, mes, tipo)
+    andamentos_princ = relatorio_tcle.contar_status('Data assinatura', ano, None, tipo)
+    num_rando_princ = int(status_princ.get('Randomizado', 0))
+    num_falha_princ = int(status_princ.get('Falha', 0))
+    num_andamento_princ = int(andamentos_princ.get('Andamento', 0))
     num_total_scr = num_rando_princ + num_falha_princ + num_andamento_princ
 
     # Contagens Pré-TCLE
-    num_seguiu_tcle = df_pre_tcle[df_pre_tcle['Status'].str.lower() == 'segue tcle principal'].shape[0]
-    num_falha_pre = df_pre_tcle[df_pre_tcle['Status'].str.lower() == 'falha'].shape[0]
-    num_andamento_pre = df_pre_andamentos[df_pre_andamentos['Status'].str.lower() == 'andamento'].shape[0]
+    status_pre = relatorio_pre.contar_status('Data da falha', ano, mes, tipo)
+    andamentos_pre = relatorio_pre.contar_status('Data assinatura', ano, mes, tipo)
+    num_seguiu_tcle = int(status_pre.get('Segue Tcle Principal', 0))
+    num_falha_pre = int(status_pre.get('Falha', 0))
+    num_andamento_pre = int(andamentos_pre.get('Andamento', 0))
     num_total_pre = num_seguiu_tcle + num_falha_pre + num_andamento_pre
 
     # Agrupamento por Categoria de Falha
-    cat_falha = df_mot_cat.groupby(['Processo', 'Categoria']).size().reset_index(name='Contagem')
+    cat_falha = relatorio_mensal(df_mot_cat_ori).contar_categorias(ano, mes, tipo)
 
     # Filtrando categorias por processo
-    cat_falha_tcle = cat_falha[cat_falha['Processo'].str.lower() == 'tcle']
-    cat_falha_pre = cat_falha[cat_falha['Processo'].str.lower() == 'pré-tcle']
+    cat_falha_tcle = cat_falha[cat_falha['Processo'] == 'TCLE']
+    cat_falha_pre = cat_falha[cat_falha['Processo'] == 'Pré-TCLE']
 
     # Tabelas formatadas
     resumo_tcle = pd.DataFrame({
@@ -0,0 +1,98 @@
+'''
+Compara os motores de leitura do Excel (calamine x openpyxl) nas planilhas de cada página.
+
+Para cada planilha informada, o tratamento da página é executado com os dois motores. Os dataframes
+gerados precisam ser idênticos (paridade) e o menor tempo de cada motor é mostrado.
+
+Uso:
+    python benchmarks/motores_excel.py --screening PLAN_SCR_2024.xlsx --coordenacao Desvios.xlsx
+'''
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import leitor_planilhas
+import assets.Screening.Screening_Treatments as SCR_treats
+import assets.Coordenacao.Coord_Treats as Coord_treats
+import assets.Qualidade.Qual_treats as Qual_treats
+import assets.Regulatorio.Reg_Treats as Reg_treats
+import assets.Esteira_paciente.Esteira_Treats as Esteira_treats
+
+
+# Página: função de leitura e tratamento usada por ela
+TRATAMENTOS = {
+    'screening': SCR_treats.tratar_planilha,
+    'coordenacao': Coord_treats.process_excel_file,
+    'coord_qualidade': Coord_treats.tratar_tab_qual_coord,
+    'qualidade': Qual_treats.tratar_qualidade_file,
+    'regulatorio': Reg_treats.calcular_tempos,
+    'esteira': Esteira_treats.tratar_dados_upload,
+}
+
+
+def executar(funcao, conteudo, motor, repeticoes):
+    '''Executa o tratamento com o motor informado, sem passar pelo cache, e retorna o resultado e o menor tempo'''
+    leitor_planilhas.MOTOR_EXCEL = motor
+
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao.__wrapped__(io.BytesIO(conteudo))
+        tempos.append(time.perf_counter() - inicio)
+
+    return resultado, min(tempos)
+
+
+def verificar_paridade(resultado_a, resultado_b, caminho='resultado'):
+    '''Garante que os dois resultados são idênticos (dataframes, séries, dicionários e listas)'''
+    if isinstance(resultado_a, pd.DataFrame):
+        pd.testing.assert_frame_equal(resultado_a, resultado_b, obj=caminho)
+    elif isinstance(resultado_a, pd.Series):
+        pd.testing.assert_series_equal(resultado_a, resultado_b, obj=caminho)
+    elif isinstance(resultado_a, dict):
+        assert resultado_a.keys() == resultado_b.keys(), f'{caminho}: chaves diferentes'
+        for chave in resultado_a:
+            verificar_paridade(resultado_a[chave], resultado_b[chave], f'{caminho}[{chave!r}]')
+    elif isinstance(resultado_a, (list, tuple)):
+        assert len(resultado_a) == len(resultado_b), f'{caminho}: tamanhos diferentes'
+        for i, (item_a, item_b) in enumerate(zip(resultado_a, resultado_b)):
+            verificar_paridade(item_a, item_b, f'{caminho}[{i}]')
+    else:
+        assert resultado_a == resultado_b, f'{caminho}: {resultado_a!r} != {resultado_b!r}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paridade e tempo de leitura: calamine x openpyxl')
+    for pagina in TRATAMENTOS:
+        parser.add_argument(f'--{pagina}', metavar='XLSX', help=f'Planilha da página {pagina}')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    if leitor_planilhas.CalamineWorkbook is None:
+        sys.exit('O pacote python-calamine não está instalado.')
+
+    planilhas = {pagina: getattr(args, pagina) for pagina in TRATAMENTOS if getattr(args, pagina)}
+    if not planilhas:
+        parser.error('informe ao menos uma planilha')
+
+    print(f'{"página":<16}{"openpyxl (s)":>14}{"calamine (s)":>14}{"ganho":>8}')
+    for pagina, caminho in planilhas.items():
+        with open(caminho, 'rb') as arquivo:
+            conteudo = arquivo.read()
+
+        funcao = TRATAMENTOS[pagina]
+        resultado_openpyxl, tempo_openpyxl = executar(funcao, conteudo, 'openpyxl', args.repeticoes)
+        resultado_calamine, tempo_calamine = executar(funcao, conteudo, 'calamine', args.repeticoes)
+
+        verificar_paridade(resultado_openpyxl, resultado_calamine)
+        print(f'{pagina:<16}{tempo_openpyxl:>14.3f}{tempo_calamine:>14.3f}{tempo_openpyxl / tempo_calamine:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
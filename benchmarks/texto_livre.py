@@ -0,0 +1,89 @@
+'''
+Compara o armazenamento das colunas de texto livre como object (um `str` do Python por célula) e no tipo
+de texto do Arrow (`leitor_planilhas.TIPO_TEXTO_LIVRE`).
+
+Os dados são sintéticos, no formato das colunas de texto livre das páginas (descrição dos desvios,
+motivos de falha, achados): frases montadas a partir de um vocabulário, com parte dos textos repetidos
+e parte das células vazias. Para cada tamanho, é mostrada a memória da coluna e o menor tempo do `value_counts`.
+
+Uso:
+    python benchmarks/texto_livre.py --linhas 10000 100000 500000
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leitor_planilhas import TIPO_TEXTO_LIVRE, converter_texto_livre
+
+
+PALAVRAS = ['paciente', 'assinatura', 'ausente', 'termo', 'versão', 'desatualizada', 'coleta', 'realizada', 'fora',
+            'janela', 'protocolo', 'exame', 'laboratorial', 'não', 'registrado', 'prontuário', 'visita', 'medicação',
+            'dose', 'incorreta', 'data', 'divergente', 'CRF', 'preenchimento', 'pendente', 'investigador', 'ciente']
+
+
+def gerar_textos(linhas, semente=0):
+    '''Coluna de texto livre: 5% das células vazias, metade dos textos repetidos de um conjunto de frases comuns'''
+    aleatorio = random.Random(semente)
+
+    def frase():
+        return ' '.join(aleatorio.choice(PALAVRAS) for _ in range(aleatorio.randint(3, 25))).capitalize() + '.'
+
+    comuns = [frase() for _ in range(200)]
+
+    textos = []
+    for _ in range(linhas):
+        sorteio = aleatorio.random()
+        if sorteio < 0.05:
+            textos.append(None)
+        elif sorteio < 0.55:
+            textos.append(aleatorio.choice(comuns))
+        else:
+            textos.append(frase())
+
+    return pd.DataFrame({'Descrição': textos})
+
+
+def menor_tempo(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memória e value_counts: texto livre em object x Arrow')
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"linhas":>9}{"object (MB)":>13}{"Arrow (MB)":>12}{"redução":>9}'
+          f'{"object vc (s)":>15}{"Arrow vc (s)":>14}{"ganho":>8}')
+    for linhas in args.linhas:
+        df_object = gerar_textos(linhas)
+        df_arrow = converter_texto_livre(df_object.copy(), ['Descrição'])
+        assert df_arrow['Descrição'].dtype == TIPO_TEXTO_LIVRE
+
+        # Mesmo resultado nos dois tipos
+        assert df_object['Descrição'].value_counts().to_dict() == df_arrow['Descrição'].value_counts().to_dict()
+
+        memoria_object = df_object['Descrição'].memory_usage(deep=True) / 1024 ** 2
+        memoria_arrow = df_arrow['Descrição'].memory_usage(deep=True) / 1024 ** 2
+
+        tempo_object = menor_tempo(df_object['Descrição'].value_counts, args.repeticoes)
+        tempo_arrow = menor_tempo(df_arrow['Descrição'].value_counts, args.repeticoes)
+
+        print(f'{linhas:>9}{memoria_object:>13.1f}{memoria_arrow:>12.1f}{memoria_object / memoria_arrow:>8.1f}x'
+              f'{tempo_object:>15.4f}{tempo_arrow:>14.4f}{tempo_object / tempo_arrow:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,18 @@
 import streamlit as st
+import memoria_sessoes
 
 
 class ChecarAutenticacao():
-    def __init__(self):
+    def __init__(self, chaves_dados=()):
+        '''`chaves_dados` são as chaves do `st.session_state` com os dados da página: se foram descarregadas
+        para o disco por falta de memória, são carregadas de volta antes de a página usá-las'''
         if not self.usuario_logado():
             st.set_option('client.showSidebarNavigation', False)
             st.switch_page('1_🏠_Homepage.py')
         else:
             st.set_option('client.showSidebarNavigation', True)
             st.set_page_config(layout='wide')
+            memoria_sessoes.usar_dados(chaves_dados)
 
     def usuario_logado(self):
         '''Checar se o usuário está logado ou não'''
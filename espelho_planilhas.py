@@ -0,0 +1,245 @@
+import datetime
+import importlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import streamlit as st
+
+from leitor_planilhas import digest_arquivo
+
+
+# Pasta onde ficam as cópias das planilhas oficiais: espelho/<chave>.xlsx e espelho/<chave>.json (metadados)
+PASTA_ESPELHO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'espelho')
+
+# Intervalo (em segundos) entre duas sincronizações com as planilhas oficiais
+INTERVALO_SINCRONIZACAO = 15 * 60
+
+# Tempo máximo (em segundos) de cada download
+TEMPO_LIMITE_DOWNLOAD = 60
+
+# Chave da planilha em `st.secrets['urls']`: tratamento usado pela página que a recebe. Depois de cada
+# download o tratamento é executado, deixando os dados prontos no cache (`cache_por_conteudo`)
+FONTES = {
+    'PLAN_SCR_2023': 'assets.Screening.Screening_Treatments.tratar_planilha',
+    'PLAN_SCR_2024': 'assets.Screening.Screening_Treatments.tratar_planilha',
+    'PLAN_SCR_2025': 'assets.Screening.Screening_Treatments.tratar_planilha',
+    'PLAN_DESV': 'assets.Coordenacao.Coord_Treats.process_excel_file',
+    'PLAN_QUAL_COORD': 'assets.Coordenacao.Coord_Treats.tratar_tab_qual_coord',
+    'PLAN_QUAL': 'assets.Qualidade.Qual_treats.tratar_qualidade_file',
+    'PLAN_REG': 'assets.Regulatorio.Reg_Treats.calcular_tempos',
+    'PLAN_SCR_REC': 'assets.Esteira_paciente.Esteira_Treats.tratar_dados_upload',
+}
+
+
+class ArquivoEspelho(io.BytesIO):
+    '''Cópia de uma planilha do espelho, com os mesmos atributos do upload usados pelas páginas (`name` e `size`)'''
+    def __init__(self, conteudo, name):
+        super().__init__(conteudo)
+        self.name = name
+        self.size = len(conteudo)
+
+
+def _caminhos(chave, pasta):
+    return os.path.join(pasta, f'{chave}.xlsx'), os.path.join(pasta, f'{chave}.json')
+
+
+def metadados(chave, pasta=None):
+    '''Metadados da cópia da planilha (url, etag, last_modified, sha256, baixado_em, verificado_em), ou None se ainda não foi baixada'''
+    caminho_planilha, caminho_meta = _caminhos(chave, pasta or PASTA_ESPELHO)
+    if not os.path.exists(caminho_planilha):
+        return None
+
+    try:
+        with open(caminho_meta, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f'[ERRO metadados] - {e}')
+        return None
+
+
+def abrir_copia(chave, pasta=None):
+    '''Abre a cópia da planilha como se fosse um upload'''
+    caminho_planilha, _ = _caminhos(chave, pasta or PASTA_ESPELHO)
+    with open(caminho_planilha, 'rb') as f:
+        return ArquivoEspelho(f.read(), f'{chave}.xlsx')
+
+
+def _gravar(caminho, conteudo):
+    '''Grava o arquivo por inteiro antes de substituir o anterior, para que nunca seja lido pela metade'''
+    temporario = f'{caminho}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def sincronizar_planilha(chave, url, pasta=None):
+    """
+    Baixa a planilha oficial, se ela mudou desde o último download.
+
+    O pedido é condicional (`If-None-Match`/`If-Modified-Since` com o ETag e o Last-Modified da última resposta),
+    então uma planilha que não mudou não é baixada de novo.
+
+    Args:
+        chave (str): Chave da planilha em `st.secrets['urls']` (ex.: 'PLAN_QUAL').
+        url (str): Endereço da planilha.
+        pasta (str): Pasta do espelho. Por padrão, `PASTA_ESPELHO`.
+
+    Returns:
+        str: 'atualizada' (a cópia mudou), 'sem mudanças' ou 'erro'.
+    """
+    pasta = pasta or PASTA_ESPELHO
+    caminho_planilha, caminho_meta = _caminhos(chave, pasta)
+    meta = metadados(chave, pasta) or {}
+    agora = datetime.datetime.now().isoformat(timespec='seconds')
+
+    requisicao = urllib.request.Request(url)
+    # Se a url mudou, a cópia antiga não serve de referência
+    if meta.get('url') == url:
+        if meta.get('etag'):
+            requisicao.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            requisicao.add_header('If-Modified-Since', meta['last_modified'])
+
+    try:
+        with urllib.request.urlopen(requisicao, timeout=TEMPO_LIMITE_DOWNLOAD) as resposta:
+            conteudo = resposta.read()
+            etag = resposta.headers.get('ETag')
+            last_modified = resposta.headers.get('Last-Modified')
+
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            print(f'[ERRO sincronizar_planilha] - {chave}: {e}')
+            return 'erro'
+        conteudo = None
+
+    except (urllib.error.URLError, OSError) as e:
+        print(f'[ERRO sincronizar_planilha] - {chave}: {e}')
+        return 'erro'
+
+    # Um .xlsx é um arquivo zip. Outra coisa (ex.: a página de login do link) não substitui a cópia
+    if conteudo is not None and not conteudo.startswith(b'PK\x03\x04'):
+        print(f'[ERRO sincronizar_planilha] - {chave}: a resposta não é uma planilha Excel')
+        return 'erro'
+
+    os.makedirs(pasta, exist_ok=True)
+    status = 'sem mudanças'
+    if conteudo is not None:
+        sha256 = digest_arquivo(io.BytesIO(conteudo))
+        if sha256 != meta.get('sha256') or not os.path.exists(caminho_planilha):
+            _gravar(caminho_planilha, conteudo)
+            meta.update({'sha256': sha256, 'baixado_em': agora})
+            status = 'atualizada'
+        meta.update({'url': url, 'etag': etag, 'last_modified': last_modified})
+
+    meta['verificado_em'] = agora
+    _gravar(caminho_meta, json.dumps(meta, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    return status
+
+
+def preparar_dados(chave, pasta=None):
+    '''Executa o tratamento da página na cópia da planilha, para que ao carregá-la os dados já estejam no cache'''
+    modulo, nome_funcao = FONTES[chave].rsplit('.', 1)
+    try:
+        funcao = getattr(importlib.import_module(modulo), nome_funcao)
+        funcao(abrir_copia(chave, pasta))
+    except Exception as e:
+        print(f'[ERRO preparar_dados] - {chave}: {e}')
+
+
+def sincronizar_todas(urls, pasta=None):
+    '''Sincroniza todas as planilhas de `FONTES` que têm url. Retorna o status de cada uma'''
+    resultados = {}
+    for chave in FONTES:
+        if chave not in urls:
+            continue
+
+        resultados[chave] = sincronizar_planilha(chave, urls[chave], pasta)
+        if resultados[chave] == 'atualizada':
+            preparar_dados(chave, pasta)
+
+    return resultados
+
+
+_thread_sincronizacao = None
+_lock_sincronizacao = threading.Lock()
+
+
+def _sincronizar_periodicamente(urls):
+    # Depois de reiniciar o servidor, os dados das cópias que já existem são preparados de novo
+    for chave in FONTES:
+        if chave in urls and metadados(chave) is not None:
+            preparar_dados(chave)
+
+    while True:
+        sincronizar_todas(urls)
+        time.sleep(INTERVALO_SINCRONIZACAO)
+
+
+def iniciar_sincronizacao():
+    '''Inicia a sincronização em segundo plano (uma só por servidor, na primeira vez que é chamada)'''
+    global _thread_sincronizacao
+
+    with _lock_sincronizacao:
+        if _thread_sincronizacao is None:
+            urls = dict(st.secrets['urls'])
+            _thread_sincronizacao = threading.Thread(target=_sincronizar_periodicamente, args=(urls,), name='sincronizacao_planilhas', daemon=True)
+            _thread_sincronizacao.start()
+
+
+def oferecer_espelho(conjunto, chaves):
+    """
+    Para ser chamada quando não há upload na página: oferece carregar as cópias mais recentes das planilhas
+    oficiais, sem precisar baixá-las e enviá-las.
+
+    Depois do clique, as cópias são usadas no lugar do upload até que um arquivo seja enviado (veja `descartar_espelho`).
+
+    Args:
+        conjunto (str): Nome do conjunto de dados da página (ex.: 'qualidade').
+        chaves (list): Chaves das planilhas em `st.secrets['urls']`.
+
+    Returns:
+        list: As cópias (`ArquivoEspelho`), ou lista vazia se o usuário não escolheu usá-las.
+    """
+    iniciar_sincronizacao()
+
+    marcador = f'espelho_{conjunto}'
+    disponiveis = [(chave, metadados(chave)) for chave in chaves]
+    disponiveis = [(chave, meta) for chave, meta in disponiveis if meta is not None]
+    if not disponiveis:
+        return []
+
+    baixado_em = min(meta['baixado_em'] for _, meta in disponiveis)
+    baixado_em = datetime.datetime.fromisoformat(baixado_em).strftime('%d/%m/%Y %H:%M')
+
+    if not st.session_state.get(marcador):
+        if not st.button(f'Carregar a versão mais recente das planilhas (de {baixado_em})', key=f'botao_{marcador}', icon='🔄'):
+            return []
+        st.session_state[marcador] = True
+
+    try:
+        arquivos = [abrir_copia(chave) for chave, _ in disponiveis]
+    except OSError as e:
+        print(f'[ERRO oferecer_espelho] - {e}')
+        st.error('Não foi possível abrir a cópia das planilhas. Por favor, faça o upload.')
+        st.session_state[marcador] = None
+        return []
+
+    st.info(f'Exibindo a versão das planilhas de {baixado_em}. Envie uma planilha para usá-la no lugar.')
+    return arquivos
+
+
+def descartar_espelho(conjunto, chaves):
+    '''Para ser chamada quando há upload: se os dados atuais vieram do espelho, eles são descartados
+    (as chaves do `st.session_state` viram None) para que o arquivo enviado seja processado'''
+    marcador = f'espelho_{conjunto}'
+
+    if st.session_state.get(marcador):
+        for chave in chaves:
+            st.session_state[chave] = None
+        st.session_state[marcador] = None
@@ -0,0 +1,504 @@
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from leitor_planilhas import chave_ano, chave_mes, colunas_calendario, linhas_do_periodo
+
+
+# Máscaras de linhas guardadas por índice: as combinações de filtros mais recentes da página
+MAX_MASCARAS_POR_INDICE = 32
+# Recortes (linhas selecionadas) guardados por dataframe: os filtros dos gráficos de uma execução da página
+MAX_RECORTES_POR_DF = 12
+
+# Reentrante: remover uma entrada pode liberar o último outro dataframe monitorado (ex.: os dataframes derivados
+# do TCLE), e o `weakref.finalize` dele roda na mesma thread, ainda com o lock
+_lock_indices = threading.RLock()
+# id do DataFrame: índice de bitmaps / recortes / objetos derivados dele. As entradas saem junto com o DataFrame (`weakref.finalize`)
+_indices = {}
+_recortes = {}
+_derivados = {}
+_monitorados = set()
+
+
+def _bytes_da_coluna(valores):
+    '''Os bytes dos valores: o próprio array do numpy (números, datas), sem cópia se ele é contíguo, ou o hash
+    de cada valor (texto, tipos misturados, arrays do pandas)'''
+    if isinstance(valores, np.ndarray) and valores.dtype.kind in 'biufcmM':
+        return np.ascontiguousarray(valores).view(np.uint8)
+    return pd.util.hash_pandas_object(pd.Series(valores, copy=False), index=False).to_numpy().view(np.uint8)
+
+
+def _assinatura_da_coluna(serie):
+    '''Tipo e checksum dos valores da coluna (categóricas: dos códigos e das categorias)'''
+    valores = serie.array
+    if isinstance(valores, pd.Categorical):
+        partes = [_bytes_da_coluna(valores.codes), _bytes_da_coluna(valores.categories.to_numpy())]
+    else:
+        partes = [_bytes_da_coluna(serie.to_numpy() if isinstance(serie.dtype, np.dtype) else valores)]
+
+    return (str(serie.dtype), len(serie)) + tuple((zlib.crc32(parte), zlib.adler32(parte)) for parte in partes)
+
+
+class ConteudoDF():
+    '''Identifica o conteúdo das colunas de um dataframe, para saber se o que foi calculado a partir dele
+    (índice, recortes, derivados) ainda vale.
+
+    Guarda o tipo e um checksum dos valores de cada coluna, sem referência ao dataframe: `igual` retorna False se
+    colunas foram trocadas, removidas ou adicionadas ou se algum valor mudou, inclusive por escrita no lugar
+    (`df.loc[...] = ...`). A comparação percorre os valores das colunas (sem copiar as de números e datas)'''
+    def __init__(self, df, colunas=None):
+        self.todas_as_colunas = colunas is None
+        self.colunas = list(df.columns) if colunas is None else list(colunas)
+        self._assinaturas = self._assinar(df)
+
+
+    def _assinar(self, df):
+        if self.todas_as_colunas:
+            return [_assinatura_da_coluna(serie) for _, serie in df.items()]
+        return [_assinatura_da_coluna(df[coluna]) for coluna in self.colunas]
+
+
+    def igual(self, df):
+        if self.todas_as_colunas and list(df.columns) != self.colunas:
+            return False
+        if not self.todas_as_colunas and not all(coluna in df.columns for coluna in self.colunas):
+            return False
+
+        return self._assinar(df) == self._assinaturas
+
+
+class IndiceBitmap():
+    '''Índice de bitmaps das dimensões filtráveis de um dataframe (estudo, médico, categoria, setor, responsável...).
+
+    Para cada valor distinto de cada dimensão há um vetor de bits compactado (`np.packbits`, 1 bit por linha).
+    Uma combinação de filtros é resolvida com OU entre os valores de uma dimensão e E entre as dimensões,
+    sem percorrer as colunas do dataframe. As máscaras resultantes ficam guardadas para os próximos gráficos.
+    O índice só vale enquanto as colunas indexadas não mudarem (`valido_para`)'''
+    def __init__(self, df, colunas):
+        self.linhas = len(df)
+        self.colunas = tuple(coluna for coluna in colunas if coluna in df.columns)
+        self._conteudo = ConteudoDF(df, self.colunas)
+        self._bitmaps = {}
+        self._nulos = {}
+        self._mascaras = OrderedDict()
+        self._lock = threading.Lock()
+
+        for coluna in self.colunas:
+            codigos, valores = pd.factorize(df[coluna], sort=False)
+            self._bitmaps[coluna] = {valor: np.packbits(codigos == i) for i, valor in enumerate(valores)}
+            self._nulos[coluna] = np.packbits(codigos == -1)
+
+
+    def valido_para(self, df):
+        '''Se o índice corresponde ao conteúdo atual do dataframe (as colunas indexadas não foram alteradas)'''
+        return self._conteudo.igual(df)
+
+
+    def _bits_da_dimensao(self, coluna, valores):
+        '''OU dos bitmaps dos valores selecionados de uma dimensão (valores ausentes do índice não têm linhas)'''
+        bits = np.zeros((self.linhas + 7) // 8, dtype=np.uint8)
+        for valor in valores:
+            bitmap = self._nulos[coluna] if pd.isna(valor) else self._bitmaps[coluna].get(valor)
+            if bitmap is not None:
+                bits |= bitmap
+
+        return bits
+
+
+    def mascara(self, selecoes):
+        """
+        Máscara booleana das linhas que atendem a todas as seleções.
+
+        Args:
+            selecoes (dict): Coluna: lista de valores aceitos. As colunas devem estar no índice.
+
+        Returns:
+            np.ndarray: Máscara com uma posição por linha do dataframe indexado. Não deve ser alterada.
+        """
+        chave = tuple(sorted((coluna, tuple(valores)) for coluna, valores in selecoes.items()))
+        with self._lock:
+            if chave in self._mascaras:
+                self._mascaras.move_to_end(chave)
+                return self._mascaras[chave]
+
+        bits = None
+        for coluna, valores in selecoes.items():
+            bits_dimensao = self._bits_da_dimensao(coluna, valores)
+            bits = bits_dimensao if bits is None else bits & bits_dimensao
+
+        mascara = np.unpackbits(bits, count=self.linhas).astype(bool)
+        mascara.flags.writeable = False
+
+        with self._lock:
+            self._mascaras[chave] = mascara
+            while len(self._mascaras) > MAX_MASCARAS_POR_INDICE:
+                self._mascaras.popitem(last=False)
+
+        return mascara
+
+
+    def tamanho(self):
+        '''Bytes ocupados pelos bitmaps e pelas máscaras guardadas'''
+        bitmaps = sum(bitmap.nbytes for bitmaps in self._bitmaps.values() for bitmap in bitmaps.values())
+        bitmaps += sum(bitmap.nbytes for bitmap in self._nulos.values())
+        return bitmaps + sum(mascara.nbytes for mascara in self._mascaras.values())
+
+
+def indexar(df, colunas):
+    """
+    Cria o índice de bitmaps das dimensões do dataframe, se ele ainda não tem um com essas colunas.
+
+    Deve ser chamada na carga dos dados, com o dataframe que fica no `st.session_state`: o índice é do objeto
+    (os filtros dos gráficos partem dele), então dados compartilhados entre sessões usam o mesmo índice.
+    Se as colunas indexadas foram alteradas desde a criação do índice, ele é criado de novo.
+
+    Args:
+        df (pd.DataFrame): Dados carregados.
+        colunas (list): Dimensões filtráveis. As que não existirem no dataframe são ignoradas.
+
+    Returns:
+        pd.DataFrame: O próprio dataframe.
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+
+    with _lock_indices:
+        indice = _indices.get(id(df))
+        if (indice is not None and set(indice.colunas) >= {coluna for coluna in colunas if coluna in df.columns}
+                and indice.valido_para(df)):
+            return df
+
+    indice = IndiceBitmap(df, colunas)
+    with _lock_indices:
+        _monitorar(df)
+        _indices[id(df)] = indice
+
+    return df
+
+
+def _monitorar(df):
+    '''Remove o índice, os recortes e os derivados do dataframe quando ele sai da memória (chamar com `_lock_indices`)'''
+    if id(df) not in _monitorados:
+        _monitorados.add(id(df))
+        weakref.finalize(df, _remover_indice, id(df))
+
+
+def _remover_indice(id_df):
+    with _lock_indices:
+        _indices.pop(id_df, None)
+        _recortes.pop(id_df, None)
+        _derivados.pop(id_df, None)
+        _monitorados.discard(id_df)
+
+
+def indice_de(df):
+    '''Índice de bitmaps do dataframe (None se ele não foi indexado ou se as colunas indexadas mudaram depois)'''
+    with _lock_indices:
+        indice = _indices.get(id(df))
+
+    return indice if indice is not None and indice.valido_para(df) else None
+
+
+def _como_lista(valores):
+    '''Seleção de um filtro como lista: um valor só (ex.: um médico) vira uma lista de um item'''
+    if isinstance(valores, (list, tuple, set, pd.Index, pd.Series, np.ndarray)):
+        return list(valores)
+    return [valores]
+
+
+def _normalizar_selecoes(selecoes):
+    '''Seleções como listas, sem as vazias ou None (que não filtram)'''
+    return {coluna: _como_lista(valores) for coluna, valores in selecoes.items()
+            if valores is not None and not (isinstance(valores, (list, tuple, set, str)) and len(valores) == 0)}
+
+
+def _mascara_dimensoes(df, selecoes):
+    '''Máscara das seleções já normalizadas: dos bitmaps, se o dataframe foi indexado, ou com `isin`'''
+    indice = indice_de(df)
+    if indice is not None and all(coluna in indice.colunas for coluna in selecoes):
+        return indice.mascara(selecoes)
+
+    mascara = np.ones(len(df), dtype=bool)
+    for coluna, valores in selecoes.items():
+        mascara &= df[coluna].isin(valores).to_numpy()
+
+    return mascara
+
+
+def filtrar_dimensoes(df, selecoes):
+    """
+    Filtra o dataframe pelas seleções das dimensões (estudos, médico, categorias...), todas de uma vez.
+
+    Se o dataframe foi indexado (`indexar`), a máscara sai dos bitmaps e é reaproveitada pelos outros gráficos
+    com os mesmos filtros. Senão, compara as colunas com `isin`.
+
+    Args:
+        df (pd.DataFrame): Dados a filtrar.
+        selecoes (dict): Coluna: valor ou lista de valores aceitos. Seleções vazias ou None não filtram.
+
+    Returns:
+        pd.DataFrame: Um novo dataframe com as linhas selecionadas (pode ser alterado por quem chamou).
+    """
+    selecoes = _normalizar_selecoes(selecoes)
+    if not selecoes:
+        return df.copy()
+
+    return df[_mascara_dimensoes(df, selecoes)]
+
+
+class FiltroSpec():
+    '''Filtros de um gráfico: período (anos e meses) e seleções das dimensões.
+
+    `aplicar` resolve tudo em uma passada (máscara das dimensões combinada com as linhas do período) e guarda as
+    posições das linhas selecionadas no dataframe de origem. Os gráficos da mesma execução com os mesmos filtros
+    reaproveitam essas posições, sem recalcular máscaras. Elas valem enquanto as colunas usadas pelos filtros não
+    forem alteradas (`ConteudoDF`)'''
+    def __init__(self, anos=None, meses=None, selecoes=None):
+        self.anos = tuple(int(ano) for ano in anos) if anos else None
+        self.meses = tuple(int(mes) for mes in meses) if meses else None
+        self.selecoes = _normalizar_selecoes(selecoes or {})
+        self.chave = (self.anos, self.meses,
+                      tuple(sorted((coluna, tuple(valores)) for coluna, valores in self.selecoes.items())))
+
+
+    def __eq__(self, outro):
+        return isinstance(outro, FiltroSpec) and self.chave == outro.chave
+
+
+    def __hash__(self):
+        return hash(self.chave)
+
+
+    def __repr__(self):
+        return f'FiltroSpec(anos={self.anos}, meses={self.meses}, selecoes={self.selecoes})'
+
+
+    def _colunas_usadas(self, df, coluna_data):
+        '''Colunas que decidem quais linhas entram no recorte'''
+        colunas = list(self.selecoes)
+        if coluna_data is not None and (self.anos or self.meses):
+            colunas += [coluna for coluna in colunas_calendario([coluna_data]) if coluna in df.columns]
+        return colunas
+
+
+    def _linhas(self, df, coluna_data):
+        '''Posições das linhas selecionadas (array só de leitura), ou None se não há filtros'''
+        linhas = linhas_do_periodo(df, coluna_data, self.anos, self.meses)
+        if not self.selecoes:
+            if linhas is None:
+                return None
+            posicoes = np.arange(len(df))[linhas]
+        else:
+            mascara = _mascara_dimensoes(df, self.selecoes)
+            if linhas is not None:
+                periodo = np.zeros(len(df), dtype=bool)
+                periodo[linhas] = True
+                mascara = mascara & periodo
+            posicoes = np.flatnonzero(mascara)
+
+        posicoes.flags.writeable = False
+        return posicoes
+
+
+    def aplicar(self, df, coluna_data=None):
+        """
+        Recorte do dataframe com os filtros. As linhas selecionadas são calculadas uma vez por dataframe e filtros.
+
+        Args:
+            df (pd.DataFrame): Dados carregados.
+            coluna_data (str, optional): Coluna de data do filtro de período.
+
+        Returns:
+            pd.DataFrame: Um novo dataframe com as linhas selecionadas, na ordem do dataframe (pode ser alterado
+            por quem chamou sem mudar o `df` nem os recortes dos outros gráficos).
+        """
+        chave = (coluna_data, self.chave)
+        with _lock_indices:
+            recortes = _recortes.get(id(df))
+            guardado = recortes.get(chave) if recortes is not None else None
+            if guardado is not None:
+                recortes.move_to_end(chave)
+
+        if guardado is not None and guardado[0].igual(df):
+            linhas = guardado[1]
+        else:
+            conteudo = ConteudoDF(df, self._colunas_usadas(df, coluna_data))
+            linhas = self._linhas(df, coluna_data)
+            with _lock_indices:
+                _monitorar(df)
+                recortes = _recortes.setdefault(id(df), OrderedDict())
+                recortes[chave] = (conteudo, linhas)
+                while len(recortes) > MAX_RECORTES_POR_DF:
+                    recortes.popitem(last=False)
+
+        return df.copy() if linhas is None else df.take(linhas)
+
+
+class CuboContagens():
+    '''Contagem de linhas por ano, mês (de uma coluna de data) e dimensões, só com as combinações que existem.
+
+    Os gráficos de contagem (por estudo, status, categoria, médico...) somam as linhas do cubo em vez de agrupar
+    o dataframe: o cubo tem uma linha por combinação de mês e dimensões, então o custo não cresce com o número de
+    pacientes de cada mês. Valores vazios das dimensões também são combinações (não somem do total)'''
+    def __init__(self, contagens, coluna_data, linhas):
+        self.contagens = contagens
+        self.coluna_data = coluna_data
+        self.linhas = linhas
+
+
+    @classmethod
+    def a_partir_do_df(cls, df, coluna_data, dimensoes):
+        chaves = {chave_ano(coluna_data): 'Ano', chave_mes(coluna_data): 'Mês'}
+        dimensoes = [dimensao for dimensao in dimensoes if dimensao in df.columns]
+        contagens = (df[list(chaves) + dimensoes].rename(columns=chaves)
+                     .groupby(['Ano', 'Mês'] + dimensoes, observed=True, dropna=False, sort=False)
+                     .size().reset_index(name='Contagem'))
+
+        return cls(contagens, coluna_data, len(df))
+
+
+    def recortar(self, anos=None, meses=None, selecoes=None):
+        """
+        Cubo só com os anos, meses e valores selecionados (mesma regra de `FiltroSpec`).
+
+        Returns:
+            CuboContagens: As combinações selecionadas.
+        """
+        selecoes = _normalizar_selecoes(selecoes or {})
+        mascara = np.ones(len(self.contagens), dtype=bool)
+        if anos:
+            mascara &= self.contagens['Ano'].isin(anos).to_numpy()
+        if meses:
+            mascara &= self.contagens['Mês'].isin(meses).to_numpy()
+        for coluna, valores in selecoes.items():
+            mascara &= self.contagens[coluna].isin(valores).to_numpy()
+
+        return CuboContagens(self.contagens[mascara], self.coluna_data, self.linhas)
+
+
+    def total(self):
+        return int(self.contagens['Contagem'].sum())
+
+
+    def vazio(self):
+        return self.total() == 0
+
+
+    def contar(self, colunas):
+        '''Linhas por combinação das colunas, como `df.groupby(colunas, observed=True).size()`'''
+        return self.contagens.groupby(colunas, observed=True)['Contagem'].sum()
+
+
+    def contar_valores(self, coluna):
+        '''Linhas por valor da coluna, como `Screening_Treatments.contar_valores(df[coluna])`
+        (a ordem dos empates é a das categorias, como no `value_counts`)'''
+        contagem = self.contagens.groupby(coluna, observed=False)['Contagem'].sum()
+        contagem = contagem.rename('count').sort_values(ascending=False)
+        contagem = contagem[contagem > 0]
+        contagem.index = contagem.index.astype(object)
+        return contagem
+
+
+    def por_mes(self):
+        '''Linhas por mês (último dia), do primeiro ao último mês com datas, com zero nos meses sem linhas,
+        como `df.resample('ME', on=coluna_data).size()`'''
+        contagem = self.contagens[self.contagens['Ano'] > 0].groupby(['Ano', 'Mês'])['Contagem'].sum()
+        meses = pd.to_datetime({'year': contagem.index.get_level_values('Ano'),
+                                'month': contagem.index.get_level_values('Mês'), 'day': 1}) + pd.offsets.MonthEnd(0)
+        contagem.index = pd.DatetimeIndex(meses)
+        if contagem.empty:
+            return contagem.astype('int64')
+
+        return contagem.reindex(pd.date_range(contagem.index.min(), contagem.index.max(), freq='ME'), fill_value=0)
+
+
+def guardar_derivado(df, nome, derivado):
+    '''Guarda um objeto calculado a partir do dataframe (cubo, tabela de eventos...), que sai junto com ele.
+    Ele só vale enquanto o conteúdo do dataframe não mudar (`ConteudoDF`)'''
+    with _lock_indices:
+        _monitorar(df)
+        derivados = _derivados.get(id(df))
+        if derivados is None or not derivados['conteudo'].igual(df):
+            derivados = _derivados[id(df)] = {'conteudo': ConteudoDF(df), 'objetos': {}}
+        derivados['objetos'][nome] = derivado
+
+    return derivado
+
+
+def derivado_de(df, nome, construir=None):
+    """
+    Objeto calculado a partir do dataframe e guardado com ele (`guardar_derivado`).
+
+    Args:
+        df (pd.DataFrame): Dados carregados.
+        nome: Identificação do objeto.
+        construir (callable, optional): Função que recebe o dataframe e calcula o objeto, se ele ainda não existe.
+
+    Returns:
+        O objeto, ou None se ele não existe (ou o dataframe mudou depois dele) e não há `construir`.
+    """
+    with _lock_indices:
+        derivados = _derivados.get(id(df))
+        if derivados is not None and nome in derivados['objetos'] and derivados['conteudo'].igual(df):
+            return derivados['objetos'][nome]
+
+    if construir is None:
+        return None
+
+    return guardar_derivado(df, nome, construir(df))
+
+
+def compartilhar_derivados(origem, destino):
+    '''Usa os objetos calculados de `origem` (cubos, eventos...) para `destino`, um recorte de colunas dele com as
+    mesmas linhas'''
+    with _lock_indices:
+        derivados = _derivados.get(id(origem))
+        if derivados is not None and len(destino) == len(origem) and derivados['conteudo'].igual(origem):
+            _monitorar(destino)
+            _derivados[id(destino)] = {'conteudo': ConteudoDF(destino), 'objetos': dict(derivados['objetos'])}
+
+    return destino
+
+
+def construir_cubos(df, colunas_data, dimensoes):
+    """
+    Cria os cubos de contagem do dataframe, um por coluna de data (base dos filtros de período).
+
+    Deve ser chamada na carga dos dados. Como o índice de bitmaps, os cubos são do objeto e saem junto com ele.
+
+    Args:
+        df (pd.DataFrame): Dados carregados, com as chaves de calendário das colunas de data.
+        colunas_data (list): Colunas de data. As que não têm chaves de calendário no dataframe são ignoradas.
+        dimensoes (list): Dimensões contadas. As que não existirem no dataframe são ignoradas.
+
+    Returns:
+        pd.DataFrame: O próprio dataframe.
+    """
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+
+    for coluna in colunas_data:
+        if chave_ano(coluna) in df.columns:
+            guardar_derivado(df, ('cubo', coluna), CuboContagens.a_partir_do_df(df, coluna, dimensoes))
+
+    return df
+
+
+def cubo_de(df, coluna_data, dimensoes):
+    """
+    Cubo de contagem do dataframe na coluna de data. Se ele não foi criado na carga (`construir_cubos`),
+    é criado agora e guardado para as próximas consultas.
+
+    Args:
+        df (pd.DataFrame): Dados carregados.
+        coluna_data (str): Coluna de data dos filtros de período.
+        dimensoes (list): Dimensões contadas, se o cubo precisar ser criado.
+
+    Returns:
+        CuboContagens: O cubo.
+    """
+    return derivado_de(df, ('cubo', coluna_data), lambda df: CuboContagens.a_partir_do_df(df, coluna_data, dimensoes))
@@ -0,0 +1,993 @@
+import datetime
+import functools
+import hashlib
+import importlib
+import io
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import ERROR_CODES
+from pandas.io.parsers import TextParser
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+try:
+    from python_calamine import CalamineWorkbook, SheetTypeEnum
+except ImportError:
+    CalamineWorkbook = None
+
+
+# Versão do leitor. Deve ser incrementada sempre que a leitura das planilhas mudar,
+# invalidando tudo o que já está em cache.
+VERSAO_LEITOR = '1'
+
+# Número máximo de planilhas tratadas fora de uma sessão (ex.: pelo espelho) mantidas em memória até que uma
+# sessão as abra. As planilhas abertas pelas sessões ficam só no registro compartilhado (`registro_dados`)
+MAX_ENTRADAS_CACHE = 32
+
+# Número máximo de abas tratadas mantidas em memória, para reaproveitar as abas que não mudaram
+# quando uma nova versão da mesma planilha é enviada
+MAX_ENTRADAS_CACHE_ABAS = 512
+
+# Motor usado para ler o Excel. O calamine (Rust) é bem mais rápido que o openpyxl (Python puro),
+# mas é opcional: sem o pacote `python-calamine` instalado, a leitura continua pelo openpyxl
+MOTOR_EXCEL = 'calamine' if CalamineWorkbook is not None else 'openpyxl'
+
+# Número de processos usados para tratar várias planilhas ao mesmo tempo
+MAX_PROCESSOS = min(4, os.cpu_count() or 1)
+
+# Número de linhas de cada bloco na leitura em blocos (`ler_abas_em_blocos`), usada nos arquivos grandes
+# para que a memória dependa do tamanho do bloco e não do tamanho da planilha
+TAMANHO_BLOCO = 5000
+
+# Arquivos maiores que isto (em bytes) são lidos em blocos
+LIMITE_LEITURA_EM_BLOCOS = 20 * 1024 * 1024
+
+# Tipo das colunas de texto livre (descrições, motivos, achados): o texto fica em um único buffer do Arrow,
+# em vez de um objeto `str` do Python por célula. Os valores ausentes continuam NaN e as comparações retornam bool
+TIPO_TEXTO_LIVRE = pd.StringDtype('pyarrow_numpy')
+
+# Prefixos das chaves de calendário (`adicionar_chaves_calendario`): colunas internas, fora das tabelas exibidas
+PREFIXOS_CALENDARIO = ('_ano ', '_mes ', '_ano_mes ')
+
+# Atributo (`df.attrs`) com a coluna de data pela qual o dataframe está ordenado (`ordenar_por_data`)
+ATRIBUTO_ORDEM_DATA = 'ordenado_por_data'
+
+
+def memoria_dados(valor):
+    '''Memória (em bytes) dos DataFrames e Series do valor, que pode ser também um dicionário, lista ou tupla deles'''
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, dict):
+        return sum(memoria_dados(item) for item in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(memoria_dados(item) for item in valor)
+    return 0
+
+
+class CacheLRU():
+    '''Cache em memória com descarte do item usado há mais tempo (LRU) quando o limite é atingido.
+    A memória de cada item é medida quando ele é guardado, para que os limites de memória do servidor
+    (`memoria_sessoes.aplicar_limites`) possam esvaziar o cache. É seguro para ser usado por várias sessões
+    do Streamlit ao mesmo tempo.'''
+
+    def __init__(self, max_entradas):
+        self.max_entradas = max_entradas
+        self._itens = OrderedDict()
+        self._tamanhos = {}
+        self._lock = threading.Lock()
+
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            if chave not in self._itens:
+                return padrao
+
+            self._itens.move_to_end(chave)
+            return self._itens[chave]
+
+
+    def guardar(self, chave, valor):
+        tamanho = memoria_dados(valor)
+        with self._lock:
+            self._itens[chave] = valor
+            self._tamanhos[chave] = tamanho
+            self._itens.move_to_end(chave)
+
+            while len(self._itens) > self.max_entradas:
+                antiga, _ = self._itens.popitem(last=False)
+                del self._tamanhos[antiga]
+
+
+    def retirar(self, chave):
+        '''Remove o item da chave, se existir'''
+        with self._lock:
+            self._itens.pop(chave, None)
+            self._tamanhos.pop(chave, None)
+
+
+    def memoria(self):
+        '''Memória (em bytes) ocupada pelos itens'''
+        with self._lock:
+            return sum(self._tamanhos.values())
+
+
+    def liberar_memoria(self, tamanho):
+        '''Descarta os itens usados há mais tempo até liberar `tamanho` bytes (ou esvaziar o cache). Retorna os bytes liberados'''
+        liberados = 0
+        with self._lock:
+            while self._itens and liberados < tamanho:
+                antiga, _ = self._itens.popitem(last=False)
+                liberados += self._tamanhos.pop(antiga)
+
+        return liberados
+
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self._tamanhos.clear()
+
+
+    def chaves(self):
+        with self._lock:
+            return list(self._itens)
+
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._itens)
+
+
+class RegistroDados():
+    '''
+    Registro dos dados tratados compartilhados por todas as sessões do servidor, indexados pela chave do cache
+    (que inclui o SHA-256 do conteúdo do arquivo). Cada sessão que recebe os dados é contada na entrada, e a
+    entrada é descartada quando nenhuma sessão os usa mais (veja `memoria_sessoes.usar_dados`). O registro é o
+    único lugar do servidor que guarda os dados, fora as sessões: sem a entrada, eles saem da memória.
+
+    Todas as sessões recebem o mesmo objeto, então os dados devolvidos devem ser apenas lidos, nunca alterados.
+    '''
+    def __init__(self):
+        self._itens = {}
+        self._sessoes = {}
+        self._chaves = {}
+        self._lock = threading.Lock()
+
+
+    def obter(self, chave, id_sessao=None):
+        '''Dados da chave (ou None). Com `id_sessao`, a sessão passa a ser contada entre as que usam os dados'''
+        with self._lock:
+            if chave not in self._itens:
+                return None
+
+            if id_sessao is not None:
+                self._sessoes[chave].add(id_sessao)
+            return self._itens[chave]
+
+
+    def registrar(self, chave, dados, id_sessao):
+        '''Registra os dados da chave para a sessão. Se outra sessão registrou a mesma chave antes, ficam os dados dela'''
+        # Fora de uma sessão (ex.: a sincronização do espelho) não há quem conte como usuário dos dados
+        if id_sessao is None:
+            return dados
+
+        with self._lock:
+            if chave not in self._itens:
+                self._itens[chave] = dados
+                self._sessoes[chave] = set()
+                self._chaves[id(dados)] = chave
+
+            self._sessoes[chave].add(id_sessao)
+            return self._itens[chave]
+
+
+    def chave_de(self, dados):
+        '''Chave dos dados, se eles são o próprio objeto registrado (ou None)'''
+        with self._lock:
+            return self._chaves.get(id(dados))
+
+
+    def liberar(self, chave, id_sessao):
+        '''A sessão deixa de usar os dados da chave. Sem nenhuma sessão, a entrada é descartada'''
+        with self._lock:
+            if chave not in self._itens:
+                return
+
+            self._sessoes[chave].discard(id_sessao)
+            if not self._sessoes[chave]:
+                del self._chaves[id(self._itens[chave])]
+                del self._itens[chave]
+                del self._sessoes[chave]
+
+
+    def entradas(self):
+        '''Lista de tuplas (chave, dados, sessões que usam os dados)'''
+        with self._lock:
+            return [(chave, self._itens[chave], set(self._sessoes[chave])) for chave in self._itens]
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._itens)
+
+
+cache_planilhas = CacheLRU(MAX_ENTRADAS_CACHE)
+cache_abas = CacheLRU(MAX_ENTRADAS_CACHE_ABAS)
+registro_dados = RegistroDados()
+
+
+def id_sessao_atual():
+    '''Id da sessão do Streamlit que está executando o código (None fora de uma sessão)'''
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def compartilhar(chave, calcular):
+    """
+    Devolve os dados da `chave` no registro compartilhado pelas sessões (`registro_dados`). Só quando nenhuma
+    sessão os tem, eles são calculados com `calcular()` e registrados. A sessão atual passa a contar como usuária dos dados.
+
+    Args:
+        chave: Chave dos dados, com o digest do conteúdo de onde eles vieram.
+        calcular (callable): Função sem argumentos que gera os dados.
+
+    Returns:
+        Os dados registrados, que devem ser apenas lidos.
+    """
+    id_sessao = id_sessao_atual()
+
+    dados = registro_dados.obter(chave, id_sessao)
+    if dados is None:
+        dados = registro_dados.registrar(chave, calcular(), id_sessao)
+
+    return dados
+
+
+def compartilhar_derivado(funcao, dados):
+    '''Calcula `funcao(dados)` uma vez só para todas as sessões quando `dados` vem do registro (ex.: os tempos
+    calculados a partir da planilha tratada). Para outros dados, apenas chama a função'''
+    chave = registro_dados.chave_de(dados)
+    if chave is None:
+        return funcao(dados)
+
+    return compartilhar((f'{funcao.__module__}.{funcao.__qualname__}', chave), lambda: funcao(dados))
+
+
+def digest_arquivo(arquivo):
+    '''Calcula o SHA-256 do conteúdo do upload sem copiar os bytes (usa o buffer do `BytesIO` diretamente)'''
+    if hasattr(arquivo, 'getbuffer'):
+        with arquivo.getbuffer() as buffer:
+            return hashlib.sha256(buffer).hexdigest()
+
+    posicao = arquivo.tell()
+    arquivo.seek(0)
+    digest = hashlib.sha256(arquivo.read()).hexdigest()
+    arquivo.seek(posicao)
+    return digest
+
+
+def cache_por_conteudo(versao):
+    """
+    Decorador para as funções que leem e tratam um upload de planilha.
+
+    O resultado tratado é indexado pelo conteúdo do arquivo (SHA-256 dos bytes), pela função e pelas
+    versões do leitor e do tratamento. Assim, um segundo upload dos mesmos bytes, em qualquer sessão,
+    devolve os dataframes sem ler o Excel de novo enquanto alguma sessão ainda os usa.
+
+    As sessões recebem o próprio objeto do registro (`compartilhar`): várias sessões com a mesma
+    planilha ocupam a memória de uma cópia só, e os dados devem ser apenas lidos, nunca alterados.
+    O registro é o único dono do resultado: quando nenhuma sessão o usa mais, ele sai da memória.
+    Só o resultado calculado fora de uma sessão (ex.: pelo espelho) fica em `cache_planilhas`, até
+    que uma sessão o peça e ele passe para o registro.
+
+    Args:
+        versao (str): Versão do tratamento. Incremente quando a função (ou as que ela chama) mudar.
+
+    Returns:
+        A função decorada, que recebe o arquivo como primeiro argumento.
+    """
+    def decorador(funcao):
+        nome_funcao = f'{funcao.__module__}.{funcao.__qualname__}'
+
+        def chave_cache(arquivo):
+            return (nome_funcao, VERSAO_LEITOR, MOTOR_EXCEL, versao, digest_arquivo(arquivo))
+
+        def tratar(arquivo, chave):
+            resultado = cache_planilhas.obter(chave)
+            if resultado is None:
+                arquivo.seek(0)
+                resultado = funcao(arquivo)
+
+            if id_sessao_atual() is None:
+                cache_planilhas.guardar(chave, resultado)
+            else:
+                cache_planilhas.retirar(chave)
+            return resultado
+
+        @functools.wraps(funcao)
+        def envoltorio(arquivo):
+            chave = chave_cache(arquivo)
+            return compartilhar(chave, lambda: tratar(arquivo, chave))
+
+        envoltorio.chave_cache = chave_cache
+        envoltorio.versao = versao
+        return envoltorio
+
+    return decorador
+
+
+def digest_aba(sheet_name, sheet_df):
+    '''Impressão digital do conteúdo lido de uma aba: nome, colunas, tipos e o valor de todas as células'''
+    digest = hashlib.sha256()
+    digest.update(repr((sheet_name, list(sheet_df.columns), [str(dtype) for dtype in sheet_df.dtypes])).encode())
+    digest.update(pd.util.hash_pandas_object(sheet_df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def cache_por_aba(versao):
+    """
+    Decorador para as funções que tratam uma única aba, no formato `funcao(sheet_name, sheet_df, *args)`.
+
+    O resultado fica guardado em `cache_abas`, indexado pela impressão digital da aba (`digest_aba`).
+    Quando uma nova versão da planilha é enviada, só as abas que mudaram são tratadas de novo.
+    O resultado devolvido é o próprio objeto do cache: ele deve ser apenas concatenado, nunca alterado.
+
+    Args:
+        versao (str): Versão do tratamento. Incremente quando a função (ou as que ela chama) mudar.
+
+    Returns:
+        A função decorada.
+    """
+    def decorador(funcao):
+        nome_funcao = f'{funcao.__module__}.{funcao.__qualname__}'
+
+        def chave_cache(sheet_name, sheet_df, *args):
+            return (nome_funcao, VERSAO_LEITOR, versao, digest_aba(sheet_name, sheet_df), args)
+
+        @functools.wraps(funcao)
+        def envoltorio(sheet_name, sheet_df, *args):
+            chave = chave_cache(sheet_name, sheet_df, *args)
+
+            resultado = cache_abas.obter(chave)
+            if resultado is None:
+                resultado = funcao(sheet_name, sheet_df, *args)
+                cache_abas.guardar(chave, resultado)
+
+            return resultado
+
+        envoltorio.chave_cache = chave_cache
+        return envoltorio
+
+    return decorador
+
+
+_pool_processos = None
+_lock_pool = threading.Lock()
+
+
+def pool_processos():
+    '''Pool de processos compartilhado por todas as sessões, criado na primeira vez que é usado'''
+    global _pool_processos
+
+    with _lock_pool:
+        if _pool_processos is None:
+            # 'spawn' em vez de 'fork': o servidor do Streamlit tem várias threads rodando
+            _pool_processos = ProcessPoolExecutor(max_workers=MAX_PROCESSOS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool_processos
+
+
+def _descartar_pool():
+    '''Descarta o pool (ex.: um processo morreu), para que um novo seja criado no próximo uso'''
+    global _pool_processos
+
+    with _lock_pool:
+        if _pool_processos is not None:
+            _pool_processos.shutdown(wait=False, cancel_futures=True)
+            _pool_processos = None
+
+
+def mapear_em_processos(funcao, itens):
+    '''Aplica `funcao` (definida no nível do módulo) a cada item usando o pool de processos.
+    Os resultados são devolvidos na mesma ordem dos itens.'''
+    try:
+        return list(pool_processos().map(funcao, itens))
+    except BrokenProcessPool:
+        _descartar_pool()
+        raise
+
+
+def _tratar_no_processo(modulo, nome_funcao, conteudo):
+    '''Executado dentro do processo do pool: chama o tratamento (sem cache) sobre os bytes do upload'''
+    funcao = getattr(importlib.import_module(modulo), nome_funcao)
+    return funcao.__wrapped__(io.BytesIO(conteudo))
+
+
+def tratar_em_paralelo(funcao, arquivos):
+    """
+    Trata vários uploads ao mesmo tempo, um processo por arquivo.
+
+    Os arquivos já presentes em `registro_dados` ou `cache_planilhas` não são reprocessados. Os demais são enviados
+    ao pool de processos assim que esta função é chamada (com um único arquivo pendente, ele é
+    tratado no próprio processo, sem o custo de iniciar o pool).
+
+    Args:
+        funcao (callable): Função decorada com `cache_por_conteudo` (deve estar no nível do módulo).
+        arquivos (list): Uploads a serem tratados.
+
+    Returns:
+        Iterador de tuplas (arquivo, resultado), na ordem em que os tratamentos terminam.
+    """
+    prontos = []
+    pendentes = []
+    for arquivo in arquivos:
+        chave = funcao.chave_cache(arquivo)
+        resultado = registro_dados.obter(chave)
+        if resultado is None:
+            resultado = cache_planilhas.obter(chave)
+
+        if resultado is None:
+            pendentes.append((arquivo, chave))
+        else:
+            prontos.append((arquivo, chave, resultado))
+
+    futuros = {}
+    if len(pendentes) > 1:
+        pool = pool_processos()
+        for arquivo, chave in pendentes:
+            futuro = pool.submit(_tratar_no_processo, funcao.__module__, funcao.__name__, arquivo.getvalue())
+            futuros[futuro] = (arquivo, chave)
+
+    def resultados():
+        for arquivo, chave, resultado in prontos:
+            yield arquivo, compartilhar(chave, lambda: resultado)
+
+        if not futuros:
+            for arquivo, _ in pendentes:
+                yield arquivo, funcao(arquivo)
+            return
+
+        try:
+            for futuro in as_completed(futuros):
+                arquivo, chave = futuros[futuro]
+                resultado = futuro.result()
+                cache_planilhas.guardar(chave, resultado)
+                yield arquivo, compartilhar(chave, lambda: resultado)
+        except BrokenProcessPool:
+            _descartar_pool()
+            raise
+
+    return resultados()
+
+
+def _converter_celula_openpyxl(valor):
+    '''Converte o valor da célula como o `pd.read_excel` faz (vazio vira "", erro vira NaN e float inteiro vira int)'''
+    if valor is None:
+        return ''
+    if isinstance(valor, str) and valor in ERROR_CODES:
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def _converter_celula_calamine(valor):
+    '''Converte o valor da célula como o `pd.read_excel(engine='calamine')` faz'''
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    if isinstance(valor, datetime.date):
+        return pd.Timestamp(valor)
+    if isinstance(valor, datetime.timedelta):
+        return pd.Timedelta(valor)
+    return valor
+
+
+def _abas_openpyxl(arquivo, selecionar_aba):
+    '''Percorre as abas selecionadas, devolvendo o nome e as linhas (valores brutos) de cada uma'''
+    workbook = load_workbook(arquivo, read_only=True, data_only=True)
+
+    try:
+        for nome_aba in workbook.sheetnames:
+            if not selecionar_aba(nome_aba):
+                continue
+
+            sheet = workbook[nome_aba]
+            sheet.reset_dimensions()
+            yield nome_aba, sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _abas_calamine(arquivo, selecionar_aba):
+    '''Percorre as abas selecionadas, devolvendo o nome e as linhas (valores brutos) de cada uma'''
+    workbook = CalamineWorkbook.from_filelike(arquivo)
+
+    try:
+        for aba in workbook.sheets_metadata:
+            # Como no pandas, só as planilhas de dados (sem abas de gráfico)
+            if aba.typ != SheetTypeEnum.WorkSheet or not selecionar_aba(aba.name):
+                continue
+
+            nome_aba = aba.name
+            yield nome_aba, workbook.get_sheet_by_name(nome_aba).to_python(skip_empty_area=False)
+    finally:
+        workbook.close()
+
+
+def ler_excel(arquivo, **kwargs):
+    """
+    Equivalente ao `pd.read_excel`, mas usando o motor mais rápido disponível (`MOTOR_EXCEL`).
+
+    Se o calamine não conseguir ler o arquivo, a leitura é refeita com o openpyxl, então o resultado
+    nunca depende de o pacote opcional estar instalado.
+
+    Args:
+        arquivo (BytesIO): Upload do arquivo Excel.
+        **kwargs: Argumentos repassados ao `pd.read_excel` (ex.: `sheet_name=None`).
+
+    Returns:
+        pd.DataFrame | dict: O mesmo retorno do `pd.read_excel`.
+    """
+    if MOTOR_EXCEL != 'openpyxl':
+        try:
+            arquivo.seek(0)
+            return pd.read_excel(arquivo, engine=MOTOR_EXCEL, **kwargs)
+        except Exception as e:
+            print(f'[ERRO ler_excel] - {MOTOR_EXCEL} não leu o arquivo, usando openpyxl: {e}')
+
+    arquivo.seek(0)
+    return pd.read_excel(arquivo, engine='openpyxl', **kwargs)
+
+
+def ler_abas_projetadas(arquivo, selecionar_aba, selecionar_coluna):
+    """
+    Lê do Excel apenas as abas e colunas necessárias, em vez de carregar a planilha inteira.
+
+    O cabeçalho de cada aba é lido primeiro para descobrir quais colunas interessam; das linhas
+    seguintes só as células dessas colunas são guardadas. O resultado é o mesmo que o
+    `pd.read_excel(arquivo, sheet_name=None)` daria para essas abas, já sem as colunas descartadas.
+
+    Args:
+        arquivo (BytesIO): Upload do arquivo Excel.
+        selecionar_aba (callable): Recebe o nome da aba e retorna se ela deve ser lida.
+        selecionar_coluna (callable): Recebe o nome da aba e o nome da coluna e retorna se ela deve ser mantida.
+
+    Returns:
+        dict: Dicionário {nome da aba: DataFrame}, na ordem das abas no arquivo.
+    """
+    if MOTOR_EXCEL != 'openpyxl':
+        try:
+            arquivo.seek(0)
+            return _projetar_abas(_abas_calamine(arquivo, selecionar_aba), _converter_celula_calamine, selecionar_coluna)
+        except Exception as e:
+            print(f'[ERRO ler_abas_projetadas] - {MOTOR_EXCEL} não leu o arquivo, usando openpyxl: {e}')
+
+    arquivo.seek(0)
+    return _projetar_abas(_abas_openpyxl(arquivo, selecionar_aba), _converter_celula_openpyxl, selecionar_coluna)
+
+
+def ler_abas_em_blocos(arquivo, selecionar_aba, selecionar_coluna, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Lê as abas e colunas necessárias em blocos de linhas, sem carregar a planilha inteira na memória.
+
+    As linhas são percorridas com o openpyxl em modo somente leitura e, a cada `tamanho_bloco` linhas,
+    viram um DataFrame. Juntando os blocos de uma aba, o resultado é o mesmo de `ler_abas_projetadas`
+    (inclusive o índice). Uma coluna tem o mesmo tipo em todos os blocos: se ela está vazia em um bloco,
+    recebe o tipo que tinha nos anteriores (ou texto), para que o tratamento possa ser aplicado bloco a bloco.
+
+    Args:
+        arquivo (BytesIO): Upload do arquivo Excel.
+        selecionar_aba (callable): Recebe o nome da aba e retorna se ela deve ser lida.
+        selecionar_coluna (callable): Recebe o nome da aba e o nome da coluna e retorna se ela deve ser mantida.
+        tamanho_bloco (int): Número de linhas de cada bloco.
+
+    Returns:
+        Iterador de tuplas (nome da aba, DataFrame do bloco). Toda aba gera ao menos um bloco (vazio se não tiver linhas).
+    """
+    arquivo.seek(0)
+    for nome_aba, linhas in _abas_openpyxl(arquivo, selecionar_aba):
+        linhas = iter(linhas)
+
+        cabecalho = [_converter_celula_openpyxl(valor) for valor in next(linhas, ())]
+        indices = [i for i, coluna in enumerate(cabecalho) if coluna != '' and selecionar_coluna(nome_aba, coluna)]
+        colunas = [cabecalho[i] for i in indices]
+        linha_vazia = [''] * len(indices)
+
+        tipos = {}
+        bloco = []
+        inicio_bloco = 0
+        # Como no pandas, as linhas vazias no fim da aba são descartadas: elas só entram no bloco
+        # quando aparece uma linha com dados depois delas
+        linhas_vazias_pendentes = 0
+
+        for linha in linhas:
+            if not any(valor is not None and valor != '' for valor in linha):
+                linhas_vazias_pendentes += 1
+                continue
+
+            for _ in range(linhas_vazias_pendentes):
+                bloco.append(linha_vazia)
+                if len(bloco) == tamanho_bloco:
+                    yield nome_aba, _montar_bloco(colunas, bloco, inicio_bloco, tipos)
+                    inicio_bloco += len(bloco)
+                    bloco = []
+            linhas_vazias_pendentes = 0
+
+            bloco.append([_converter_celula_openpyxl(linha[i]) if i < len(linha) else '' for i in indices])
+            if len(bloco) == tamanho_bloco:
+                yield nome_aba, _montar_bloco(colunas, bloco, inicio_bloco, tipos)
+                inicio_bloco += len(bloco)
+                bloco = []
+
+        if bloco or inicio_bloco == 0:
+            yield nome_aba, _montar_bloco(colunas, bloco, inicio_bloco, tipos)
+
+
+def _montar_bloco(colunas, linhas, inicio, tipos):
+    '''Converte as linhas de um bloco em DataFrame (com o índice contando a partir do início da aba),
+    mantendo os tipos das colunas vistos nos blocos anteriores (`tipos` é atualizado)'''
+    indice = pd.RangeIndex(inicio, inicio + len(linhas))
+    if not colunas:
+        return pd.DataFrame(index=indice)
+
+    bloco = TextParser([colunas] + linhas, header=0, skip_blank_lines=False).read()
+    bloco.index = indice
+
+    for coluna in bloco.columns:
+        if not bloco[coluna].isna().all():
+            tipos.setdefault(coluna, bloco[coluna].dtype)
+            continue
+
+        # Coluna vazia neste bloco: fica com o tipo dos blocos anteriores se for de datas ou números, senão texto
+        tipo = tipos.get(coluna)
+        bloco[coluna] = bloco[coluna].astype(tipo if tipo is not None and tipo.kind in 'Mf' else object)
+
+    return bloco
+
+
+def concatenar_blocos(blocos):
+    """
+    Junta os blocos tratados de uma aba, como `pd.concat(blocos, ignore_index=True)`, mas coluna a coluna: cada
+    coluna sai dos blocos assim que entra no resultado. O pico de memória é o resultado mais uma coluna dos blocos,
+    e não o dobro do resultado (blocos inteiros e resultado ao mesmo tempo).
+
+    Args:
+        blocos (list): DataFrames com as mesmas colunas. A lista é esvaziada.
+
+    Returns:
+        pd.DataFrame: Os blocos juntos, com índice de 0 a n-1.
+    """
+    colunas = list(blocos[0].columns)
+    if len(set(colunas)) < len(colunas) or any(list(bloco.columns) != colunas for bloco in blocos):
+        df = pd.concat(blocos, ignore_index=True)
+        blocos.clear()
+        return df
+
+    df = pd.DataFrame(index=pd.RangeIndex(sum(len(bloco) for bloco in blocos)))
+    for coluna in colunas:
+        df[coluna] = pd.concat([bloco.pop(coluna) for bloco in blocos], ignore_index=True)
+    blocos.clear()
+
+    return df
+
+
+def listar_abas(arquivo):
+    '''Retorna os nomes das abas do Excel sem ler o conteúdo delas'''
+    if MOTOR_EXCEL != 'openpyxl':
+        try:
+            arquivo.seek(0)
+            return pd.ExcelFile(arquivo, engine=MOTOR_EXCEL).sheet_names
+        except Exception as e:
+            print(f'[ERRO listar_abas] - {MOTOR_EXCEL} não leu o arquivo, usando openpyxl: {e}')
+
+    arquivo.seek(0)
+    return pd.ExcelFile(arquivo, engine='openpyxl').sheet_names
+
+
+@cache_por_conteudo(versao='1')
+def ler_cabecalhos(arquivo):
+    '''Lê apenas a primeira linha (cabeçalho) de cada aba, em modo somente leitura, sem carregar os dados.
+    Retorna um dicionário {nome da aba: [nomes das colunas]}'''
+    workbook = load_workbook(arquivo, read_only=True, data_only=True)
+
+    try:
+        cabecalhos = {}
+        for sheet in workbook.worksheets:
+            sheet.reset_dimensions()
+            primeira_linha = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            cabecalhos[sheet.title] = [str(valor) for valor in primeira_linha if valor is not None]
+    finally:
+        workbook.close()
+
+    return cabecalhos
+
+
+def validar_planilha(arquivo, verificar_cabecalhos):
+    """
+    Valida o upload olhando só os nomes das abas e os cabeçalhos, antes de qualquer leitura pesada.
+
+    Args:
+        arquivo (BytesIO): Upload do arquivo Excel.
+        verificar_cabecalhos (callable): Recebe o dicionário {aba: [colunas]} de `ler_cabecalhos`
+            e retorna a lista de problemas encontrados.
+
+    Returns:
+        list[str]: Problemas encontrados. Vazia quando o arquivo está no formato esperado.
+    """
+    try:
+        cabecalhos = ler_cabecalhos(arquivo)
+    except Exception as e:
+        print(f'[ERRO validar_planilha] - {e}')
+        return ['O arquivo não é uma planilha Excel (.xlsx) válida.']
+
+    return verificar_cabecalhos(cabecalhos)
+
+
+def colunas_faltantes(nome_aba, colunas, esperadas):
+    '''Retorna o problema (em uma lista, para ser somado aos demais) se alguma coluna esperada não existir na aba'''
+    faltantes = [coluna for coluna in esperadas if coluna not in colunas]
+    if not faltantes:
+        return []
+
+    return [f'Aba "{nome_aba}": faltam as colunas {", ".join(repr(coluna) for coluna in faltantes)}.']
+
+
+def mensagem_validacao(nome_arquivo, problemas):
+    '''Monta a mensagem de erro exibida na página quando o upload não passa na validação'''
+    itens = '\n'.join(f'- {problema}' for problema in problemas)
+    return f'O arquivo "{nome_arquivo}" não está no formato esperado:\n\n{itens}'
+
+
+def converter_texto_livre(df, colunas):
+    '''Converte as colunas de texto livre para `TIPO_TEXTO_LIVRE`. Colunas com valores que não são texto
+    (ex.: datas ou números digitados no campo) continuam como object, para que os valores não mudem'''
+    for coluna in colunas:
+        if coluna in df.columns and df[coluna].dtype == object and pd.api.types.infer_dtype(df[coluna], skipna=True) in ('string', 'empty'):
+            df[coluna] = df[coluna].astype(TIPO_TEXTO_LIVRE)
+
+    return df
+
+
+def chave_ano(coluna):
+    '''Nome da coluna com o ano (inteiro) da coluna de data'''
+    return f'_ano {coluna}'
+
+
+def chave_mes(coluna):
+    '''Nome da coluna com o mês (inteiro, 1 a 12) da coluna de data'''
+    return f'_mes {coluna}'
+
+
+def chave_ano_mes(coluna):
+    '''Nome da coluna com o ano e o mês da coluna de data no formato ano * 100 + mês (ex.: 202403)'''
+    return f'_ano_mes {coluna}'
+
+
+def adicionar_chaves_calendario(df, colunas):
+    """
+    Adiciona, para cada coluna de data, as chaves inteiras de ano, mês e ano-mês usadas nos filtros das páginas.
+
+    Os filtros comparam esses inteiros, calculados uma vez na ingestão, em vez de extrair `.dt.year` e `.dt.month`
+    das datas a cada gráfico. Datas vazias ficam com 0, que não corresponde a nenhum ano ou mês dos filtros.
+
+    Args:
+        df (pd.DataFrame): Dados tratados. As colunas de data devem estar no tipo datetime.
+        colunas (list): Colunas de data filtráveis. As que não existirem no dataframe são ignoradas.
+
+    Returns:
+        pd.DataFrame: O próprio dataframe, com as colunas `chave_ano`, `chave_mes` e `chave_ano_mes` de cada data.
+    """
+    for coluna in colunas:
+        if coluna not in df.columns:
+            continue
+
+        ano = df[coluna].dt.year.fillna(0).astype('int16')
+        mes = df[coluna].dt.month.fillna(0).astype('int8')
+        df[chave_ano(coluna)] = ano
+        df[chave_mes(coluna)] = mes
+        df[chave_ano_mes(coluna)] = ano.astype('int32') * 100 + mes
+
+    return df
+
+
+def colunas_calendario(colunas):
+    '''Nomes das chaves de calendário das colunas de data, para acompanhar as datas quando só parte das colunas é selecionada'''
+    return [chave(coluna) for coluna in colunas for chave in (chave_ano, chave_mes, chave_ano_mes)]
+
+
+def remover_chaves_calendario(df):
+    '''Retorna o dataframe sem as chaves de calendário, para exibição e download'''
+    return df.drop(columns=[coluna for coluna in df.columns if str(coluna).startswith(PREFIXOS_CALENDARIO)])
+
+
+def ordenar_por_data(df, coluna):
+    """
+    Ordena o dataframe pela coluna de data principal dos filtros e marca a ordem em `df.attrs`.
+
+    Com a ordem marcada, `filtrar_periodo` encontra as linhas de um período por busca binária nas chaves de ano-mês.
+    Os filtros por máscara (estudo, setor...), `copy` e `rename` mantêm a ordem e o atributo. O atributo também
+    sobrevive a operações que desfazem a ordem (`pd.concat`, `sort_values` por outra coluna, Parquet), então a
+    busca binária só é usada depois de conferir que as chaves continuam em ordem (`_chaves_em_ordem`).
+
+    Args:
+        df (pd.DataFrame): Dados tratados, já com as chaves de calendário da coluna (`adicionar_chaves_calendario`).
+        coluna (str): Coluna de data. As datas vazias (chaves 0) ficam no início.
+
+    Returns:
+        pd.DataFrame: Novo dataframe ordenado, com `df.attrs[ATRIBUTO_ORDEM_DATA] = coluna`.
+    """
+    if coluna not in df.columns:
+        return df
+
+    df = df.sort_values(coluna, na_position='first', kind='stable')
+    df.attrs[ATRIBUTO_ORDEM_DATA] = coluna
+
+    return df
+
+
+def _intervalos_ano_mes(anos, meses):
+    '''Agrupa os pares (ano, mês) em intervalos contínuos de chaves ano-mês, ex.: 2024 e 2025 com meses 11, 12, 1 e 2 → [(202401, 202402), (202411, 202502), (202511, 202512)]'''
+    intervalos = []
+    for ano in sorted({int(ano) for ano in anos}):
+        for mes in sorted({int(mes) for mes in meses}):
+            chave = ano * 100 + mes
+            if intervalos:
+                inicio, fim = intervalos[-1]
+                seguinte = fim + 1 if fim % 100 < 12 else (fim // 100 + 1) * 100 + 1
+                if chave == seguinte:
+                    intervalos[-1] = (inicio, chave)
+                    continue
+            intervalos.append((chave, chave))
+
+    return intervalos
+
+
+_lock_ordens = threading.Lock()
+# id do array com as chaves ano-mês: (referência fraca ao array, {(endereço, passos, tamanho): em ordem})
+_ordens_conferidas = {}
+
+
+def _esquecer_ordens(referencia, id_array):
+    with _lock_ordens:
+        if _ordens_conferidas.get(id_array, (None,))[0] is referencia:
+            del _ordens_conferidas[id_array]
+
+
+def _chaves_em_ordem(chaves):
+    '''Confere se as chaves ano-mês estão em ordem crescente. O resultado fica guardado para a mesma memória das
+    chaves (o array de origem, que também vale para as fatias dele), enquanto ela existir. As chaves de calendário
+    só são criadas por `adicionar_chaves_calendario`, nunca alteradas no lugar'''
+    base = chaves
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    trecho = (chaves.__array_interface__['data'][0], chaves.strides, len(chaves))
+
+    with _lock_ordens:
+        conferida = _ordens_conferidas.get(id(base))
+        if conferida is not None and conferida[0]() is base and trecho in conferida[1]:
+            return conferida[1][trecho]
+
+    em_ordem = bool(np.all(chaves[:-1] <= chaves[1:]))
+
+    with _lock_ordens:
+        conferida = _ordens_conferidas.get(id(base))
+        if conferida is None or conferida[0]() is not base:
+            conferida = (weakref.ref(base, functools.partial(_esquecer_ordens, id_array=id(base))), {})
+            _ordens_conferidas[id(base)] = conferida
+        conferida[1][trecho] = em_ordem
+
+    return em_ordem
+
+
+def linhas_do_periodo(df, coluna, anos=None, meses=None):
+    """
+    Linhas cuja data `coluna` está nos anos e meses selecionados, pelas chaves de calendário.
+
+    Se o dataframe está ordenado pela coluna (`ordenar_por_data`, com as chaves conferidas em `_chaves_em_ordem`),
+    cada intervalo contínuo de meses vira uma fatia de linhas, com os limites encontrados por busca binária nas
+    chaves ano-mês: o custo depende do número de intervalos, não do número de linhas. Nos demais dataframes,
+    compara as chaves de ano e mês com `isin`.
+
+    Args:
+        df (pd.DataFrame): Dados com as chaves de calendário da coluna.
+        coluna (str): Coluna de data do filtro.
+        anos (list, optional): Anos selecionados. Vazio ou None não filtra por ano.
+        meses (list, optional): Meses selecionados (1 a 12). Vazio ou None não filtra por mês.
+
+    Returns:
+        slice | np.ndarray | None: Fatia, posições ou máscara booleana das linhas, para `df.iloc`.
+        None se não há filtro de período.
+    """
+    if not anos and not meses:
+        return None
+
+    chaves = df[chave_ano_mes(coluna)].to_numpy() if df.attrs.get(ATRIBUTO_ORDEM_DATA) == coluna else None
+
+    if chaves is None or not _chaves_em_ordem(chaves):
+        mascara = np.ones(len(df), dtype=bool)
+        if anos:
+            mascara &= df[chave_ano(coluna)].isin(anos).to_numpy()
+        if meses:
+            mascara &= df[chave_mes(coluna)].isin(meses).to_numpy()
+        return mascara
+
+    if not anos:
+        # Todos os anos com data: do primeiro ao último, sem as datas vazias (chave 0) do início
+        primeira = np.searchsorted(chaves, 1)
+        if primeira == len(chaves):
+            return slice(0, 0)
+        anos = range(int(chaves[primeira]) // 100, int(chaves[-1]) // 100 + 1)
+
+    meses = [mes for mes in meses if 1 <= mes <= 12] if meses else range(1, 13)
+
+    fatias = [(np.searchsorted(chaves, inicio, side='left'), np.searchsorted(chaves, fim, side='right'))
+              for inicio, fim in _intervalos_ano_mes(anos, meses)]
+    fatias = [(inicio, fim) for inicio, fim in fatias if inicio < fim]
+
+    if len(fatias) == 1:
+        return slice(int(fatias[0][0]), int(fatias[0][1]))
+
+    return np.concatenate([np.arange(inicio, fim) for inicio, fim in fatias] or [np.array([], dtype=int)])
+
+
+def filtrar_periodo(df, coluna, anos=None, meses=None):
+    """
+    Filtra as linhas cuja data `coluna` está nos anos e meses selecionados (ver `linhas_do_periodo`).
+
+    Args:
+        df (pd.DataFrame): Dados com as chaves de calendário da coluna.
+        coluna (str): Coluna de data do filtro.
+        anos (list, optional): Anos selecionados. Vazio ou None não filtra por ano.
+        meses (list, optional): Meses selecionados (1 a 12). Vazio ou None não filtra por mês.
+
+    Returns:
+        pd.DataFrame: As linhas do período, na ordem do dataframe original. Com filtro, é sempre um novo dataframe
+        (a fatia do dataframe ordenado é copiada, para que alterá-la não altere a origem).
+    """
+    linhas = linhas_do_periodo(df, coluna, anos, meses)
+    if linhas is None:
+        return df
+    if isinstance(linhas, slice):
+        return df.iloc[linhas].copy()
+
+    return df.iloc[linhas]
+
+
+def _projetar_abas(abas_linhas, converter_celula, selecionar_coluna):
+    '''Monta os dataframes só com as colunas selecionadas de cada aba'''
+    abas = {}
+    for nome_aba, linhas in abas_linhas:
+        linhas = iter(linhas)
+
+        # Como no pandas, a primeira linha é o cabeçalho e as linhas vazias no fim da aba são descartadas
+        cabecalho = [converter_celula(valor) for valor in next(linhas, ())]
+        indices = [i for i, coluna in enumerate(cabecalho) if coluna != '' and selecionar_coluna(nome_aba, coluna)]
+
+        dados = [[cabecalho[i] for i in indices]]
+        ultima_linha_com_dados = 0
+        for linha in linhas:
+            dados.append([converter_celula(linha[i]) if i < len(linha) else '' for i in indices])
+            if any(valor is not None and valor != '' for valor in linha):
+                ultima_linha_com_dados = len(dados) - 1
+        del dados[ultima_linha_com_dados + 1:]
+
+        if not indices:
+            abas[nome_aba] = pd.DataFrame(index=pd.RangeIndex(len(dados) - 1))
+        else:
+            abas[nome_aba] = TextParser(dados, header=0, skip_blank_lines=False).read()
+
+    return abas
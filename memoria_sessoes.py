@@ -0,0 +1,478 @@
+import os
+import pickle
+import shutil
+import threading
+import time
+import weakref
+
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Sem API pública para ler as outras sessões, `_sessoes` usa partes internas do Streamlit, conferidas na versão
+# fixada no requirements.txt. Se elas mudarem, só a sessão atual é considerada (veja `erro_leitura_sessoes`)
+try:
+    from streamlit.runtime.app_session import AppSessionState
+except ImportError:
+    AppSessionState = None
+
+import snapshots
+from leitor_planilhas import cache_abas, cache_planilhas, registro_dados
+
+
+# Chaves do `st.session_state` com os dados carregados pelas páginas
+CHAVES_DADOS = ['dfs', 'plan_desvio', 'plan_calc_tempos', 'dados_tab_qual_coord', 'dados_qualidade', 'dados_regulatorio',
+                'dados_esteira', 'df_tempos', 'df_taxas']
+
+# Profundidade máxima percorrida dentro de cada valor (dicionários, listas e objetos das páginas)
+PROFUNDIDADE_MAXIMA = 6
+
+# Limites padrão (em MB) da memória ocupada pelos dados do `st.session_state`, em cada sessão e no servidor inteiro.
+# Acima deles, os dados usados há mais tempo são descarregados para o disco (`PASTA_DESCARREGADOS`) e
+# carregados de volta quando uma página que os usa é aberta de novo. Podem ser trocados na seção [memoria]
+# do `st.secrets`, com as mesmas chaves (veja `limites_memoria`)
+LIMITE_MEMORIA_SESSAO_MB = 1024
+LIMITE_MEMORIA_TOTAL_MB = 4096
+
+# Pasta dos dados descarregados: descarregados/<sessão>/<chave>-<n>/ (um Parquet comprimido por DataFrame)
+PASTA_DESCARREGADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'descarregados')
+
+_lock_memoria = threading.Lock()
+# (sessão, chave): momento do último uso dos dados (`time.monotonic`)
+_ultimos_usos = {}
+# sessão: chaves usadas pela última página aberta nela
+_chaves_em_uso = {}
+# (sessão, chave): (referências fracas aos DataFrames, forma de cada um, bytes), para só medir de novo os dados que mudaram
+_tamanhos = {}
+# sessão: chaves que outra sessão marcou para descarregar. Cada sessão só altera o próprio `st.session_state`:
+# as chaves marcadas são descarregadas por ela mesma, na próxima chamada de `usar_dados`
+_marcados = {}
+_pasta_descarregados_limpa = False
+# Motivo pelo qual as outras sessões não puderam ser lidas (None enquanto a leitura funciona)
+_erro_sessoes = None
+
+
+class DadosDescarregados():
+    '''Fica no `st.session_state` no lugar dos dados descarregados para o disco, até que eles sejam carregados de volta.
+    `chave_registro` é a chave dos dados no registro compartilhado (`registro_dados`), se vieram dele'''
+    def __init__(self, pasta, tamanho, chave_registro=None):
+        self.pasta = pasta
+        self.tamanho = tamanho
+        self.chave_registro = chave_registro
+        # Os arquivos são apagados quando os dados voltam para a memória ou quando a sessão é encerrada
+        self._apagar_arquivos = weakref.finalize(self, shutil.rmtree, pasta, True)
+
+
+    def carregar(self, id_sessao=None):
+        '''Dados de volta na memória. Os que vieram do registro voltam para ele: se outra sessão abriu a mesma
+        planilha enquanto eles estavam no disco, a sessão recebe os dados dela, sem uma segunda cópia'''
+        valor = registro_dados.obter(self.chave_registro, id_sessao) if self.chave_registro is not None else None
+        if valor is None:
+            with open(os.path.join(self.pasta, 'dados.pkl'), 'rb') as f:
+                valor = _Carregador(f, self.pasta).load()
+
+            if self.chave_registro is not None:
+                valor = registro_dados.registrar(self.chave_registro, valor, id_sessao)
+
+        self._apagar_arquivos()
+        return valor
+
+
+class _Descarregador(pickle.Pickler):
+    '''Serializa os dados gravando cada DataFrame à parte, em Parquet comprimido (`snapshots.salvar_tabela`)'''
+    def __init__(self, arquivo, pasta):
+        super().__init__(arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self.pasta = pasta
+        self.tabelas = {}
+
+
+    def persistent_id(self, obj):
+        if type(obj) is not pd.DataFrame:
+            return None
+
+        # O mesmo DataFrame em dois lugares é gravado uma vez só
+        if id(obj) not in self.tabelas:
+            nome_arquivo = f'{len(self.tabelas)}.parquet'
+            serializadas = snapshots.salvar_tabela(obj, os.path.join(self.pasta, nome_arquivo), compressao='zstd')
+            self.tabelas[id(obj)] = (obj, (nome_arquivo, serializadas))
+
+        return self.tabelas[id(obj)][1]
+
+
+class _Carregador(pickle.Unpickler):
+    def __init__(self, arquivo, pasta):
+        super().__init__(arquivo)
+        self.pasta = pasta
+        self.tabelas = {}
+
+
+    def persistent_load(self, pid):
+        nome_arquivo, serializadas = pid
+        if nome_arquivo not in self.tabelas:
+            self.tabelas[nome_arquivo] = snapshots.abrir_tabela(os.path.join(self.pasta, nome_arquivo), serializadas)
+
+        return self.tabelas[nome_arquivo]
+
+
+def _sessoes():
+    '''Lista de tuplas (id da sessão, estado, em execução) das sessões mantidas pelo servidor, inclusive as
+    desconectadas cujo estado ainda não foi descartado. Fora do servidor do Streamlit (ex.: testes), ou se as partes
+    internas do Streamlit usadas aqui mudaram, só a sessão atual'''
+    global _erro_sessoes
+
+    sessao_atual = [(_id_sessao_atual(), st.session_state, True)]
+    if not runtime.exists():
+        return sessao_atual
+
+    # O Streamlit não tem uma API pública para ler o estado das outras sessões
+    try:
+        if AppSessionState is None:
+            raise ImportError('streamlit.runtime.app_session.AppSessionState')
+
+        sessoes = []
+        for info in runtime.get_instance()._session_mgr.list_sessions():
+            sessao = info.session
+            sessoes.append((sessao.id, sessao.session_state, sessao._state != AppSessionState.APP_NOT_RUNNING))
+
+    except (AttributeError, ImportError, TypeError) as e:
+        if _erro_sessoes is None:
+            print(f'[ERRO _sessoes] - Streamlit {st.__version__}: não foi possível ler as outras sessões: {e!r}')
+        _erro_sessoes = f'{type(e).__name__}: {e}'
+        return sessao_atual
+
+    _erro_sessoes = None
+    return sessoes
+
+
+def erro_leitura_sessoes():
+    '''Motivo pelo qual as outras sessões não puderam ser lidas na última tentativa (ex.: o Streamlit foi atualizado
+    e mudou as partes internas usadas em `_sessoes`), ou None. Enquanto houver erro, o painel de memória e os limites
+    de memória (`aplicar_limites`) consideram só a sessão atual'''
+    return _erro_sessoes
+
+
+def _id_sessao_atual():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else 'sessão atual'
+
+
+def _valor(estado, chave):
+    return estado[chave] if chave in estado else None
+
+
+def sessoes_ativas():
+    '''Lista de tuplas (id da sessão, estado) de todas as sessões mantidas pelo servidor'''
+    return [(id_sessao, {chave: _valor(estado, chave) for chave in CHAVES_DADOS + ['setor']}) for id_sessao, estado, _ in _sessoes()]
+
+
+def dataframes(valor, caminho, profundidade=0):
+    """
+    Percorre um valor do `st.session_state` e encontra os DataFrames e Series guardados nele.
+
+    Entra em dicionários, listas, tuplas e nos objetos definidos nas páginas (ex.: `DadosScreening`),
+    sem entrar nos objetos do Streamlit, do pandas ou de outras bibliotecas.
+
+    Args:
+        valor: Valor guardado no `st.session_state`.
+        caminho (str): Nome do valor (ex.: 'dfs'). Os itens internos recebem o caminho com '.' (ex.: 'dfs.tcles.tcle').
+        profundidade (int): Nível atual (uso interno).
+
+    Returns:
+        Iterador de tuplas (caminho, DataFrame ou Series).
+    """
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        yield caminho, valor
+        return
+
+    if profundidade >= PROFUNDIDADE_MAXIMA:
+        return
+
+    if isinstance(valor, dict):
+        itens = valor.items()
+    elif isinstance(valor, (list, tuple)):
+        itens = enumerate(valor)
+    elif hasattr(valor, '__dict__') and type(valor).__module__.startswith('assets.'):
+        itens = vars(valor).items()
+    else:
+        return
+
+    for chave, item in itens:
+        yield from dataframes(item, f'{caminho}.{chave}', profundidade + 1)
+
+
+def memoria_colunas(dados):
+    '''Memória (em bytes) do índice e de cada coluna, contando o conteúdo dos textos (`deep=True`)'''
+    if isinstance(dados, pd.Series):
+        return pd.Series({'Index': dados.index.memory_usage(deep=True), dados.name: dados.memory_usage(index=False, deep=True)})
+
+    return dados.memory_usage(index=True, deep=True)
+
+
+def relatorio_memoria():
+    """
+    Mede a memória dos dados de todas as sessões conectadas.
+
+    O total do servidor conta cada DataFrame uma vez só, mesmo que ele esteja em mais de uma sessão
+    (ex.: a mesma planilha no `registro_dados`), e inclui os caches de planilhas e de abas
+    (`cache_planilhas` e `cache_abas`). DataFrames diferentes que compartilham os mesmos
+    dados (ex.: fatias sem cópia) são contados separadamente, então o total é um limite superior.
+    Os dados descarregados para o disco (`aplicar_limites`) aparecem com o Local 'disco' e não entram no total.
+    A coluna Sessões diz em quantas sessões está o mesmo DataFrame.
+
+    Returns:
+        tuple: DataFrame por conjunto de dados (Sessão, Setor, Dados, Local, Sessões, Linhas, Colunas, MB),
+        DataFrame por coluna (Sessão, Dados, Coluna, Tipo, MB) e o total do servidor, em MB.
+    """
+    linhas_dados = []
+    linhas_colunas = []
+    medidos = {}
+    sessoes_por_dados = {}
+    linhas_em_memoria = []
+
+    for id_sessao, estado in sessoes_ativas():
+        setor = estado.get('setor')
+        for chave in CHAVES_DADOS:
+            valor = estado.get(chave)
+            if isinstance(valor, DadosDescarregados):
+                linhas_dados.append({'Sessão': id_sessao, 'Setor': setor, 'Dados': chave, 'Local': 'disco', 'MB': valor.tamanho / 1024 ** 2})
+                continue
+
+            for caminho, dados in dataframes(valor, chave):
+                memoria = memoria_colunas(dados)
+                medidos[id(dados)] = memoria.sum()
+                sessoes_por_dados.setdefault(id(dados), set()).add(id_sessao)
+
+                linha = {
+                    'Sessão': id_sessao,
+                    'Setor': setor,
+                    'Dados': caminho,
+                    'Local': 'memória',
+                    'Linhas': len(dados),
+                    'Colunas': dados.shape[1] if isinstance(dados, pd.DataFrame) else 1,
+                    'MB': memoria.sum() / 1024 ** 2,
+                }
+                linhas_dados.append(linha)
+                linhas_em_memoria.append((linha, id(dados)))
+
+                tipos = dados.dtypes if isinstance(dados, pd.DataFrame) else pd.Series({dados.name: dados.dtype})
+                for coluna, bytes_coluna in memoria.items():
+                    linhas_colunas.append({
+                        'Sessão': id_sessao,
+                        'Dados': caminho,
+                        'Coluna': str(coluna),
+                        'Tipo': 'índice' if coluna == 'Index' else str(tipos[coluna]),
+                        'MB': bytes_coluna / 1024 ** 2,
+                    })
+
+    for linha, id_dados in linhas_em_memoria:
+        linha['Sessões'] = len(sessoes_por_dados[id_dados])
+
+    por_dados = pd.DataFrame(linhas_dados, columns=['Sessão', 'Setor', 'Dados', 'Local', 'Sessões', 'Linhas', 'Colunas', 'MB'])
+    por_coluna = pd.DataFrame(linhas_colunas, columns=['Sessão', 'Dados', 'Coluna', 'Tipo', 'MB'])
+    total = (sum(medidos.values()) + memoria_caches()) / 1024 ** 2
+
+    return por_dados.sort_values('MB', ascending=False), por_coluna.sort_values('MB', ascending=False), total
+
+
+def memoria_caches():
+    '''Memória (em bytes) dos caches de planilhas e de abas tratadas, que ficam fora das sessões'''
+    return cache_planilhas.memoria() + cache_abas.memoria()
+
+
+def limites_memoria():
+    '''Limites (em MB) por sessão e do servidor: os da seção [memoria] do `st.secrets`, se definidos, senão os padrões'''
+    configurados = st.secrets.get('memoria', {})
+    return (configurados.get('LIMITE_MEMORIA_SESSAO_MB', LIMITE_MEMORIA_SESSAO_MB),
+            configurados.get('LIMITE_MEMORIA_TOTAL_MB', LIMITE_MEMORIA_TOTAL_MB))
+
+
+def _forma(dados):
+    '''Linhas, colunas e tipos do DataFrame (ou Series): se mudarem, a memória é medida de novo'''
+    if isinstance(dados, pd.Series):
+        return len(dados), (dados.name,), (str(dados.dtype),)
+    return len(dados), tuple(dados.columns), tuple(str(tipo) for tipo in dados.dtypes)
+
+
+def _tamanho(id_sessao, chave, valor):
+    '''Ids dos DataFrames do valor e a memória (em bytes) deles. Só é medida de novo quando os DataFrames mudam:
+    outros objetos (as referências fracas evitam confundir um DataFrame novo com um já descartado que tinha o
+    mesmo id) ou os mesmos com outras linhas, colunas ou tipos'''
+    encontrados = [dados for _, dados in dataframes(valor, chave)]
+    formas = tuple(_forma(dados) for dados in encontrados)
+
+    medido = _tamanhos.get((id_sessao, chave))
+    mesmos_dados = (medido is not None and len(medido[0]) == len(encontrados)
+                    and all(referencia() is dados for referencia, dados in zip(medido[0], encontrados)))
+    if not mesmos_dados or medido[1] != formas:
+        medido = (tuple(weakref.ref(dados) for dados in encontrados), formas,
+                  sum(memoria_colunas(dados).sum() for dados in encontrados))
+        _tamanhos[(id_sessao, chave)] = medido
+
+    return tuple(id(dados) for dados in encontrados), medido[2]
+
+
+def _limpar_pasta_descarregados():
+    '''Na primeira vez, apaga os dados descarregados antes de o servidor reiniciar (as sessões deles não existem mais)'''
+    global _pasta_descarregados_limpa
+
+    if not _pasta_descarregados_limpa:
+        shutil.rmtree(PASTA_DESCARREGADOS, ignore_errors=True)
+        _pasta_descarregados_limpa = True
+
+
+def descarregar(id_sessao, estado, chave, tamanho):
+    '''Grava os dados da chave no disco e os substitui, no estado da sessão, por `DadosDescarregados`. A sessão
+    deixa de contar entre as usuárias deles no registro compartilhado (`atualizar_registro`): sem outra sessão,
+    eles saem da memória. Retorna False (e os dados continuam na memória) se não foi possível gravá-los'''
+    pasta = os.path.join(PASTA_DESCARREGADOS, id_sessao, f'{chave}-{time.time_ns()}')
+    try:
+        os.makedirs(pasta)
+        with open(os.path.join(pasta, 'dados.pkl'), 'wb') as f:
+            _Descarregador(f, pasta).dump(estado[chave])
+    except Exception as e:
+        print(f'[ERRO descarregar] - {chave}: {e}')
+        shutil.rmtree(pasta, ignore_errors=True)
+        return False
+
+    estado[chave] = DadosDescarregados(pasta, tamanho, registro_dados.chave_de(estado[chave]))
+    _tamanhos.pop((id_sessao, chave), None)
+    atualizar_registro(id_sessao, estado)
+    return True
+
+
+def atualizar_registro(id_sessao, estado):
+    '''Libera, no registro compartilhado (`registro_dados`), os dados que a sessão recebeu mas não guarda mais
+    (ex.: trocou de planilha ou os dados foram descarregados para o disco)'''
+    ids_sessao = {id(dados) for chave in CHAVES_DADOS for _, dados in dataframes(_valor(estado, chave), chave)}
+
+    for chave_registro, dados_registro, sessoes in registro_dados.entradas():
+        if id_sessao not in sessoes:
+            continue
+
+        if not any(id(dados) in ids_sessao for _, dados in dataframes(dados_registro, 'registro')):
+            registro_dados.liberar(chave_registro, id_sessao)
+
+
+def aplicar_limites():
+    """
+    Escolhe os dados usados há mais tempo (LRU), de qualquer sessão, até que cada sessão fique abaixo do limite
+    por sessão e o servidor abaixo do limite total (`limites_memoria`).
+
+    O total do servidor inclui os caches de abas e de planilhas (`memoria_caches`). Acima do limite total,
+    eles são esvaziados primeiro (as abas usadas há mais tempo antes), porque podem ser tratados de novo
+    sem tirar nada das sessões. Como o registro compartilhado é o único dono das planilhas tratadas, os
+    dados descarregados de uma sessão saem mesmo da memória (`descarregar`).
+
+    Só os dados da sessão atual são descarregados para o disco aqui: o `st.session_state` das outras sessões
+    pode estar sendo usado pelas páginas delas ao mesmo tempo. Os dados escolhidos nas outras sessões são só
+    marcados (`_marcados`), e cada uma os descarrega na próxima vez que chamar `usar_dados`.
+
+    Os dados da página que está em execução em cada sessão nunca são escolhidos. Os dados compartilhados
+    com outra sessão (`registro_dados`) também não: descarregá-los não liberaria memória.
+
+    Returns:
+        list: Tuplas (sessão, chave) dos dados descarregados ou marcados para descarregar.
+    """
+    _limpar_pasta_descarregados()
+
+    limite_sessao_mb, limite_total_mb = limites_memoria()
+    id_sessao_atual = _id_sessao_atual()
+    sessoes = _sessoes()
+    memoria_sessao = {}
+    # ids dos DataFrames: sessões que os guardam
+    sessoes_por_dados = {}
+    # ids dos DataFrames de cada valor: tamanho, para que os dados compartilhados contem uma vez só no total
+    tamanhos_valores = {}
+    candidatos = []
+    for id_sessao, estado, em_execucao in sessoes:
+        em_uso = _chaves_em_uso.get(id_sessao, []) if em_execucao else []
+        memoria_sessao[id_sessao] = 0
+        for chave in CHAVES_DADOS:
+            valor = _valor(estado, chave)
+            if valor is None or isinstance(valor, DadosDescarregados):
+                continue
+
+            ids, tamanho = _tamanho(id_sessao, chave, valor)
+            memoria_sessao[id_sessao] += tamanho
+            tamanhos_valores[ids] = tamanho
+            for id_dados in ids:
+                sessoes_por_dados.setdefault(id_dados, set()).add(id_sessao)
+
+            if chave not in em_uso:
+                candidatos.append((_ultimos_usos.get((id_sessao, chave), 0), id_sessao, estado, chave, ids, tamanho))
+
+    memoria_total = sum(tamanhos_valores.values()) + memoria_caches()
+    for cache in [cache_abas, cache_planilhas]:
+        excesso = memoria_total - limite_total_mb * 1024 ** 2
+        if excesso > 0:
+            memoria_total -= cache.liberar_memoria(excesso)
+
+    descarregados = []
+    for _, id_sessao, estado, chave, ids, tamanho in sorted(candidatos, key=lambda candidato: candidato[0]):
+        if any(len(sessoes_por_dados[id_dados]) > 1 for id_dados in ids):
+            continue
+
+        acima_sessao = memoria_sessao[id_sessao] > limite_sessao_mb * 1024 ** 2
+        acima_total = memoria_total > limite_total_mb * 1024 ** 2
+        if not (acima_sessao or acima_total):
+            continue
+
+        if id_sessao != id_sessao_atual:
+            _marcados.setdefault(id_sessao, set()).add(chave)
+        elif not descarregar(id_sessao, estado, chave, tamanho):
+            continue
+
+        memoria_sessao[id_sessao] -= tamanho
+        memoria_total -= tamanho
+        descarregados.append((id_sessao, chave))
+
+    # Esquece as sessões que já foram encerradas
+    existentes = set(memoria_sessao)
+    for registro in [_ultimos_usos, _tamanhos]:
+        for id_sessao, chave in [item for item in registro if item[0] not in existentes]:
+            del registro[(id_sessao, chave)]
+    for registro in [_chaves_em_uso, _marcados]:
+        for id_sessao in [id_sessao for id_sessao in registro if id_sessao not in existentes]:
+            del registro[id_sessao]
+    for chave_registro, _, sessoes_registro in registro_dados.entradas():
+        for id_sessao in sessoes_registro - existentes:
+            registro_dados.liberar(chave_registro, id_sessao)
+
+    return descarregados
+
+
+def usar_dados(chaves):
+    """
+    Deve ser chamada no início das páginas, antes de ler os dados do `st.session_state` (veja `ChecarAutenticacao`).
+
+    Carrega de volta os dados da página que foram descarregados para o disco, descarrega os dados que outra sessão
+    marcou (e que a página não usa), libera no registro compartilhado os dados que a sessão não guarda mais
+    (`atualizar_registro`) e, em seguida, aplica os limites de memória (`aplicar_limites`).
+
+    Args:
+        chaves (list): Chaves do `st.session_state` usadas pela página.
+    """
+    id_sessao = _id_sessao_atual()
+
+    with _lock_memoria:
+        for chave in chaves:
+            valor = st.session_state.get(chave)
+            if isinstance(valor, DadosDescarregados):
+                try:
+                    st.session_state[chave] = valor.carregar(id_sessao)
+                except Exception as e:
+                    # Sem os dados, a página volta a pedir o upload (ou oferece o snapshot)
+                    print(f'[ERRO usar_dados] - {chave}: {e}')
+                    st.session_state[chave] = None
+
+            _ultimos_usos[(id_sessao, chave)] = time.monotonic()
+
+        for chave in _marcados.pop(id_sessao, set()) - set(chaves):
+            valor = st.session_state.get(chave)
+            if valor is not None and not isinstance(valor, DadosDescarregados):
+                descarregar(id_sessao, st.session_state, chave, _tamanho(id_sessao, chave, valor)[1])
+
+        _chaves_em_uso[id_sessao] = list(chaves)
+        atualizar_registro(id_sessao, st.session_state)
+        aplicar_limites()
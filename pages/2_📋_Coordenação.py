@@ -5,15 +5,22 @@ import assets.Coordenacao.Coord_Charts as c_charts
 import os
 from checar_login import ChecarAutenticacao
 from progress_bar import ProgressBar
+from leitor_planilhas import compartilhar_derivado, mensagem_validacao, remover_chaves_calendario
+import filtros
+import snapshots
+import espelho_planilhas
 
 
 url_tabela_qual_coord = st.secrets['urls']["PLAN_QUAL_COORD"]
 url_plan_desv = st.secrets['urls']["PLAN_DESV"]
 
+# Dados da aba de desvios mantidos no session_state (e salvos no snapshot)
+CHAVES_DESVIOS = ['plan_desvio', 'plan_calc_tempos', 'regist_apag']
+
 
 class Coordenacao():
     def __init__(self):
-        ChecarAutenticacao()
+        ChecarAutenticacao(CHAVES_DESVIOS + ['dados_tab_qual_coord'])
         
         if 'setor' not in st.session_state:
             st.switch_page('1_🏠_Homepage.py')
@@ -84,10 +91,7 @@ class Coordenacao():
 
 # Tab1
     def grafs_desvio_p_categoria(self):
-        bar_chart_count_por_categoria = c_charts.bar_chart_count_por_categoria(dataframe=self.df, anos=self.anos, 
-                                                                                meses=self.meses, estudos=self.estudos, 
-                                                                                categoria_selecionada=self.categorias,
-                                                                                setor_selecionado=self.setores)
+        bar_chart_count_por_categoria = c_charts.bar_chart_count_por_categoria(self.df_desvios)
         if bar_chart_count_por_categoria != None:
             st.plotly_chart(bar_chart_count_por_categoria)
         else:
@@ -96,9 +100,7 @@ class Coordenacao():
 
 
     def grafs_desvio_p_setor(self):
-        bar_chart_desvios = c_charts.bar_chart_desvios(dataframe=self.df, anos=self.anos, meses=self.meses,
-                                                        estudos=self.estudos, categoria_selecionada=self.categorias, 
-                                                        setor_selecionado=self.setores)
+        bar_chart_desvios = c_charts.bar_chart_desvios(self.df_desvios)
         if bar_chart_desvios != None:
             st.plotly_chart(bar_chart_desvios)
         else:
@@ -125,10 +127,7 @@ class Coordenacao():
 
 
     def grafs_desvio_p_estudo(self):
-        bar_chart_desvios_por_estudo = c_charts.bar_chart_desvios_por_estudo(dataframe=self.df, anos=self.anos, 
-                                                                                meses=self.meses, estudos=self.estudos, 
-                                                                                categoria_selecionada=self.categorias,
-                                                                                setor_selecionado=self.setores)
+        bar_chart_desvios_por_estudo = c_charts.bar_chart_desvios_por_estudo(self.df_desvios)
         if bar_chart_desvios_por_estudo != None:
             st.plotly_chart(bar_chart_desvios_por_estudo)
         else:
@@ -137,10 +136,7 @@ class Coordenacao():
 
 
     def grafs_desv_viol(self):
-        donut_chart_desv_viol = c_charts.donut_chart_desv_viol(dataframe=self.df, anos=self.anos,
-                                       meses=self.meses, estudos=self.estudos, 
-                                       categoria_selecionada=self.categorias,
-                                       setor_selecionado=self.setores)
+        donut_chart_desv_viol = c_charts.donut_chart_desv_viol(self.df_desvios)
 
         if donut_chart_desv_viol != None:
             st.plotly_chart(donut_chart_desv_viol)
@@ -150,10 +146,7 @@ class Coordenacao():
 
 
     def grafs_justificavel(self):
-        donut_chart_just = c_charts.donut_chart_just(dataframe=self.df, anos=self.anos,
-                                       meses=self.meses, estudos=self.estudos, 
-                                       categoria_selecionada=self.categorias,
-                                       setor_selecionado=self.setores)
+        donut_chart_just = c_charts.donut_chart_just(self.df_desvios)
 
         if donut_chart_just != None:
             st.plotly_chart(donut_chart_just)
@@ -163,9 +156,7 @@ class Coordenacao():
 
 
     def grafs_preju_pct(self):
-        donut_chart_prejuizos = c_charts.donut_chart_prejuizos(dataframe=self.df, anos=self.anos, meses=self.meses, 
-                                                            estudos=self.estudos, categoria_selecionada=self.categorias,
-                                                            setor_selecionado=self.setores)
+        donut_chart_prejuizos = c_charts.donut_chart_prejuizos(self.df_desvios)
         if donut_chart_prejuizos != None:
             st.plotly_chart(donut_chart_prejuizos)
         else:
@@ -184,7 +175,7 @@ class Coordenacao():
             st.info('Estes gráficos são afetados por filtros de tempo, somente.')
             
             with st.expander('Ver planilha'):
-                st.write(st.session_state['dados_tab_qual_coord'])
+                st.write(remover_chaves_calendario(st.session_state['dados_tab_qual_coord']))
                 st.info('Você pode fazer o download da tabela passando o mouse em cima e clicando na setinha ↓')
             
         else:
@@ -224,28 +215,45 @@ class Coordenacao():
 # Conteúdo tabs
     def tab1(self):
         arquivo = st.file_uploader('Faça upload da planilha de desvios!', type='xlsx', key='plandesvio', help='Faça download da planilha e insira-a aqui!')
+        if arquivo:
+            espelho_planilhas.descartar_espelho('coordenacao_desvios', CHAVES_DESVIOS)
+        else:
+            arquivos_espelho = espelho_planilhas.oferecer_espelho('coordenacao_desvios', ['PLAN_DESV'])
+            arquivo = arquivos_espelho[0] if arquivos_espelho else None
+
+        if arquivo:
+            snapshots.descartar_snapshot('coordenacao_desvios', CHAVES_DESVIOS)
+
         if not arquivo:
             st.link_button('Planilha de desvios', url=url_plan_desv)
-            st.session_state['plan_desvio'] = None
-            st.session_state['plan_calc_tempos'] = None
-            st.session_state['regist_apag'] = None
+            if not snapshots.oferecer_snapshot('coordenacao_desvios', c_treats.process_excel_file.versao, CHAVES_DESVIOS):
+                st.session_state['plan_desvio'] = None
+                st.session_state['plan_calc_tempos'] = None
+                st.session_state['regist_apag'] = None
 
         elif st.session_state['plan_desvio'] is None:
-            try:
-                barra = ProgressBar()
-                barra.iniciar_carregamento()
-                st.session_state['plan_desvio'] = c_treats.process_excel_file(arquivo)
-                st.session_state['regist_apag'], st.session_state['plan_calc_tempos'] = c_treats.gerar_calculo_tempos(st.session_state['plan_desvio'])
-                barra.finalizar_carregamento(emoji='🚀')
-            except Exception as e:
-                print(f'[ERRO] Processamento de arquivo Coordenacao - {e}')
-                st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
+            problemas = c_treats.validar_planilha_desvios(arquivo)
+            if problemas:
+                st.error(mensagem_validacao(arquivo.name, problemas))
+            else:
+                try:
+                    barra = ProgressBar()
+                    barra.iniciar_carregamento()
+                    st.session_state['plan_desvio'] = c_treats.process_excel_file(arquivo)
+                    st.session_state['regist_apag'], st.session_state['plan_calc_tempos'] = compartilhar_derivado(c_treats.gerar_calculo_tempos, st.session_state['plan_desvio'])
+                    snapshots.salvar_snapshot('coordenacao_desvios', {chave: st.session_state[chave] for chave in CHAVES_DESVIOS}, [arquivo], c_treats.process_excel_file.versao)
+                    barra.finalizar_carregamento(emoji='🚀')
+                except Exception as e:
+                    print(f'[ERRO] Processamento de arquivo Coordenacao - {e}')
+                    st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
             
         if st.session_state['plan_desvio'] is not None:
-            self.df = st.session_state['plan_desvio']
+            self.df = filtros.indexar(st.session_state['plan_desvio'], c_treats.DIMENSOES_FILTRO_DESVIOS)
             self.df_tempos = st.session_state['plan_calc_tempos']
             self.registros_apagados = st.session_state['regist_apag']
             self.filtros_opcionais()
+            # Recorte da barra lateral calculado uma vez e usado por todos os gráficos de desvios
+            self.df_desvios = c_charts.filtrar_desvios(self.df, self.anos, self.meses, self.estudos, self.categorias, self.setores)
             if st.sidebar.button('Gerar relatório mensal', help='Faça download dos gráficos de Desvios por Categoria e Setor'):
                 self.gerar_relatorio()
 
@@ -278,7 +286,7 @@ class Coordenacao():
 
                 df_filtered = self.df[self.df['Categoria'].isin(cat) & self.df['Setor'].isin(sect)]
 
-                st.write(df_filtered)
+                st.write(remover_chaves_calendario(df_filtered))
                 st.info('Faça download da planilha passando o mouse em cima e clicando na setinha para baixo ↓')
 
             st.subheader('Cálculo dos tempos do processo de Coordenação')
@@ -305,17 +313,32 @@ class Coordenacao():
         excel_file = st.file_uploader('Faça upload da Planilha Qualidade-Coordenação!', 'xlsx', key='excel_file_uploader_coord', 
                             help='Faça o download da planilha e insira-a aqui!')
         
+        if excel_file:
+            espelho_planilhas.descartar_espelho('coordenacao_qualidade', ['dados_tab_qual_coord'])
+        else:
+            arquivos_espelho = espelho_planilhas.oferecer_espelho('coordenacao_qualidade', ['PLAN_QUAL_COORD'])
+            excel_file = arquivos_espelho[0] if arquivos_espelho else None
+
+        if excel_file:
+            snapshots.descartar_snapshot('coordenacao_qualidade', ['dados_tab_qual_coord'])
+
         if not excel_file:
             st.link_button('Acessar Tabela Qualidade-Coordenação', url=url_tabela_qual_coord)
-            st.session_state['dados_tab_qual_coord'] = None
+            if not snapshots.oferecer_snapshot('coordenacao_qualidade', c_treats.tratar_tab_qual_coord.versao, ['dados_tab_qual_coord']):
+                st.session_state['dados_tab_qual_coord'] = None
         
         elif st.session_state['dados_tab_qual_coord'] is None:
-            try:
-                dados_qual_coord = c_treats.carregar_dados_tab_qual_coord(excel_file)
-                st.session_state['dados_tab_qual_coord'] = dados_qual_coord
-            except Exception as e:
-                print(f'[ERRO] Processamento de arquivo Coordenacao - {e}')
-                st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
+            problemas = c_treats.validar_tab_qual_coord(excel_file)
+            if problemas:
+                st.error(mensagem_validacao(excel_file.name, problemas))
+            else:
+                try:
+                    dados_qual_coord = c_treats.carregar_dados_tab_qual_coord(excel_file)
+                    st.session_state['dados_tab_qual_coord'] = dados_qual_coord
+                    snapshots.salvar_snapshot('coordenacao_qualidade', {'dados_tab_qual_coord': dados_qual_coord}, [excel_file], c_treats.tratar_tab_qual_coord.versao)
+                except Exception as e:
+                    print(f'[ERRO] Processamento de arquivo Coordenacao - {e}')
+                    st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
 
 
         if st.session_state['dados_tab_qual_coord'] is not None:
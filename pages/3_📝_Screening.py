@@ -5,15 +5,22 @@ import os
 import assets.Screening.Screening_Charts as SCR_charts
 import assets.Screening.Screening_Treatments as SCR_treats
 from checar_login import ChecarAutenticacao
+from leitor_planilhas import mensagem_validacao, remover_chaves_calendario
+import filtros
+import snapshots
+import espelho_planilhas
 
 
 URL_2023=st.secrets['urls']['PLAN_SCR_2023']
 URL_2024=st.secrets['urls']['PLAN_SCR_2024']
 URL_2025=st.secrets['urls']['PLAN_SCR_2025']
 
+# Dados da página mantidos no session_state (e salvos no snapshot)
+CHAVES_SCR = ['dfs']
+
 class Screening():
     def __init__(self):
-        ChecarAutenticacao()
+        ChecarAutenticacao(CHAVES_SCR)
 
         if 'setor' not in st.session_state:
             st.switch_page('1_🏠_Homepage.py')
@@ -37,6 +44,17 @@ class Screening():
                 st.link_button('Dados 2025', url=URL_2025)
 
             if arquivos:
+                espelho_planilhas.descartar_espelho('screening', CHAVES_SCR)
+            else:
+                arquivos = espelho_planilhas.oferecer_espelho('screening', ['PLAN_SCR_2023', 'PLAN_SCR_2024', 'PLAN_SCR_2025'])
+
+            if arquivos:
+                snapshots.descartar_snapshot('screening', CHAVES_SCR)
+                dados_snapshot = False
+            else:
+                dados_snapshot = snapshots.oferecer_snapshot('screening', SCR_treats.tratar_planilha.versao, CHAVES_SCR)
+
+            if arquivos or dados_snapshot:
                 try:
                     self.valor_padrao_filtros()
                     self.carregamento_tratamento_arquivos(arquivos) # Provavelmente a exception está na cadeia de funções daqui
@@ -94,71 +112,63 @@ class Screening():
 
 
     def carregamento_tratamento_arquivos(self, arquivos):
-        if 'dfs' not in st.session_state:
-            st.session_state['dfs'] = {
-                'mot_cat': pd.DataFrame(), 
-                'tcles': {'tcle': pd.DataFrame(), 'pre_tcle': pd.DataFrame()},
-                'pcts': pd.DataFrame()
-            }
+        # Os dados ficam separados por arquivo: adicionar ou remover um upload não refaz os dos outros
+        if st.session_state.get('dfs') is None:
+            st.session_state['dfs'] = SCR_treats.DadosScreening()
+
+        # Dados reabertos de um snapshot vêm como o dicionário já unido
+        elif isinstance(st.session_state['dfs'], dict):
+            st.session_state['dfs'] = SCR_treats.DadosScreening.a_partir_da_uniao(st.session_state['dfs'])
 
-        if 'arquivos_processados' not in st.session_state:
-            st.session_state['arquivos_processados'] = []
+        dados_screening = st.session_state['dfs']
 
         if arquivos:
-            arquivos_novos = [arquivo.name for arquivo in arquivos]
-
-            arquivos_removidos = list(set(st.session_state['arquivos_processados']) - set(arquivos_novos))
-            if arquivos_removidos:
-                for arquivo_removido in arquivos_removidos:
-                    self.remover_dados_arquivo(arquivo_removido)
-
-            for arquivo in arquivos:
-                if arquivo.name not in st.session_state['arquivos_processados']:
-                    st.session_state['arquivos_processados'].append(arquivo.name)
-                    temp_dfs = {
-                        'mot_cat': pd.DataFrame(), 
-                        'tcles': {'tcle': pd.DataFrame(), 'pre_tcle': pd.DataFrame()},
-                        'pcts': pd.DataFrame()
-                    }
-                    temp_dfs = SCR_treats.tratamento_dados(arquivo, temp_dfs)
-
-                # Concatenando os DataFrames ao 'st.session_state' se eles não forem vazios
-                    if not temp_dfs['mot_cat'].empty:
-                        st.session_state['dfs']['mot_cat'] = pd.concat([st.session_state['dfs']['mot_cat'], temp_dfs['mot_cat']], ignore_index=True)
-                    if not temp_dfs['tcles']['tcle'].empty:
-                        st.session_state['dfs']['tcles']['tcle'] = pd.concat([st.session_state['dfs']['tcles']['tcle'], temp_dfs['tcles']['tcle']], ignore_index=True)
-                    if not temp_dfs['tcles']['pre_tcle'].empty:
-                        st.session_state['dfs']['tcles']['pre_tcle'] = pd.concat([st.session_state['dfs']['tcles']['pre_tcle'], temp_dfs['tcles']['pre_tcle']], ignore_index=True)
-                    if not temp_dfs['pcts'].empty:
-                        st.session_state['dfs']['pcts'] = pd.concat([st.session_state['dfs']['pcts'], temp_dfs['pcts']], ignore_index=True)
-                        st.session_state['dfs']['pcts'] = st.session_state['dfs']['pcts'].drop_duplicates(subset=['Nome'], keep='first')
-
-        return st.session_state['dfs']
-
-
-    def remover_dados_arquivo(self, arquivo_nome):
-        """Função para remover os dados associados a um arquivo removido do session_state."""
-
-        st.session_state['dfs']['mot_cat'] = st.session_state['dfs']['mot_cat'][st.session_state['dfs']['mot_cat']['fonte'] != arquivo_nome]
-        
-        st.session_state['dfs']['tcles']['tcle'] = st.session_state['dfs']['tcles']['tcle'][st.session_state['dfs']['tcles']['tcle']['fonte'] != arquivo_nome]
-        st.session_state['dfs']['tcles']['pre_tcle'] = st.session_state['dfs']['tcles']['pre_tcle'][st.session_state['dfs']['tcles']['pre_tcle']['fonte'] != arquivo_nome]
-        
-        st.session_state['dfs']['pcts'] = st.session_state['dfs']['pcts'][st.session_state['dfs']['pcts']['fonte'] != arquivo_nome]
+            # Os arquivos são identificados pelo conteúdo: o mesmo arquivo com outro nome não é contado duas vezes
+            # e uma planilha corrigida enviada com o mesmo nome é processada de novo
+            uploads, repetidos = SCR_treats.identificar_uploads(arquivos)
+            for arquivo, original in repetidos:
+                st.warning(f'O arquivo "{arquivo.name}" tem o mesmo conteúdo de "{original.name}" e foi ignorado.')
+
+            arquivos_removidos = [digest for digest in dados_screening.digests() if digest not in uploads]
+            for arquivo_removido in arquivos_removidos:
+                dados_screening.remover(arquivo_removido)
+
+            arquivos_pendentes = []
+            for digest, arquivo in uploads.items():
+                if digest in dados_screening:
+                    continue
+
+                # Validação rápida (só os cabeçalhos) antes de processar o arquivo
+                problemas = SCR_treats.validar_arquivo(arquivo)
+                if problemas:
+                    st.error(mensagem_validacao(arquivo.name, problemas))
+                else:
+                    arquivos_pendentes.append(arquivo)
 
-        if arquivo_nome in st.session_state['arquivos_processados']:
-            st.session_state['arquivos_processados'].remove(arquivo_nome)
+            # Os arquivos novos são processados em paralelo e cada um vira uma partição assim que termina
+            if arquivos_pendentes:
+                digests = {arquivo.name: digest for digest, arquivo in uploads.items()}
+                for arquivo, temp_dfs in SCR_treats.tratamento_dados_paralelo(arquivos_pendentes):
+                    dados_screening.adicionar(digests[arquivo.name], temp_dfs, arquivo.name)
+
+            if arquivos_removidos or arquivos_pendentes:
+                snapshots.salvar_snapshot('screening', {'dfs': dados_screening.uniao()}, list(uploads.values()), SCR_treats.tratar_planilha.versao)
+
+        return dados_screening.uniao()
 
 
     def carregar_dataframes(self):
         '''Função para atribuir os dataframes do `st.session_state[dfs]` 
         às variáveis pra melhor legibilidade nos códigos de gráfico'''
 
-        self.df_Mot_Cat = st.session_state['dfs']['mot_cat']
-        self.df_TCLE_agrupado = st.session_state['dfs']['tcles']['tcle']
-        self.df_Pré_TCLE = st.session_state['dfs']['tcles']['pre_tcle']
-        self.df_Espera_Total_pcts, self.df_Dados_relatorio = SCR_treats.gerar_dataframes(st.session_state['dfs']['tcles']['tcle'])
-        self.df_Pacientes = st.session_state['dfs']['pcts']
+        dfs = st.session_state['dfs'].uniao()
+
+        # Os índices de bitmaps das dimensões são criados uma vez por dataframe e usados por todos os gráficos
+        self.df_Mot_Cat = filtros.indexar(dfs['mot_cat'], SCR_treats.DIMENSOES_FILTRO)
+        self.df_TCLE_agrupado = filtros.indexar(dfs['tcles']['tcle'], SCR_treats.DIMENSOES_FILTRO)
+        self.df_Pré_TCLE = filtros.indexar(dfs['tcles']['pre_tcle'], SCR_treats.DIMENSOES_FILTRO)
+        self.df_Espera_Total_pcts, self.df_Dados_relatorio = SCR_treats.gerar_dataframes(dfs['tcles']['tcle'])
+        self.df_Pacientes = dfs['pcts']
 
 # Tab1 - Indicadores de Falha
     def grafs_analise_falha_tab1(self):
@@ -487,24 +497,24 @@ class Screening():
 # Tab5 - Tabelas
     def mostrar_dataframes(self):
         with st.expander('Compilado Motivos/Categorias'):
-            st.dataframe(self.df_Mot_Cat)
+            st.dataframe(remover_chaves_calendario(self.df_Mot_Cat))
             st.info('Os filtros de data são aplicados na "Data da falha"')
 
         with st.expander('Dados TCLE Principal Agrupado'):
-            st.dataframe(self.df_TCLE_agrupado)
+            st.dataframe(remover_chaves_calendario(self.df_TCLE_agrupado))
             st.info('Os filtros de data são aplicados na "Data assinatura"')
     
         with st.expander('Pré-TCLE'):
-            st.dataframe(self.df_Pré_TCLE)
+            st.dataframe(remover_chaves_calendario(self.df_Pré_TCLE))
             st.info('Os filtros de data são aplicados na "Data assinatura"')
         
         with st.expander('Espera total'):
-            st.dataframe(self.df_Espera_Total_pcts)
+            st.dataframe(remover_chaves_calendario(self.df_Espera_Total_pcts))
             st.info('A média de tempo corrido aparece "repetida" por questões programáticas, mas é este valor único.')
             st.info('Os filtros de data são aplicados na "Data assinatura"')
         
         with st.expander('Dados relatorio de desfechos'):
-            st.dataframe(self.df_Dados_relatorio)
+            st.dataframe(remover_chaves_calendario(self.df_Dados_relatorio))
             st.info('Os filtros de data são aplicados na "Data assinatura"')
         
         with st.expander('Pacientes'):
@@ -5,6 +5,10 @@ import assets.Qualidade.Qual_charts as qcharts
 import os
 from checar_login import ChecarAutenticacao
 from progress_bar import ProgressBar
+from leitor_planilhas import mensagem_validacao
+import filtros
+import snapshots
+import espelho_planilhas
 
 
 url_plan_qual = st.secrets['urls']['PLAN_QUAL']
@@ -12,7 +16,7 @@ url_plan_qual = st.secrets['urls']['PLAN_QUAL']
 
 class Qualidade():
     def __init__(self):
-        ChecarAutenticacao()
+        ChecarAutenticacao(['dados_qualidade'])
         
         if 'setor' not in st.session_state:
             st.switch_page('1_🏠_Homepage.py')
@@ -160,18 +164,33 @@ class Qualidade():
 # Mostrando conteúdo
     def tab1(self):
         arquivo = st.file_uploader('Faça upload da planilha de desvios aqui!', type='xlsx', key='plandesvio', help='Faça download da planilha e insira-a aqui!')
+        if arquivo:
+            espelho_planilhas.descartar_espelho('qualidade', ['dados_qualidade'])
+        else:
+            arquivos_espelho = espelho_planilhas.oferecer_espelho('qualidade', ['PLAN_QUAL'])
+            arquivo = arquivos_espelho[0] if arquivos_espelho else None
+
+        if arquivo:
+            snapshots.descartar_snapshot('qualidade', ['dados_qualidade'])
+
         if not arquivo:
             st.link_button('Planilha de achados', url=url_plan_qual)
-            st.session_state['dados_qualidade'] = None
+            if not snapshots.oferecer_snapshot('qualidade', qtreats.tratar_qualidade_file.versao, ['dados_qualidade']):
+                st.session_state['dados_qualidade'] = None
 
         elif st.session_state['dados_qualidade'] is None:
-            try:
-                st.session_state['dados_qualidade'] = qtreats.load_qualidade_file(arquivo)
-            except:
-                st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
+            problemas = qtreats.verificar_arquivo(arquivo)
+            if problemas:
+                st.error(mensagem_validacao(arquivo.name, problemas))
+            else:
+                try:
+                    st.session_state['dados_qualidade'] = qtreats.load_qualidade_file(arquivo)
+                    snapshots.salvar_snapshot('qualidade', {'dados_qualidade': st.session_state['dados_qualidade']}, [arquivo], qtreats.tratar_qualidade_file.versao)
+                except:
+                    st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
             
         if st.session_state['dados_qualidade'] is not None:
-            self.df = st.session_state['dados_qualidade']
+            self.df = filtros.indexar(st.session_state['dados_qualidade'], qtreats.DIMENSOES_FILTRO)
             self.filtros_opcionais()
 
             self.grafs_achados_frequentes_tab1()
@@ -6,6 +6,9 @@ import re
 import pandas as pd
 from progress_bar import ProgressBar
 from checar_login import ChecarAutenticacao
+from leitor_planilhas import chave_ano, filtrar_periodo, mensagem_validacao, remover_chaves_calendario
+import snapshots
+import espelho_planilhas
 import time
 
 url_plan_reg = st.secrets['urls']["PLAN_REG"]
@@ -13,7 +16,7 @@ url_plan_reg = st.secrets['urls']["PLAN_REG"]
 
 class Regulatorio():
     def __init__(self):
-        ChecarAutenticacao()
+        ChecarAutenticacao(['dados_regulatorio'])
         
         if 'setor' not in st.session_state:
             st.switch_page('1_🏠_Homepage.py')
@@ -49,15 +52,30 @@ class Regulatorio():
             help='Faça download da planilha e insira-a aqui!'
         )
 
+        if arquivo:
+            espelho_planilhas.descartar_espelho('regulatorio', ['dados_regulatorio'])
+        else:
+            arquivos_espelho = espelho_planilhas.oferecer_espelho('regulatorio', ['PLAN_REG'])
+            arquivo = arquivos_espelho[0] if arquivos_espelho else None
+
+        if arquivo:
+            snapshots.descartar_snapshot('regulatorio', ['dados_regulatorio'])
+
         if not arquivo:
             st.link_button('Indicadores Regulatório', url=url_plan_reg)
-            st.session_state['dados_regulatorio'] = None
+            if not snapshots.oferecer_snapshot('regulatorio', r_treats.calcular_tempos.versao, ['dados_regulatorio']):
+                st.session_state['dados_regulatorio'] = None
 
         elif st.session_state['dados_regulatorio'] is None:
-            try:
-                st.session_state['dados_regulatorio'] = r_treats.calcular_tempos(arquivo)
-            except Exception as e:
-                st.error(f'Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.\n\n{e}')
+            problemas = r_treats.validar_arquivo(arquivo)
+            if problemas:
+                st.error(mensagem_validacao(arquivo.name, problemas))
+            else:
+                try:
+                    st.session_state['dados_regulatorio'] = r_treats.calcular_tempos(arquivo)
+                    snapshots.salvar_snapshot('regulatorio', {'dados_regulatorio': st.session_state['dados_regulatorio']}, [arquivo], r_treats.calcular_tempos.versao)
+                except Exception as e:
+                    st.error(f'Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.\n\n{e}')
 
         # 🔁 Aqui é o ponto chave: define df e df_original sempre que houver dados válidos
         if st.session_state['dados_regulatorio'] is not None:
@@ -152,7 +170,8 @@ class Regulatorio():
             selection_mode='multi'
         )
 
-        anos_disponiveis = sorted(self.df_original['Data de Solicitação'].dt.year.unique(), reverse=True)
+        anos = self.df_original[chave_ano('Data de Solicitação')]
+        anos_disponiveis = sorted(anos[anos > 0].unique(), reverse=True)
         ano_selecionado = st.sidebar.selectbox('Ano para comparação', anos_disponiveis, index=0)
 
         # Salva os filtros de mês/ano para as métricas depois
@@ -161,9 +180,7 @@ class Regulatorio():
 
         # Aplicar filtro no self.df
 
-        self.df = self.df[self.df['Data de Solicitação'].dt.year == self.ano_esc]
-        if self.mes_esc:
-            self.df = self.df[self.df['Data de Solicitação'].dt.month.isin(self.mes_esc)]
+        self.df = filtrar_periodo(self.df, 'Data de Solicitação', [self.ano_esc], self.mes_esc)
 
 
     def grafico_dossie_e_tempo_total(self, dataframe):
@@ -184,12 +201,7 @@ class Regulatorio():
         if df_base.empty:
             return pd.DataFrame(), pd.DataFrame()
 
-        df_base = df_base.copy()
-        df_base['Data de Solicitação'] = pd.to_datetime(df_base['Data de Solicitação'], errors='coerce')
-        df_base['mes'] = df_base['Data de Solicitação'].dt.month
-        df_base['ano'] = df_base['Data de Solicitação'].dt.year
-
-        df_atual = df_base[(df_base['mes'].isin(meses_atual)) & (df_base['ano'] == ano_atual)]
+        df_atual = filtrar_periodo(df_base, 'Data de Solicitação', [ano_atual], meses_atual)
 
         if len(meses_atual) == 1:
             mes_atual = meses_atual[0]
@@ -200,7 +212,7 @@ class Regulatorio():
                 mes_anterior = mes_atual - 1
                 ano_anterior = ano_atual
 
-            df_anterior = df_base[(df_base['mes'] == mes_anterior) & (df_base['ano'] == ano_anterior)]
+            df_anterior = filtrar_periodo(df_base, 'Data de Solicitação', [ano_anterior], [mes_anterior])
 
         else:
             df_anterior = pd.DataFrame()  # vazio → sem delta
@@ -311,7 +323,7 @@ class Regulatorio():
             self.mostrar_metricas(df_atual, df_anterior)
 
             with st.expander('Ver planilha'):
-                st.write(self.df)
+                st.write(remover_chaves_calendario(self.df))
                 st.write(f'Registros nesta visualização: {self.df.shape[0]}')
 
         else:
@@ -6,13 +6,19 @@ import assets.Esteira_paciente.Esteira_Treats as est_treats
 import assets.Esteira_paciente.Esteira_Charts as est_charts
 from checar_login import ChecarAutenticacao
 from progress_bar import ProgressBar
+from leitor_planilhas import compartilhar_derivado, mensagem_validacao
+import snapshots
+import espelho_planilhas
 
 
 URL_SCR_REC = st.secrets['urls']['PLAN_SCR_REC']
 
+# Dados da página mantidos no session_state (e salvos no snapshot)
+CHAVES_ESTEIRA = ['dados_esteira', 'df_tempos', 'df_taxas']
+
 class Esteira_Paciente():
     def __init__(self):
-        ChecarAutenticacao()
+        ChecarAutenticacao(CHAVES_ESTEIRA)
 
         if 'setor' not in st.session_state:
             st.switch_page('1_🏠_Homepage.py')
@@ -53,12 +59,18 @@ class Esteira_Paciente():
 
     def tratar_planilha(self, arquivo):
         if st.session_state['dados_esteira'] is None:
+            problemas = est_treats.validar_arquivo(arquivo)
+            if problemas:
+                st.error(mensagem_validacao(arquivo.name, problemas))
+                return
+
             try:
                 barra = ProgressBar()
                 barra.iniciar_carregamento()
                 st.session_state['dados_esteira'] = est_treats.tratar_dados_upload(arquivo)
-                st.session_state['df_tempos'] = est_treats.dataframe_para_calculo_tempos(st.session_state['dados_esteira'])
-                st.session_state['df_taxas'] = est_treats.dataframe_para_calculo_taxas(st.session_state['dados_esteira'])
+                st.session_state['df_tempos'] = compartilhar_derivado(est_treats.dataframe_para_calculo_tempos, st.session_state['dados_esteira'])
+                st.session_state['df_taxas'] = compartilhar_derivado(est_treats.dataframe_para_calculo_taxas, st.session_state['dados_esteira'])
+                snapshots.salvar_snapshot('esteira', {chave: st.session_state[chave] for chave in CHAVES_ESTEIRA}, [arquivo], est_treats.tratar_dados_upload.versao)
                 barra.finalizar_carregamento(emoji='🎉')
             except Exception as e:
                 st.error('Erro de processamento! Por favor, verifique se o arquivo enviado é o correto.')
@@ -140,10 +152,20 @@ class Esteira_Paciente():
 
     def tab1(self):
         arquivo = st.file_uploader('Faça upload do excel Esteira aqui', 'xlsx')
+        if arquivo:
+            espelho_planilhas.descartar_espelho('esteira', CHAVES_ESTEIRA)
+        else:
+            arquivos_espelho = espelho_planilhas.oferecer_espelho('esteira', ['PLAN_SCR_REC'])
+            arquivo = arquivos_espelho[0] if arquivos_espelho else None
+
+        if arquivo:
+            snapshots.descartar_snapshot('esteira', CHAVES_ESTEIRA)
+
         if not arquivo:
-            st.session_state['dados_esteira'] = None
-            st.session_state['df_tempos'] = None
-            st.session_state['df_taxas'] = None
+            if not snapshots.oferecer_snapshot('esteira', est_treats.tratar_dados_upload.versao, CHAVES_ESTEIRA):
+                st.session_state['dados_esteira'] = None
+                st.session_state['df_tempos'] = None
+                st.session_state['df_taxas'] = None
 
         elif arquivo and st.session_state['df_taxas'] is None:
             self.tratar_planilha(arquivo)
@@ -0,0 +1,74 @@
+import streamlit as st
+from checar_login import ChecarAutenticacao
+import memoria_sessoes
+from leitor_planilhas import cache_planilhas, registro_dados
+
+
+class Memoria():
+    def __init__(self):
+        ChecarAutenticacao()
+
+        if 'setor' not in st.session_state:
+            st.switch_page('1_🏠_Homepage.py')
+
+        elif st.session_state['setor'] not in st.secrets['permissions'].get('PERM_ADMIN', []):
+            st.warning('Você não tem acesso à esta página. Troque de conta ou converse com o administrador.')
+            if st.button('Trocar de conta'):
+                st.logout()
+
+        else:
+            st.title('Memória das sessões')
+            st.subheader('Quanto cada sessão ocupa com os dados carregados')
+            self.mostrar_memoria()
+
+
+    def mostrar_memoria(self):
+        st.button('Atualizar', icon='🔄')
+
+        por_dados, por_coluna, total = memoria_sessoes.relatorio_memoria()
+
+        erro_sessoes = memoria_sessoes.erro_leitura_sessoes()
+        if erro_sessoes is not None:
+            st.warning(f'Não foi possível ler as outras sessões nesta versão do Streamlit ({st.__version__}): só a sessão atual é exibida '
+                       f'e os limites de memória valem só para ela. Confira a versão fixada no requirements.txt. Detalhe: {erro_sessoes}')
+
+        em_disco = por_dados[por_dados['Local'] == 'disco']
+
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric('Total do servidor', f'{total:,.1f} MB', border=True)
+        with col2:
+            st.metric('Descarregado no disco', f'{em_disco["MB"].sum():,.1f} MB', border=True)
+        with col3:
+            st.metric('Sessões com dados', por_dados['Sessão'].nunique(), border=True)
+        with col4:
+            st.metric('Conjuntos de dados', len(por_dados), border=True)
+        st.info(f'O total conta uma vez só os dados compartilhados entre sessões (a mesma planilha aberta em várias sessões ocupa uma cópia só) '
+                f'e inclui os caches de planilhas e de abas tratadas ({memoria_sessoes.memoria_caches() / 1024 ** 2:,.1f} MB). '
+                f'Planilhas tratadas compartilhadas no momento: {len(registro_dados)}. '
+                f'Planilhas tratadas pelo espelho que nenhuma sessão abriu ainda: {len(cache_planilhas)}.')
+        limite_sessao_mb, limite_total_mb = memoria_sessoes.limites_memoria()
+        st.info(f'Limites: {limite_sessao_mb} MB por sessão e {limite_total_mb} MB no servidor. '
+                'Acima deles, os dados usados há mais tempo são descarregados para o disco até que a página que os usa seja aberta de novo.')
+
+        if por_dados.empty:
+            st.warning('Nenhuma sessão tem dados carregados no momento.')
+            return
+
+        st.divider()
+        st.subheader('Por sessão')
+        por_sessao = por_dados.groupby(['Sessão', 'Setor', 'Local'], dropna=False)['MB'].sum().reset_index().sort_values('MB', ascending=False)
+        st.dataframe(por_sessao, hide_index=True, column_config={'MB': st.column_config.NumberColumn(format='%.2f')})
+
+        st.subheader('Por conjunto de dados')
+        st.dataframe(por_dados, hide_index=True, column_config={'MB': st.column_config.NumberColumn(format='%.2f')})
+
+        st.subheader('Por coluna')
+        dados_selecionados = st.multiselect('Filtre os conjuntos de dados', por_dados['Dados'].unique(), placeholder='Todos')
+        if dados_selecionados:
+            por_coluna = por_coluna[por_coluna['Dados'].isin(dados_selecionados)]
+        st.dataframe(por_coluna, hide_index=True, column_config={'MB': st.column_config.NumberColumn(format='%.3f')})
+
+
+if __name__ == "__main__":
+    Memoria()
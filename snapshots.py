@@ -0,0 +1,248 @@
+import datetime
+import json
+import os
+import pickle
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from leitor_planilhas import TIPO_TEXTO_LIVRE, VERSAO_LEITOR, compartilhar, digest_arquivo
+
+
+# Pasta onde os dados tratados ficam salvos, um snapshot por pasta: snapshots/<setor>/<conjunto>/<data e hora>/.
+# Cada setor (o mesmo das permissões em `st.secrets['permissions']`) só vê os snapshots que ele mesmo salvou
+PASTA_SNAPSHOTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+
+# Quantos snapshots de cada conjunto de dados são mantidos (os mais antigos são apagados)
+MAX_SNAPSHOTS_POR_CONJUNTO = 5
+
+
+def dono_atual():
+    '''Setor do usuário logado (definido na Homepage), dono dos snapshots salvos e reabertos na sessão (ou None)'''
+    return st.session_state.get('setor')
+
+
+def _pasta_conjunto(conjunto, dono):
+    return os.path.join(PASTA_SNAPSHOTS, dono, conjunto)
+
+
+def _achatar(dados, prefixo=''):
+    '''Transforma dicionários aninhados (ex.: `dfs['tcles']['tcle']`) em pares ('tcles.tcle', valor)'''
+    for chave, valor in dados.items():
+        if isinstance(valor, dict):
+            yield from _achatar(valor, f'{prefixo}{chave}.')
+        else:
+            yield f'{prefixo}{chave}', valor
+
+
+def _aninhar(dados_achatados):
+    '''Desfaz o `_achatar`'''
+    dados = {}
+    for caminho, valor in dados_achatados.items():
+        *pais, chave = caminho.split('.')
+        destino = dados
+        for pai in pais:
+            destino = destino.setdefault(pai, {})
+        destino[chave] = valor
+
+    return dados
+
+
+def salvar_tabela(df, caminho, compressao='snappy'):
+    '''Salva o DataFrame em Parquet. Colunas de texto (ou categóricas) com valores de tipos misturados (ex.: datas e "N/A"),
+    que o Arrow não consegue representar, são gravadas com cada valor serializado, para voltarem idênticas'''
+    df = df.copy(deep=False)
+    serializadas = []
+    for coluna in df.columns[(df.dtypes == object) | (df.dtypes == 'category')]:
+        try:
+            pa.array(df[coluna], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            df[coluna] = [pickle.dumps(valor) for valor in df[coluna]]
+            serializadas.append(coluna)
+
+    df.to_parquet(caminho, engine='pyarrow', compression=compressao)
+    return serializadas
+
+
+def abrir_tabela(caminho, serializadas):
+    '''Abre a tabela gravada por `salvar_tabela` (`serializadas` é a lista de colunas retornada por ela)'''
+    df = pd.read_parquet(caminho, engine='pyarrow')
+    # O Parquet guarda as colunas de texto livre só como "string": volta para o tipo com o texto no Arrow
+    for coluna in df.columns[df.dtypes == 'string']:
+        df[coluna] = df[coluna].astype(TIPO_TEXTO_LIVRE)
+    for coluna in serializadas:
+        df[coluna] = df[coluna].map(pickle.loads).astype(object)
+
+    return df
+
+
+def _valor_json(valor):
+    '''Converte os números do numpy (ex.: `np.int64`) para os tipos do Python, para salvar no JSON'''
+    if hasattr(valor, 'item'):
+        return valor.item()
+    raise TypeError(f'O valor {valor!r} não pode ser salvo no snapshot')
+
+
+def salvar_snapshot(conjunto, dados, arquivos, versao, dono=None):
+    """
+    Salva os dados tratados de uma página em disco (um Parquet por DataFrame e um `meta.json`).
+
+    Args:
+        conjunto (str): Nome do conjunto de dados (ex.: 'qualidade'). Cada página usa o seu.
+        dados (dict): Dicionário (pode ser aninhado) com os DataFrames e valores simples (números, textos, listas).
+        arquivos (list): Uploads que deram origem aos dados, registrados nos metadados.
+        versao (str): Versão do tratamento. Snapshots de outra versão não são reabertos.
+        dono (str): Setor dono do snapshot. Por padrão, o do usuário logado (`dono_atual`).
+
+    Returns:
+        str | None: Pasta do snapshot salvo, ou None se não foi possível salvar.
+    """
+    dono = dono or dono_atual()
+    if not dono:
+        return None
+
+    pasta_conjunto = _pasta_conjunto(conjunto, dono)
+    nome = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    pasta_temporaria = os.path.join(pasta_conjunto, f'.{nome}')
+
+    try:
+        os.makedirs(pasta_temporaria)
+
+        meta = {
+            'conjunto': conjunto,
+            'dono': dono,
+            'criado_em': datetime.datetime.now().isoformat(timespec='seconds'),
+            'versao_leitor': VERSAO_LEITOR,
+            'versao': versao,
+            'arquivos': [
+                {'nome': arquivo.name, 'sha256': digest_arquivo(arquivo), 'tamanho': getattr(arquivo, 'size', None)}
+                for arquivo in arquivos
+            ],
+            'tabelas': {},
+            'valores': {},
+        }
+
+        for i, (caminho, valor) in enumerate(_achatar(dados)):
+            if isinstance(valor, pd.DataFrame):
+                nome_arquivo = f'{i}.parquet'
+                serializadas = salvar_tabela(valor, os.path.join(pasta_temporaria, nome_arquivo))
+                meta['tabelas'][caminho] = {'arquivo': nome_arquivo, 'linhas': len(valor), 'serializadas': serializadas}
+            else:
+                meta['valores'][caminho] = valor
+
+        with open(os.path.join(pasta_temporaria, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2, default=_valor_json)
+
+        # O snapshot só aparece para as outras sessões depois de completo
+        pasta_snapshot = os.path.join(pasta_conjunto, nome)
+        os.rename(pasta_temporaria, pasta_snapshot)
+
+    except Exception as e:
+        print(f'[ERRO salvar_snapshot] - {e}')
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+        return None
+
+    for antigo in _listar_snapshots(conjunto, dono)[:-MAX_SNAPSHOTS_POR_CONJUNTO]:
+        shutil.rmtree(os.path.join(pasta_conjunto, antigo), ignore_errors=True)
+
+    return pasta_snapshot
+
+
+def _listar_snapshots(conjunto, dono):
+    '''Nomes das pastas de snapshots completos do conjunto salvos pelo dono, do mais antigo ao mais recente'''
+    pasta_conjunto = _pasta_conjunto(conjunto, dono)
+    if not os.path.isdir(pasta_conjunto):
+        return []
+
+    return sorted(nome for nome in os.listdir(pasta_conjunto) if not nome.startswith('.'))
+
+
+def ultimo_snapshot(conjunto, versao, dono=None):
+    '''Retorna os metadados do snapshot mais recente do conjunto salvo pelo dono (por padrão, o setor do usuário
+    logado) e gerado pela mesma versão do tratamento (ou None)'''
+    dono = dono or dono_atual()
+    if not dono:
+        return None
+
+    for nome in reversed(_listar_snapshots(conjunto, dono)):
+        pasta = os.path.join(_pasta_conjunto(conjunto, dono), nome)
+        try:
+            with open(os.path.join(pasta, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f'[ERRO ultimo_snapshot] - {e}')
+            continue
+
+        if meta['versao_leitor'] == VERSAO_LEITOR and meta['versao'] == versao:
+            meta['pasta'] = pasta
+            return meta
+
+    return None
+
+
+def abrir_snapshot(meta):
+    '''Lê os dados de um snapshot (metadados de `ultimo_snapshot`), no mesmo formato em que foram salvos'''
+    dados = dict(meta['valores'])
+    for caminho, tabela in meta['tabelas'].items():
+        dados[caminho] = abrir_tabela(os.path.join(meta['pasta'], tabela['arquivo']), tabela['serializadas'])
+
+    return _aninhar(dados)
+
+
+def descricao_snapshot(meta):
+    criado_em = datetime.datetime.fromisoformat(meta['criado_em']).strftime('%d/%m/%Y %H:%M')
+    nomes = ', '.join(arquivo['nome'] for arquivo in meta['arquivos'])
+    return f'{nomes} ({criado_em})'
+
+
+def oferecer_snapshot(conjunto, versao, chaves):
+    """
+    Para ser chamada quando não há upload na página: oferece reabrir o último snapshot do conjunto salvo
+    pelo setor do usuário logado. Snapshots de outros setores nunca são oferecidos.
+
+    Ao clicar no botão, os dados do snapshot são colocados no `st.session_state` (uma chave por item de `chaves`)
+    e continuam lá até que um arquivo seja enviado (veja `descartar_snapshot`).
+
+    Args:
+        conjunto (str): Nome do conjunto de dados usado em `salvar_snapshot`.
+        versao (str): Versão do tratamento.
+        chaves (list): Chaves do `st.session_state` salvas no snapshot.
+
+    Returns:
+        bool: True se os dados atuais do `st.session_state` vieram de um snapshot.
+    """
+    marcador = f'snapshot_{conjunto}'
+
+    if st.session_state.get(marcador):
+        st.info(f'Exibindo os dados salvos de {st.session_state[marcador]}. Envie uma planilha para atualizar.')
+        return True
+
+    meta = ultimo_snapshot(conjunto, versao)
+    if meta is not None and st.button(f'Reabrir os últimos dados: {descricao_snapshot(meta)}', key=f'botao_{marcador}', icon='🗂️'):
+        try:
+            # As sessões que reabrem o mesmo snapshot recebem os mesmos dados (`registro_dados`)
+            dados = compartilhar(('snapshot', meta['pasta']), lambda: abrir_snapshot(meta))
+        except Exception as e:
+            print(f'[ERRO oferecer_snapshot] - {e}')
+            st.error('Não foi possível reabrir os dados salvos. Por favor, envie a planilha novamente.')
+            return False
+
+        for chave in chaves:
+            st.session_state[chave] = dados[chave]
+        st.session_state[marcador] = descricao_snapshot(meta)
+        return True
+
+    return False
+
+
+def descartar_snapshot(conjunto, chaves):
+    '''Para ser chamada quando há upload: se os dados atuais vieram de um snapshot, eles são descartados
+    para que o arquivo enviado seja processado'''
+    marcador = f'snapshot_{conjunto}'
+
+    if st.session_state.get(marcador):
+        for chave in chaves:
+            st.session_state[chave] = None
+        st.session_state[marcador] = None
@@ -0,0 +1,91 @@
+import datetime
+import io
+import random
+
+import pandas as pd
+import pytest
+
+import leitor_planilhas
+
+
+ESTUDOS = ['alpha', 'Beta', 'GAMMA', 'delta']
+MEDICOS = ['dr joão', 'DRA MARIA', 'dr pedro', None]
+CATEGORIAS = ['Critério', 'Desistência', 'Óbito']
+
+
+class Upload(io.BytesIO):
+    '''Arquivo enviado pelo `st.file_uploader` (um `BytesIO` com nome)'''
+    def __init__(self, conteudo, name):
+        super().__init__(conteudo)
+        self.name = name
+
+
+def _data(rng):
+    return datetime.datetime(rng.randint(2023, 2025), rng.randint(1, 12), rng.randint(1, 28))
+
+
+def planilha_screening(n=120, semente=0, vazias=()):
+    '''Bytes de uma planilha de screening com abas de TCLE, Pré-TCLE e Pacientes.
+    As colunas em `vazias` ficam sem nenhum valor na aba de TCLE'''
+    rng = random.Random(semente)
+
+    tcle = []
+    for i in range(n):
+        status = rng.choice(['Falha', 'randomizado', 'Andamento', 'falha'])
+        data = _data(rng)
+        tcle.append({
+            'Nome do Paciente': f'P{i}',
+            'Estudo': rng.choice(ESTUDOS),
+            'Onco/multi': rng.choice(['Onco', 'multi', 'MULTI']),
+            'Status': status,
+            'Data TCLE': data,
+            'Médico que assinou': rng.choice(MEDICOS),
+            'Data falha/rando': data + datetime.timedelta(days=rng.randint(1, 40)) if status.lower() != 'andamento' else None,
+            'Tempo de SCR (dias)': rng.choice([28, 21, None, 42]),
+            'Motivo': f'motivo {rng.randint(0, 9)}' if status.lower() == 'falha' else None,
+            'Categoria': rng.choice(CATEGORIAS) if status.lower() == 'falha' else None,
+            'Anotação': 'x' * rng.randint(0, 20),
+        })
+    tcle = pd.DataFrame(tcle)
+    for coluna in vazias:
+        tcle[coluna] = None
+
+    pre_tcle = []
+    for i in range(n // 2):
+        status = rng.choice(['Falha', 'Segue TCLE principal', 'Andamento'])
+        data = _data(rng)
+        pre_tcle.append({
+            'Estudo': rng.choice(ESTUDOS),
+            'Onco/multi': rng.choice(['Onco', 'Multi']),
+            'Status': status,
+            'Data pré-TCLE': data,
+            'Médico que assinou': rng.choice(MEDICOS),
+            'Data da falha': data + datetime.timedelta(days=3) if status != 'Andamento' else None,
+            'Motivo': 'm' if status == 'Falha' else None,
+            'Categoria': rng.choice(CATEGORIAS) if status == 'Falha' else None,
+        })
+
+    pacientes = pd.DataFrame({'Nome completo': [f'P{i} Silva' for i in range(n)],
+                              'Ano': [rng.choice([2023, 2024, 2025]) for _ in range(n)]})
+
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        tcle.to_excel(writer, sheet_name='TCLE', index=False)
+        pd.DataFrame(pre_tcle).to_excel(writer, sheet_name='Pré-TCLE', index=False)
+        pacientes.to_excel(writer, sheet_name='Pacientes', index=False)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def caches_limpos():
+    '''Cada teste começa sem nada nos caches de planilhas e abas'''
+    leitor_planilhas.cache_planilhas.limpar()
+    leitor_planilhas.cache_abas.limpar()
+    yield
+    leitor_planilhas.cache_planilhas.limpar()
+    leitor_planilhas.cache_abas.limpar()
+
+
+@pytest.fixture(scope='session')
+def bytes_screening():
+    return planilha_screening()
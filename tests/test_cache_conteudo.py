@@ -0,0 +1,68 @@
+import gc
+import weakref
+
+import pandas as pd
+
+import leitor_planilhas
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload
+
+
+def test_mesmo_conteudo_com_nomes_diferentes_compartilha_o_tratamento(bytes_screening):
+    primeiro = SCR_treats.tratar_planilha(Upload(bytes_screening, 'PLAN_SCR_2024.xlsx'))
+    segundo = SCR_treats.tratar_planilha(Upload(bytes_screening, 'PLAN_SCR_2024 (1).xlsx'))
+
+    assert primeiro is segundo
+
+
+def test_fonte_nao_altera_os_dados_compartilhados(bytes_screening):
+    tratados = SCR_treats.tratar_planilha(Upload(bytes_screening, 'a.xlsx'))
+
+    dados_a = SCR_treats.adicionar_dados_arquivo(tratados, 'a.xlsx', SCR_treats.dados_vazios())
+    dados_b = SCR_treats.adicionar_dados_arquivo(tratados, 'b.xlsx', SCR_treats.dados_vazios())
+
+    for df in SCR_treats._achatar_dfs(tratados).values():
+        assert 'fonte' not in df.columns
+
+    for dados, nome in [(dados_a, 'a.xlsx'), (dados_b, 'b.xlsx')]:
+        for df in SCR_treats._achatar_dfs(dados).values():
+            assert (df['fonte'].astype(str) == nome).all()
+
+    pd.testing.assert_frame_equal(dados_a['tcles']['tcle'].drop(columns='fonte'), tratados['tcles']['tcle'])
+
+
+def test_registro_e_o_unico_dono_dos_dados_das_sessoes(bytes_screening, monkeypatch):
+    monkeypatch.setattr(leitor_planilhas, 'id_sessao_atual', lambda: 's1')
+    upload = Upload(bytes_screening, 'a.xlsx')
+    chave = SCR_treats.tratar_planilha.chave_cache(upload)
+
+    tratados = SCR_treats.tratar_planilha(upload)
+    assert chave not in leitor_planilhas.cache_planilhas
+    monkeypatch.setattr(leitor_planilhas, 'id_sessao_atual', lambda: 's2')
+    assert SCR_treats.tratar_planilha(Upload(bytes_screening, 'b.xlsx')) is tratados
+
+    referencia = weakref.ref(tratados['tcles']['tcle'])
+    del tratados
+    leitor_planilhas.registro_dados.liberar(chave, 's1')
+    gc.collect()
+    assert referencia() is not None
+
+    # Sem nenhuma sessão, os dados saem da memória
+    leitor_planilhas.registro_dados.liberar(chave, 's2')
+    gc.collect()
+    assert referencia() is None
+
+
+def test_tratado_fora_de_uma_sessao_passa_do_cache_para_o_registro(bytes_screening, monkeypatch):
+    # Ex.: o espelho trata a planilha antes de qualquer sessão abri-la
+    upload = Upload(bytes_screening, 'a.xlsx')
+    chave = SCR_treats.tratar_planilha.chave_cache(upload)
+    tratados = SCR_treats.tratar_planilha(upload)
+    assert chave in leitor_planilhas.cache_planilhas
+
+    monkeypatch.setattr(leitor_planilhas, 'id_sessao_atual', lambda: 's1')
+    assert SCR_treats.tratar_planilha(Upload(bytes_screening, 'b.xlsx')) is tratados
+    assert chave not in leitor_planilhas.cache_planilhas
+    assert leitor_planilhas.registro_dados.obter(chave) is tratados
+
+    leitor_planilhas.registro_dados.liberar(chave, 's1')
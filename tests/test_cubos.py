@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload, planilha_screening
+
+
+@pytest.fixture(scope='module')
+def uniao():
+    dados = SCR_treats.DadosScreening()
+    for semente, nome in enumerate(['PLAN_SCR_2024.xlsx', 'PLAN_SCR_2025.xlsx']):
+        dados.adicionar(str(semente), SCR_treats.tratar_planilha(Upload(planilha_screening(300, semente), nome)), nome)
+    dfs = dados.uniao()
+    return {'tcle': dfs['tcles']['tcle'], 'pre_tcle': dfs['tcles']['pre_tcle'], 'mot_cat': dfs['mot_cat']}
+
+
+def _filtrar_direto(df, coluna_data, anos, meses, selecoes):
+    mascara = pd.Series(True, index=df.index)
+    if anos:
+        mascara &= df[coluna_data].dt.year.isin(anos)
+    if meses:
+        mascara &= df[coluna_data].dt.month.isin(meses)
+    for coluna, valores in selecoes.items():
+        mascara &= df[coluna].isin(valores)
+    return df[mascara]
+
+
+PERIODOS = [(None, None), ([2024], None), (None, [1, 2, 3]), ([2023, 2025], [6, 12]), ([1999], [1])]
+
+
+@pytest.mark.parametrize('chave, coluna_data', [('tcle', 'Data assinatura'), ('tcle', 'Data da falha'),
+                                                ('pre_tcle', 'Data assinatura'), ('mot_cat', 'Data da falha')])
+@pytest.mark.parametrize('anos, meses', PERIODOS)
+def test_contagens_do_cubo_iguais_as_do_dataframe(uniao, chave, coluna_data, anos, meses):
+    df = uniao[chave]
+    cubo = SCR_treats.cubo_contagens(df, coluna_data).recortar(anos, meses)
+    direto = _filtrar_direto(df, coluna_data, anos, meses, {})
+
+    assert cubo.total() == len(direto)
+    assert cubo.vazio() == direto.empty
+    for coluna in [coluna for coluna in SCR_treats.DIMENSOES_CUBO if coluna in df.columns]:
+        pd.testing.assert_series_equal(cubo.contar([coluna]).sort_index(), direto.groupby(coluna, observed=True).size().sort_index(),
+                                       check_names=False, check_dtype=False)
+        pd.testing.assert_series_equal(cubo.contar_valores(coluna).sort_index(), SCR_treats.contar_valores(direto[coluna]).sort_index(),
+                                       check_names=False)
+    pd.testing.assert_series_equal(cubo.contar(['Estudo', 'Médico que assinou']).sort_index(),
+                                   direto.groupby(['Estudo', 'Médico que assinou'], observed=True).size().sort_index(),
+                                   check_names=False, check_dtype=False)
+
+
+@pytest.mark.parametrize('selecoes', [{'Estudo': ['ALPHA']}, {'Estudo': ['BETA', 'DELTA'], 'Status': ['Falha']},
+                                      {'Médico que assinou': [None, 'Dr João']}])
+def test_recorte_por_dimensoes_igual_ao_filtro_direto(uniao, selecoes):
+    df = uniao['tcle']
+    cubo = SCR_treats.cubo_contagens(df, 'Data assinatura').recortar([2024], list(range(1, 13)), selecoes)
+    direto = _filtrar_direto(df, 'Data assinatura', [2024], list(range(1, 13)),
+                             {coluna: [valor for valor in valores if valor is not None] for coluna, valores in selecoes.items()})
+    if any(None in valores for valores in selecoes.values()):
+        direto = pd.concat([direto, df[df['Médico que assinou'].isna() & df['Data assinatura'].dt.year.eq(2024)]]).sort_index()
+
+    assert cubo.total() == len(direto)
+    pd.testing.assert_series_equal(cubo.contar_valores('Estudo').sort_index(), SCR_treats.contar_valores(direto['Estudo']).sort_index(),
+                                   check_names=False)
+
+
+@pytest.mark.parametrize('anos, meses', PERIODOS)
+def test_contagem_por_mes_igual_ao_resample(uniao, anos, meses):
+    df = uniao['tcle']
+    cubo = SCR_treats.cubo_contagens(df, 'Data da falha').recortar(anos, meses)
+    direto = _filtrar_direto(df, 'Data da falha', anos, meses, {})
+    if direto.empty:
+        assert cubo.por_mes().empty
+        return
+
+    pd.testing.assert_series_equal(cubo.por_mes(), direto.resample('ME', on='Data da falha').size(),
+                                   check_names=False, check_freq=False, check_index_type=False)
@@ -0,0 +1,111 @@
+import hashlib
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import espelho_planilhas
+from conftest import planilha_screening
+
+
+class ServidorPlanilha():
+    '''Servidor HTTP local no lugar do link da planilha oficial. Responde 304 aos pedidos condicionais
+    (ETag ou Last-Modified) quando o conteúdo não mudou'''
+    def __init__(self, conteudo, com_etag=True):
+        self.conteudo = conteudo
+        self.modificado_em = formatdate(0, usegmt=True)
+        self.com_etag = com_etag
+        self.status = 200
+        self.respostas = []
+
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                etag = f'"{hashlib.sha256(servidor.conteudo).hexdigest()}"'
+                if servidor.status != 200:
+                    codigo = servidor.status
+                elif servidor.com_etag and self.headers.get('If-None-Match') == etag:
+                    codigo = 304
+                elif not servidor.com_etag and self.headers.get('If-Modified-Since') == servidor.modificado_em:
+                    codigo = 304
+                else:
+                    codigo = 200
+
+                servidor.respostas.append(codigo)
+                self.send_response(codigo)
+                if codigo == 200:
+                    if servidor.com_etag:
+                        self.send_header('ETag', etag)
+                    self.send_header('Last-Modified', servidor.modificado_em)
+                    self.send_header('Content-Length', str(len(servidor.conteudo)))
+                self.end_headers()
+                if codigo == 200:
+                    self.wfile.write(servidor.conteudo)
+
+        self._http = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self._http.server_port}/planilha.xlsx'
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+
+
+    def mudar(self, conteudo, modificado_em):
+        self.conteudo = conteudo
+        self.modificado_em = formatdate(modificado_em, usegmt=True)
+
+
+    def fechar(self):
+        self._http.shutdown()
+        self._http.server_close()
+
+
+@pytest.fixture
+def servidor(bytes_screening):
+    servidor = ServidorPlanilha(bytes_screening)
+    yield servidor
+    servidor.fechar()
+
+
+def test_baixa_so_quando_a_planilha_muda(servidor, tmp_path):
+    pasta = str(tmp_path)
+
+    assert espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, pasta) == 'atualizada'
+    baixado_em = espelho_planilhas.metadados('PLAN_SCR_2024', pasta)['baixado_em']
+
+    assert espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, pasta) == 'sem mudanças'
+    assert servidor.respostas == [200, 304]
+    assert espelho_planilhas.metadados('PLAN_SCR_2024', pasta)['baixado_em'] == baixado_em
+
+    nova = planilha_screening(n=30, semente=1)
+    servidor.mudar(nova, 3600)
+    assert espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, pasta) == 'atualizada'
+    assert espelho_planilhas.abrir_copia('PLAN_SCR_2024', pasta).getvalue() == nova
+
+
+def test_pedido_condicional_pela_data_sem_etag(bytes_screening, tmp_path):
+    servidor = ServidorPlanilha(bytes_screening, com_etag=False)
+    try:
+        assert espelho_planilhas.sincronizar_planilha('PLAN_QUAL', servidor.url, str(tmp_path)) == 'atualizada'
+        assert espelho_planilhas.sincronizar_planilha('PLAN_QUAL', servidor.url, str(tmp_path)) == 'sem mudanças'
+        assert servidor.respostas == [200, 304]
+    finally:
+        servidor.fechar()
+
+
+def test_resposta_que_nao_e_xlsx_nao_substitui_a_copia(servidor, bytes_screening, tmp_path):
+    pasta = str(tmp_path)
+    espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, pasta)
+
+    servidor.mudar(b'<html>login</html>', 3600)
+    assert espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, pasta) == 'erro'
+    assert espelho_planilhas.abrir_copia('PLAN_SCR_2024', pasta).getvalue() == bytes_screening
+
+
+def test_erro_do_servidor(servidor, tmp_path):
+    servidor.status = 500
+
+    assert espelho_planilhas.sincronizar_planilha('PLAN_SCR_2024', servidor.url, str(tmp_path)) == 'erro'
+    assert espelho_planilhas.metadados('PLAN_SCR_2024', str(tmp_path)) is None
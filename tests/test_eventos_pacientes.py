@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+import filtros
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload, planilha_screening
+
+
+def _carregar_tcle():
+    dados = SCR_treats.DadosScreening()
+    for semente, nome in enumerate(['PLAN_SCR_2024.xlsx', 'PLAN_SCR_2025.xlsx']):
+        dados.adicionar(str(semente), SCR_treats.tratar_planilha(Upload(planilha_screening(300, semente + 10), nome)), nome)
+    return dados.uniao()['tcles']['tcle']
+
+
+@pytest.fixture(scope='module')
+def tcle():
+    return _carregar_tcle()
+
+
+def _pacientes_direto(df, coluna_data, status, anos, meses):
+    '''Como as funções eram antes da tabela de eventos: filtro do período e do status no dataframe'''
+    final_df = df[df[coluna_data].dt.month.isin(meses) & df[coluna_data].dt.year.isin(anos)]
+    final_df = final_df[final_df['Status'] == status]
+    return final_df.assign(**{'Mes TCLE': final_df['Data assinatura'].dt.month_name(),
+                              'Ano TCLE': final_df['Data assinatura'].dt.year})
+
+
+CONSULTAS = [(SCR_treats.get_andamentos, 'Data assinatura', 'Andamento'),
+             (SCR_treats.get_randomizados, 'Data da falha', 'Randomizado'),
+             (SCR_treats.get_falhas, 'Data da falha', 'Falha')]
+PERIODOS = [([2024], [3]), ([2023, 2024, 2025], list(range(1, 13))), ([2024, 2025], [11, 12, 1]), ([1999], [1])]
+
+
+@pytest.mark.parametrize('consulta, coluna_data, status', CONSULTAS)
+@pytest.mark.parametrize('anos, meses', PERIODOS)
+def test_eventos_iguais_ao_filtro_direto(tcle, consulta, coluna_data, status, anos, meses):
+    esperado = _pacientes_direto(tcle, coluna_data, status, anos, meses)
+
+    pd.testing.assert_frame_equal(consulta(tcle, anos, meses), esperado)
+
+
+@pytest.mark.parametrize('consulta, coluna_data, status', CONSULTAS)
+def test_dados_do_relatorio_usam_os_eventos_do_tcle(tcle, consulta, coluna_data, status):
+    _, dados_relatorio = SCR_treats.gerar_dataframes(tcle)
+
+    assert filtros.derivado_de(dados_relatorio, 'eventos') is filtros.derivado_de(tcle, 'eventos')
+    pd.testing.assert_frame_equal(consulta(dados_relatorio, [2024], list(range(1, 13))),
+                                  _pacientes_direto(dados_relatorio, coluna_data, status, [2024], list(range(1, 13))))
+
+
+def test_inicio_da_triagem_igual_a_contagem_direta(tcle):
+    _, dados_relatorio = SCR_treats.gerar_dataframes(tcle)
+    contagem = SCR_treats.get_inicio_triagem(dados_relatorio, [2024], [1, 2, 3])
+
+    direto = dados_relatorio[dados_relatorio['Data assinatura'].dt.year.isin([2024]) & dados_relatorio['Data assinatura'].dt.month.isin([1, 2, 3])
+                             & dados_relatorio['Status'].notna()]
+    direto = direto.groupby([direto['Data assinatura'].dt.month, direto['Data assinatura'].dt.year]).size()
+    for (mes, ano), esperado in direto.items():
+        linha = contagem[(contagem['Mes'].cat.codes == mes - 1) & (contagem['Ano'] == ano)]
+        assert linha['Contagem'].item() == esperado
+    assert contagem['Contagem'].sum() == direto.sum()
+
+
+def test_eventos_recalculados_depois_de_alterar_o_tcle():
+    tcle = _carregar_tcle()
+    eventos = SCR_treats.eventos_pacientes(tcle)
+
+    em_andamento = tcle.index[tcle['Status'] == 'Andamento'][:10]
+    tcle.loc[em_andamento, 'Status'] = 'Falha'
+
+    assert SCR_treats.eventos_pacientes(tcle) is not eventos
+    pd.testing.assert_frame_equal(SCR_treats.get_andamentos(tcle, [2023, 2024, 2025], list(range(1, 13))),
+                                  _pacientes_direto(tcle, 'Data assinatura', 'Andamento', [2023, 2024, 2025], list(range(1, 13))))
+    cubo = SCR_treats.cubo_contagens(tcle, 'Data assinatura')
+    assert cubo.contar_valores('Status')['Andamento'] == (tcle['Status'] == 'Andamento').sum()
+
+
+def test_eventos_mantidos_enquanto_o_tcle_nao_muda(tcle):
+    eventos = SCR_treats.eventos_pacientes(tcle)
+    cubo = SCR_treats.cubo_contagens(tcle, 'Data assinatura')
+    SCR_treats.get_andamentos(tcle, [2024], [1])
+
+    assert SCR_treats.eventos_pacientes(tcle) is eventos
+    assert SCR_treats.cubo_contagens(tcle, 'Data assinatura') is cubo
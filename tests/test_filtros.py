@@ -0,0 +1,219 @@
+import gc
+import io
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import filtros
+from leitor_planilhas import ATRIBUTO_ORDEM_DATA, adicionar_chaves_calendario, filtrar_periodo, linhas_do_periodo, ordenar_por_data
+
+
+def _df(n=500, semente=0):
+    rng = random.Random(semente)
+    return pd.DataFrame({
+        'Estudo': pd.Categorical([rng.choice(['ALPHA', 'BETA', 'GAMMA', None]) for _ in range(n)]),
+        'Setor': [rng.choice(['Farmácia', 'Coordenação', 'Enfermagem', None]) for _ in range(n)],
+        'Responsável': pd.Series([rng.choice(['Ana', 'Bia', None]) for _ in range(n)], dtype=pd.StringDtype('pyarrow_numpy')),
+        'Valor': np.arange(n),
+    })
+
+
+def _filtrar_com_isin(df, selecoes):
+    mascara = np.ones(len(df), dtype=bool)
+    for coluna, valores in filtros._normalizar_selecoes(selecoes).items():
+        mascara &= df[coluna].isin(valores).to_numpy()
+    return df[mascara]
+
+
+SELECOES = [
+    {'Estudo': ['ALPHA']},
+    {'Estudo': ['ALPHA', 'GAMMA'], 'Setor': ['Farmácia']},
+    {'Setor': 'Enfermagem', 'Responsável': ['Bia', 'Ana']},
+    {'Estudo': [np.nan], 'Setor': [None, 'Coordenação']},
+    {'Estudo': ['NÃO EXISTE']},
+    {'Estudo': [], 'Setor': None},
+    {'Estudo': ['BETA'], 'Setor': ['Farmácia', 'Enfermagem'], 'Responsável': ['Ana']},
+]
+
+
+@pytest.mark.parametrize('selecoes', SELECOES)
+def test_bitmaps_iguais_ao_isin(selecoes):
+    df = filtros.indexar(_df(), ['Estudo', 'Setor', 'Responsável'])
+    assert filtros.indice_de(df) is not None
+
+    pd.testing.assert_frame_equal(filtros.filtrar_dimensoes(df, selecoes), _filtrar_com_isin(df, selecoes))
+
+
+def test_mascara_reaproveitada_nao_pode_ser_alterada():
+    df = filtros.indexar(_df(), ['Estudo'])
+    indice = filtros.indice_de(df)
+
+    mascara = indice.mascara({'Estudo': ['ALPHA']})
+    assert indice.mascara({'Estudo': ['ALPHA']}) is mascara
+    assert not mascara.flags.writeable
+
+
+@pytest.mark.parametrize('alterar', [
+    lambda df: df.__setitem__('Estudo', pd.Categorical(['BETA'] * len(df))),
+    lambda df: df.loc.__setitem__((df.index[:50], 'Estudo'), 'BETA'),
+    lambda df: df.loc.__setitem__((df.index[0], 'Setor'), 'Enfermagem' if df['Setor'].iloc[0] == 'Farmácia' else 'Farmácia'),
+    lambda df: df.__setitem__('Setor', df['Setor'].astype('category')),
+    lambda df: df.drop(columns='Responsável', inplace=True),
+])
+def test_indice_descartado_quando_o_dataframe_muda(alterar):
+    df = filtros.indexar(_df(), ['Estudo', 'Setor', 'Responsável'])
+    filtros.filtrar_dimensoes(df, {'Estudo': ['BETA'], 'Setor': ['Farmácia']})
+
+    alterar(df)
+
+    assert filtros.indice_de(df) is None
+    selecoes = {'Estudo': ['BETA'], 'Setor': ['Farmácia']}
+    pd.testing.assert_frame_equal(filtros.filtrar_dimensoes(df, selecoes), _filtrar_com_isin(df, selecoes))
+
+    # Indexado de novo, volta a usar os bitmaps, com o conteúdo atual
+    filtros.indexar(df, ['Estudo', 'Setor'])
+    assert filtros.indice_de(df) is not None
+    pd.testing.assert_frame_equal(filtros.filtrar_dimensoes(df, selecoes), _filtrar_com_isin(df, selecoes))
+
+
+def test_alterar_outra_coluna_mantem_o_indice():
+    df = filtros.indexar(_df(), ['Estudo'])
+    indice = filtros.indice_de(df)
+
+    df['Nova'] = 1
+    df.loc[df.index[0], 'Valor'] = -1
+
+    assert filtros.indice_de(df) is indice
+
+
+def test_indice_sai_junto_com_o_dataframe():
+    df = filtros.indexar(_df(), ['Estudo'])
+    id_df = id(df)
+    assert id_df in filtros._indices
+
+    del df
+    gc.collect()
+    assert id_df not in filtros._indices
+
+
+def _df_com_datas(n=400, semente=1):
+    df = _df(n, semente)
+    rng = random.Random(semente)
+    df['Data'] = pd.to_datetime([f'{rng.randint(2023, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}' for _ in range(n)])
+    df = adicionar_chaves_calendario(df, ['Data'])
+    return filtros.indexar(ordenar_por_data(df, 'Data'), ['Estudo', 'Setor'])
+
+
+def _filtrar_direto(df, anos, meses, selecoes):
+    mascara = _filtrar_com_isin(df, selecoes).index
+    mascara = df.index.isin(mascara) & df['Data'].dt.year.isin(anos) & df['Data'].dt.month.isin(meses)
+    return df[mascara]
+
+
+@pytest.mark.parametrize('anos, meses, selecoes', [
+    ([2024], [1, 2, 3], {}),
+    ([2023, 2025], [12], {'Estudo': ['ALPHA']}),
+    ([2024], list(range(1, 13)), {'Setor': ['Farmácia', None], 'Estudo': ['BETA', 'GAMMA']}),
+])
+def test_filtro_spec_igual_ao_filtro_direto(anos, meses, selecoes):
+    df = _df_com_datas()
+
+    recorte = filtros.FiltroSpec(anos, meses, selecoes).aplicar(df, 'Data')
+
+    pd.testing.assert_frame_equal(recorte, _filtrar_direto(df, anos, meses, selecoes))
+
+
+def test_recorte_alterado_por_um_grafico_nao_muda_os_outros():
+    df = _df_com_datas()
+    original = df.copy()
+    spec = filtros.FiltroSpec([2024], [1, 2, 3, 4, 5, 6], {'Estudo': ['ALPHA', 'BETA']})
+    esperado = spec.aplicar(df, 'Data').copy()
+
+    recorte = spec.aplicar(df, 'Data')
+    recorte['Nova'] = 1
+    recorte.loc[recorte.index[0], 'Valor'] = -1
+    recorte.drop(columns='Setor', inplace=True)
+
+    pd.testing.assert_frame_equal(spec.aplicar(df, 'Data'), esperado)
+    pd.testing.assert_frame_equal(df, original)
+
+
+def test_recorte_so_de_periodo_alterado_nao_muda_a_origem():
+    df = _df_com_datas()
+    original = df.copy()
+
+    recorte = filtros.FiltroSpec([2024], [1, 2, 3]).aplicar(df, 'Data')
+    recorte.loc[recorte.index[0], 'Valor'] = -1
+    sem_filtro = filtros.FiltroSpec().aplicar(df, 'Data')
+    sem_filtro.loc[sem_filtro.index[0], 'Valor'] = -2
+
+    pd.testing.assert_frame_equal(df, original)
+
+
+@pytest.mark.parametrize('alterar', [
+    lambda df: df.loc.__setitem__((df.index[df['Data'].dt.year == 2024][:60], 'Estudo'), 'ALPHA'),
+    lambda df: df.loc.__setitem__((df.index[df['Data'].dt.year == 2024], 'Valor'), -1),
+    lambda df: df.__setitem__('Valor', df['Valor'] * 10),
+    lambda df: df.__setitem__('Nova', 1),
+])
+def test_filtrar_de_novo_depois_de_alterar_o_dataframe(alterar):
+    df = _df_com_datas()
+    spec = filtros.FiltroSpec([2024], list(range(1, 13)), {'Estudo': ['ALPHA']})
+    antes = spec.aplicar(df, 'Data')
+
+    alterar(df)
+    depois = spec.aplicar(df, 'Data')
+
+    pd.testing.assert_frame_equal(depois, _filtrar_direto(df, [2024], list(range(1, 13)), {'Estudo': ['ALPHA']}))
+    assert not antes.equals(depois)
+
+
+def test_carregar_o_leitor_nao_muda_as_opcoes_do_pandas():
+    assert pd.get_option('mode.copy_on_write') is False
+
+
+def test_periodo_do_dataframe_ordenado_pode_ser_alterado_sem_mudar_a_origem():
+    df = _df_com_datas()
+    original = df.copy()
+
+    periodo = filtrar_periodo(df, 'Data', [2024], [1, 2, 3])
+    periodo.loc[periodo.index[0], 'Valor'] = -1
+    periodo.iloc[1:3, periodo.columns.get_loc('Valor')] = -2
+
+    pd.testing.assert_frame_equal(df, original)
+
+
+def _concatenar_ordenados(df):
+    return pd.concat([df, df.iloc[::2]], ignore_index=True)
+
+
+def _passar_pelo_parquet(df):
+    buffer = io.BytesIO()
+    _concatenar_ordenados(df).to_parquet(buffer)
+    return pd.read_parquet(buffer)
+
+
+@pytest.mark.parametrize('desordenar', [
+    _concatenar_ordenados,
+    lambda df: df.sort_values('Valor', ascending=False),
+    _passar_pelo_parquet,
+])
+def test_periodo_de_dataframe_que_perdeu_a_ordem(desordenar):
+    df = desordenar(_df_com_datas())
+    # O atributo da ordem sobrevive, mas as chaves não estão mais em ordem
+    assert df.attrs[ATRIBUTO_ORDEM_DATA] == 'Data'
+
+    assert not isinstance(linhas_do_periodo(df, 'Data', [2024], [1, 2, 3]), slice)
+    pd.testing.assert_frame_equal(filtrar_periodo(df, 'Data', [2024], [1, 2, 3]), _filtrar_direto(df, [2024], [1, 2, 3], {}))
+    recorte = filtros.FiltroSpec([2023, 2025], [12], {'Estudo': ['ALPHA']}).aplicar(df, 'Data')
+    pd.testing.assert_frame_equal(recorte, _filtrar_direto(df, [2023, 2025], [12], {'Estudo': ['ALPHA']}))
+
+
+def test_periodo_de_dataframe_ordenado_usa_a_busca_binaria():
+    df = _df_com_datas()
+
+    assert isinstance(linhas_do_periodo(df, 'Data', [2024], [1, 2, 3]), slice)
+    # A ordem conferida vale também para as fatias do mesmo dataframe
+    assert isinstance(linhas_do_periodo(df.iloc[100:], 'Data', [2024], [1, 2, 3]), slice)
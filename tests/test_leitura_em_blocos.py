@@ -0,0 +1,88 @@
+import functools
+import io
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import leitor_planilhas
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload
+
+
+@pytest.mark.parametrize('tamanho_bloco', [7, 50, 10_000])
+def test_blocos_juntos_iguais_a_leitura_projetada(bytes_screening, monkeypatch, tamanho_bloco):
+    monkeypatch.setattr(leitor_planilhas, 'MOTOR_EXCEL', 'openpyxl')
+    argumentos = (SCR_treats.aba_necessaria, SCR_treats.coluna_necessaria)
+
+    projetadas = leitor_planilhas.ler_abas_projetadas(io.BytesIO(bytes_screening), *argumentos)
+
+    blocos = {}
+    for nome_aba, bloco in leitor_planilhas.ler_abas_em_blocos(io.BytesIO(bytes_screening), *argumentos, tamanho_bloco=tamanho_bloco):
+        assert len(bloco) <= tamanho_bloco
+        blocos.setdefault(nome_aba, []).append(bloco)
+
+    assert list(blocos) == list(projetadas)
+    for nome_aba, partes in blocos.items():
+        pd.testing.assert_frame_equal(pd.concat(partes), projetadas[nome_aba], obj=nome_aba)
+
+
+def test_coluna_vazia_em_um_bloco_mantem_o_tipo_dos_anteriores(monkeypatch):
+    df = pd.DataFrame({'Data TCLE': pd.to_datetime(['2024-01-01', '2024-02-01', None, None]), 'Status': ['a', 'b', 'c', 'd']})
+    buffer = io.BytesIO()
+    df.to_excel(buffer, sheet_name='TCLE', index=False)
+
+    blocos = [bloco for _, bloco in leitor_planilhas.ler_abas_em_blocos(buffer, lambda aba: True, lambda aba, coluna: True, tamanho_bloco=2)]
+
+    assert [bloco['Data TCLE'].dtype for bloco in blocos] == [blocos[0]['Data TCLE'].dtype] * 2
+    assert blocos[1]['Data TCLE'].isna().all()
+
+
+def test_tratamento_em_blocos_igual_ao_tratamento_projetado(bytes_screening, monkeypatch):
+    monkeypatch.setattr(leitor_planilhas, 'MOTOR_EXCEL', 'openpyxl')
+    tratar = SCR_treats.tratar_planilha.__wrapped__
+
+    projetado = SCR_treats._achatar_dfs(tratar(Upload(bytes_screening, 'a.xlsx')))
+
+    monkeypatch.setattr(SCR_treats, 'LIMITE_LEITURA_EM_BLOCOS', 0)
+    monkeypatch.setattr(SCR_treats, 'ler_abas_em_blocos', functools.partial(leitor_planilhas.ler_abas_em_blocos, tamanho_bloco=16))
+    em_blocos = SCR_treats._achatar_dfs(tratar(Upload(bytes_screening, 'a.xlsx')))
+
+    for chave in projetado:
+        pd.testing.assert_frame_equal(em_blocos[chave], projetado[chave], obj=chave)
+
+
+def _blocos_tratados(quantidade=20, linhas=5_000):
+    rng = np.random.default_rng(0)
+    return [pd.DataFrame({'Tempo de SCR (dias)': rng.random(linhas),
+                          'Ano': rng.integers(2023, 2026, linhas),
+                          'Data assinatura': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, linhas), 'D'),
+                          'Estudo': pd.Categorical(rng.choice(['ALPHA', 'BETA'], linhas))},
+                         index=pd.RangeIndex(i * linhas, (i + 1) * linhas))
+            for i in range(quantidade)]
+
+
+def test_concatenar_blocos_igual_ao_concat():
+    esperado = pd.concat(_blocos_tratados(), ignore_index=True)
+
+    pd.testing.assert_frame_equal(leitor_planilhas.concatenar_blocos(_blocos_tratados()), esperado)
+
+
+def test_concatenar_blocos_nao_duplica_o_resultado_na_memoria():
+    tracemalloc.start()
+    try:
+        blocos = _blocos_tratados()
+        antes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+        df = leitor_planilhas.concatenar_blocos(blocos)
+        pico = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    resultado = df.memory_usage(index=False).sum()
+    maior_coluna = max(df.memory_usage(index=False))
+    # Com `pd.concat` o pico seria os blocos mais o resultado inteiro: aqui, os blocos mais algumas colunas
+    assert pico - antes < 2 * maior_coluna + 0.1 * resultado
+    assert blocos == []
@@ -0,0 +1,240 @@
+import datetime
+import gc
+import os
+import weakref
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import leitor_planilhas
+import memoria_sessoes
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload
+from leitor_planilhas import ATRIBUTO_ORDEM_DATA, TIPO_TEXTO_LIVRE
+
+
+class _Gerenciador():
+    def __init__(self, sessoes):
+        self._sessoes_ativas = sessoes
+
+    def list_sessions(self):
+        return [SimpleNamespace(session=sessao) for sessao in self._sessoes_ativas]
+
+
+def _sessao(id_sessao, estado):
+    return SimpleNamespace(id=id_sessao, session_state=estado, _state=memoria_sessoes.AppSessionState.APP_IS_RUNNING)
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    '''Simula o servidor do Streamlit: `runtime.get_instance()` devolve o objeto da fixture'''
+    instancia = SimpleNamespace()
+    monkeypatch.setattr(memoria_sessoes.runtime, 'exists', lambda: True)
+    monkeypatch.setattr(memoria_sessoes.runtime, 'get_instance', lambda: instancia)
+    monkeypatch.setattr(memoria_sessoes, '_erro_sessoes', None)
+    return instancia
+
+
+def test_le_as_sessoes_do_servidor(servidor):
+    servidor._session_mgr = _Gerenciador([_sessao('a', {'dfs': 1}), _sessao('b', {})])
+
+    assert [(id_sessao, em_execucao) for id_sessao, _, em_execucao in memoria_sessoes._sessoes()] == [('a', True), ('b', True)]
+    assert memoria_sessoes.erro_leitura_sessoes() is None
+
+
+def test_sem_as_partes_internas_considera_so_a_sessao_atual(servidor):
+    # Ex.: uma versão do Streamlit sem o `_session_mgr`
+    sessoes = memoria_sessoes._sessoes()
+
+    assert len(sessoes) == 1
+    assert sessoes[0][0] == memoria_sessoes._id_sessao_atual()
+    assert 'AttributeError' in memoria_sessoes.erro_leitura_sessoes()
+
+
+def test_leitura_volta_a_funcionar(servidor):
+    memoria_sessoes._sessoes()
+    assert memoria_sessoes.erro_leitura_sessoes() is not None
+
+    servidor._session_mgr = _Gerenciador([_sessao('a', {})])
+    memoria_sessoes._sessoes()
+    assert memoria_sessoes.erro_leitura_sessoes() is None
+
+
+@pytest.fixture(autouse=True)
+def tamanhos_limpos(monkeypatch):
+    monkeypatch.setattr(memoria_sessoes, '_tamanhos', {})
+
+
+def _dados_sessao():
+    tcle = pd.DataFrame({
+        'Estudo': pd.Categorical(['ALPHA', 'BETA', 'ALPHA', None]),
+        'Motivo': pd.Series(['a', None, 'c', 'd'], dtype=TIPO_TEXTO_LIVRE),
+        'Data assinatura': pd.to_datetime(['2024-01-02', '2024-02-03', None, '2024-03-04']),
+        'Submissão': [datetime.datetime(2024, 1, 5), 'N/A', np.nan, 'Em duplicata'],
+    })
+    tcle.attrs[ATRIBUTO_ORDEM_DATA] = 'Data assinatura'
+    return {'mot_cat': tcle.iloc[:2], 'tcles': {'tcle': tcle, 'pre_tcle': pd.DataFrame()}, 'pcts': pd.DataFrame(), 'repetido': tcle}
+
+
+@pytest.fixture
+def pasta_descarregados(tmp_path, monkeypatch):
+    monkeypatch.setattr(memoria_sessoes, 'PASTA_DESCARREGADOS', str(tmp_path))
+    monkeypatch.setattr(memoria_sessoes, '_pasta_descarregados_limpa', True)
+    return tmp_path
+
+
+def test_descarregar_e_carregar_devolve_os_mesmos_dados(pasta_descarregados):
+    dados = _dados_sessao()
+    estado = {'dfs': dados}
+
+    assert memoria_sessoes.descarregar('s1', estado, 'dfs', 100)
+    descarregados = estado['dfs']
+    assert isinstance(descarregados, memoria_sessoes.DadosDescarregados)
+
+    carregados = descarregados.carregar()
+    tcle = carregados['tcles']['tcle']
+    pd.testing.assert_frame_equal(tcle, dados['tcles']['tcle'])
+    pd.testing.assert_frame_equal(carregados['mot_cat'], dados['mot_cat'])
+    assert tcle.attrs == {ATRIBUTO_ORDEM_DATA: 'Data assinatura'}
+    assert isinstance(tcle['Estudo'].dtype, pd.CategoricalDtype)
+    # O mesmo DataFrame em dois lugares volta como um objeto só
+    assert carregados['repetido'] is tcle
+    # Os arquivos são apagados quando os dados voltam para a memória
+    assert not os.path.exists(descarregados.pasta)
+
+
+def test_tamanho_medido_de_novo_quando_os_dados_mudam():
+    df = pd.DataFrame({'a': np.arange(1000)})
+    ids, tamanho = memoria_sessoes._tamanho('s1', 'dfs', {'x': df})
+    assert ids == (id(df),)
+
+    df['b'] = np.arange(1000)
+    assert memoria_sessoes._tamanho('s1', 'dfs', {'x': df})[1] > tamanho
+
+    outro = pd.DataFrame({'a': np.arange(10)})
+    assert memoria_sessoes._tamanho('s1', 'dfs', {'x': outro})[1] < tamanho
+
+
+def test_tamanho_nao_mantem_os_dataframes_vivos():
+    df = pd.DataFrame({'a': np.arange(1000)})
+    referencia = weakref.ref(df)
+    memoria_sessoes._tamanho('s1', 'dfs', df)
+
+    del df
+    gc.collect()
+    assert referencia() is None
+    assert memoria_sessoes._tamanhos[('s1', 'dfs')][0][0]() is None
+
+
+def test_limites_do_secrets(monkeypatch):
+    monkeypatch.setattr(memoria_sessoes.st, 'secrets', {'memoria': {'LIMITE_MEMORIA_SESSAO_MB': 10}})
+    assert memoria_sessoes.limites_memoria() == (10, memoria_sessoes.LIMITE_MEMORIA_TOTAL_MB)
+
+    monkeypatch.setattr(memoria_sessoes.st, 'secrets', {})
+    assert memoria_sessoes.limites_memoria() == (memoria_sessoes.LIMITE_MEMORIA_SESSAO_MB, memoria_sessoes.LIMITE_MEMORIA_TOTAL_MB)
+
+
+def test_aplicar_limites_descarrega_o_menos_usado(pasta_descarregados, monkeypatch):
+    antigo = {'dados_qualidade': pd.DataFrame({'a': np.arange(100_000)}), 'dados_regulatorio': pd.DataFrame({'a': np.arange(100_000)})}
+    monkeypatch.setattr(memoria_sessoes, '_sessoes', lambda: [('s1', antigo, True)])
+    monkeypatch.setattr(memoria_sessoes.st, 'secrets', {'memoria': {'LIMITE_MEMORIA_SESSAO_MB': 1}})
+    monkeypatch.setattr(memoria_sessoes, '_ultimos_usos', {('s1', 'dados_qualidade'): 1, ('s1', 'dados_regulatorio'): 2})
+    monkeypatch.setattr(memoria_sessoes, '_chaves_em_uso', {})
+    monkeypatch.setattr(memoria_sessoes, '_id_sessao_atual', lambda: 's1')
+
+    assert memoria_sessoes.aplicar_limites() == [('s1', 'dados_qualidade')]
+    assert isinstance(antigo['dados_qualidade'], memoria_sessoes.DadosDescarregados)
+    assert isinstance(antigo['dados_regulatorio'], pd.DataFrame)
+
+
+def test_outra_sessao_so_e_marcada_e_descarrega_na_propria_execucao(pasta_descarregados, monkeypatch):
+    atual = {'dados_qualidade': pd.DataFrame({'a': np.arange(10)})}
+    outra = {'dados_qualidade': pd.DataFrame({'a': np.arange(100_000)}), 'dados_regulatorio': pd.DataFrame({'a': np.arange(10)})}
+    monkeypatch.setattr(memoria_sessoes, '_sessoes', lambda: [('s1', atual, True), ('s2', outra, False)])
+    monkeypatch.setattr(memoria_sessoes.st, 'secrets', {'memoria': {'LIMITE_MEMORIA_SESSAO_MB': 0.5}})
+    monkeypatch.setattr(memoria_sessoes, '_ultimos_usos', {})
+    monkeypatch.setattr(memoria_sessoes, '_chaves_em_uso', {})
+    monkeypatch.setattr(memoria_sessoes, '_marcados', {})
+    monkeypatch.setattr(memoria_sessoes, '_id_sessao_atual', lambda: 's1')
+
+    # A sessão atual não altera o estado da outra: só marca os dados dela
+    assert memoria_sessoes.aplicar_limites() == [('s2', 'dados_qualidade')]
+    assert isinstance(outra['dados_qualidade'], pd.DataFrame)
+    assert memoria_sessoes._marcados == {'s2': {'dados_qualidade'}}
+
+    # Na próxima execução da outra sessão, ela mesma descarrega os dados marcados
+    monkeypatch.setattr(memoria_sessoes, '_id_sessao_atual', lambda: 's2')
+    monkeypatch.setattr(memoria_sessoes.st, 'session_state', outra)
+    memoria_sessoes.usar_dados(['dados_regulatorio'])
+
+    assert isinstance(outra['dados_qualidade'], memoria_sessoes.DadosDescarregados)
+    assert isinstance(outra['dados_regulatorio'], pd.DataFrame)
+    assert memoria_sessoes._marcados == {}
+
+
+def test_marcados_usados_pela_pagina_continuam_na_memoria(pasta_descarregados, monkeypatch):
+    estado = {'dados_qualidade': pd.DataFrame({'a': np.arange(10)})}
+    monkeypatch.setattr(memoria_sessoes, '_sessoes', lambda: [('s2', estado, True)])
+    monkeypatch.setattr(memoria_sessoes, '_marcados', {'s2': {'dados_qualidade'}})
+    monkeypatch.setattr(memoria_sessoes, '_id_sessao_atual', lambda: 's2')
+    monkeypatch.setattr(memoria_sessoes.st, 'session_state', estado)
+
+    memoria_sessoes.usar_dados(['dados_qualidade'])
+
+    assert isinstance(estado['dados_qualidade'], pd.DataFrame)
+    assert memoria_sessoes._marcados == {}
+
+
+@pytest.fixture
+def sessao_s1(monkeypatch):
+    monkeypatch.setattr(leitor_planilhas, 'id_sessao_atual', lambda: 's1')
+    yield
+    for chave, _, sessoes in leitor_planilhas.registro_dados.entradas():
+        for id_sessao in sessoes:
+            leitor_planilhas.registro_dados.liberar(chave, id_sessao)
+
+
+def test_descarregar_libera_a_memoria_dos_dados(pasta_descarregados, sessao_s1, bytes_screening):
+    estado = {'dfs': SCR_treats.tratar_planilha(Upload(bytes_screening, 'a.xlsx'))}
+    referencia = weakref.ref(estado['dfs']['tcles']['tcle'])
+
+    assert memoria_sessoes.descarregar('s1', estado, 'dfs', 100)
+    gc.collect()
+
+    # Nem o registro nem os caches guardam outra referência aos dados descarregados
+    assert referencia() is None
+    assert len(leitor_planilhas.registro_dados) == 0
+
+    # De volta à memória, os dados voltam a ser compartilhados pelo registro
+    carregados = estado['dfs'].carregar('s1')
+    assert leitor_planilhas.registro_dados.obter(estado['dfs'].chave_registro) is carregados
+
+
+def test_carregar_recebe_os_dados_abertos_por_outra_sessao(pasta_descarregados, sessao_s1, bytes_screening, monkeypatch):
+    estado = {'dfs': SCR_treats.tratar_planilha(Upload(bytes_screening, 'a.xlsx'))}
+    assert memoria_sessoes.descarregar('s1', estado, 'dfs', 100)
+
+    monkeypatch.setattr(leitor_planilhas, 'id_sessao_atual', lambda: 's2')
+    outra_sessao = SCR_treats.tratar_planilha(Upload(bytes_screening, 'b.xlsx'))
+
+    assert estado['dfs'].carregar('s1') is outra_sessao
+
+
+def test_aplicar_limites_esvazia_os_caches_primeiro(pasta_descarregados, monkeypatch):
+    estado = {'dados_qualidade': pd.DataFrame({'a': np.arange(100_000)})}
+    monkeypatch.setattr(memoria_sessoes, '_sessoes', lambda: [('s1', estado, True)])
+    monkeypatch.setattr(memoria_sessoes.st, 'secrets', {'memoria': {'LIMITE_MEMORIA_TOTAL_MB': 1.5}})
+    monkeypatch.setattr(memoria_sessoes, '_ultimos_usos', {})
+    monkeypatch.setattr(memoria_sessoes, '_chaves_em_uso', {})
+    monkeypatch.setattr(memoria_sessoes, '_id_sessao_atual', lambda: 's1')
+    for i in range(3):
+        leitor_planilhas.cache_abas.guardar(i, {'tcle': pd.DataFrame({'a': np.arange(50_000)})})
+
+    assert memoria_sessoes.memoria_caches() > 1024 ** 2
+    assert memoria_sessoes.aplicar_limites() == []
+
+    # Só as abas usadas há mais tempo saem, até o servidor ficar abaixo do limite
+    assert leitor_planilhas.cache_abas.chaves() == [2]
+    assert isinstance(estado['dados_qualidade'], pd.DataFrame)
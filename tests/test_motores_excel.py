@@ -0,0 +1,43 @@
+import io
+
+import pandas as pd
+import pytest
+
+import leitor_planilhas
+from assets.Screening import Screening_Treatments as SCR_treats
+
+pytest.importorskip('python_calamine')
+
+
+def _ler(conteudo, motor, monkeypatch, funcao, *args):
+    monkeypatch.setattr(leitor_planilhas, 'MOTOR_EXCEL', motor)
+    return funcao(io.BytesIO(conteudo), *args)
+
+
+def test_read_excel_igual_nos_dois_motores(bytes_screening):
+    abas_openpyxl = pd.read_excel(io.BytesIO(bytes_screening), sheet_name=None, engine='openpyxl')
+    abas_calamine = pd.read_excel(io.BytesIO(bytes_screening), sheet_name=None, engine='calamine')
+
+    assert list(abas_openpyxl) == list(abas_calamine)
+    for nome_aba in abas_openpyxl:
+        pd.testing.assert_frame_equal(abas_calamine[nome_aba], abas_openpyxl[nome_aba], obj=nome_aba)
+
+
+def test_leitura_projetada_igual_nos_dois_motores(bytes_screening, monkeypatch):
+    argumentos = (SCR_treats.aba_necessaria, SCR_treats.coluna_necessaria)
+    abas_openpyxl = _ler(bytes_screening, 'openpyxl', monkeypatch, leitor_planilhas.ler_abas_projetadas, *argumentos)
+    abas_calamine = _ler(bytes_screening, 'calamine', monkeypatch, leitor_planilhas.ler_abas_projetadas, *argumentos)
+
+    assert list(abas_openpyxl) == list(abas_calamine)
+    for nome_aba in abas_openpyxl:
+        pd.testing.assert_frame_equal(abas_calamine[nome_aba], abas_openpyxl[nome_aba], obj=nome_aba)
+
+
+def test_tratamento_igual_nos_dois_motores(bytes_screening, monkeypatch):
+    tratar = SCR_treats.tratar_planilha.__wrapped__
+    dados_openpyxl = SCR_treats._achatar_dfs(_ler(bytes_screening, 'openpyxl', monkeypatch, tratar))
+    leitor_planilhas.cache_abas.limpar()
+    dados_calamine = SCR_treats._achatar_dfs(_ler(bytes_screening, 'calamine', monkeypatch, tratar))
+
+    for chave in dados_openpyxl:
+        pd.testing.assert_frame_equal(dados_calamine[chave], dados_openpyxl[chave], obj=chave)
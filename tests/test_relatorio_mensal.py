@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload, planilha_screening
+
+
+@pytest.fixture(scope='module')
+def dfs():
+    dados = SCR_treats.DadosScreening()
+    for semente, nome in enumerate(['PLAN_SCR_2024.xlsx', 'PLAN_SCR_2025.xlsx']):
+        dados.adicionar(str(semente), SCR_treats.tratar_planilha(Upload(planilha_screening(300, semente + 20), nome)), nome)
+    uniao = dados.uniao()
+    return uniao['tcles']['tcle'], uniao['tcles']['pre_tcle'], uniao['mot_cat']
+
+
+def _no_periodo(df, coluna, ano, mes=None):
+    mascara = df[coluna].dt.year.isin(ano)
+    if mes is not None:
+        mascara &= df[coluna].dt.month.isin(mes)
+    return df[mascara]
+
+
+def _do_tipo(df, tipo):
+    return df if not tipo else df[df['Onco/multi'].astype(object).str.lower() == tipo.lower()]
+
+
+def _com_status(df, status):
+    return int((df['Status'].astype(object).str.lower() == status).sum())
+
+
+def _relatorio_direto(tcle, pre_tcle, mot_cat, mes, ano, tipo):
+    '''O relatório calculado filtrando os dataframes, como antes do pré-cálculo'''
+    princ_andamentos = _do_tipo(_no_periodo(tcle, 'Data assinatura', ano), tipo)
+    pre_andamentos = _do_tipo(_no_periodo(pre_tcle, 'Data assinatura', ano, mes), tipo)
+    falhas_tcle = _do_tipo(_no_periodo(tcle, 'Data da falha', ano, mes), tipo)
+    falhas_pre = _do_tipo(_no_periodo(pre_tcle, 'Data da falha', ano, mes), tipo)
+    motivos = _do_tipo(_no_periodo(mot_cat, 'Data da falha', ano, mes), tipo)
+
+    tcle_contagens = [_com_status(falhas_tcle, 'randomizado'), _com_status(falhas_tcle, 'falha'), _com_status(princ_andamentos, 'andamento')]
+    pre_contagens = [_com_status(falhas_pre, 'segue tcle principal'), _com_status(falhas_pre, 'falha'), _com_status(pre_andamentos, 'andamento')]
+    categorias = motivos.groupby(['Processo', 'Categoria'], observed=True).size().reset_index(name='Contagem')
+
+    return (tcle_contagens + [sum(tcle_contagens)], pre_contagens + [sum(pre_contagens)],
+            categorias[categorias['Processo'] == 'TCLE'], categorias[categorias['Processo'] == 'Pré-TCLE'])
+
+
+def _sem_indice(df):
+    return df.reset_index(drop=True).astype({'Processo': object, 'Categoria': object})
+
+
+@pytest.mark.parametrize('mes, ano', [([3], [2024]), (list(range(1, 13)), [2023, 2024, 2025]), ([11, 12], [2025]),
+                                      ([1], [1999]), ([], [2024]), ([3], []), ([], [])])
+@pytest.mark.parametrize('tipo', [None, 'Onco', 'Multi'])
+def test_relatorio_igual_ao_calculado_nos_dataframes(dfs, mes, ano, tipo):
+    resumo_tcle, resumo_pre, cat_tcle, cat_pre = SCR_treats.gerar_relatorio_mes(*dfs, mes, ano, tipo)
+    esperado_tcle, esperado_pre, esperado_cat_tcle, esperado_cat_pre = _relatorio_direto(*dfs, mes, ano, tipo)
+
+    assert resumo_tcle['Quantidade'].tolist() == esperado_tcle
+    assert resumo_pre['Quantidade'].tolist() == esperado_pre
+    pd.testing.assert_frame_equal(_sem_indice(cat_tcle), _sem_indice(esperado_cat_tcle))
+    pd.testing.assert_frame_equal(_sem_indice(cat_pre), _sem_indice(esperado_cat_pre))
+
+
+def test_selecao_vazia_nao_conta_nada(dfs):
+    resumo_tcle, resumo_pre, cat_tcle, cat_pre = SCR_treats.gerar_relatorio_mes(*dfs, [], [2024])
+
+    assert resumo_tcle['Quantidade'].tolist() == [0, 0, resumo_tcle['Quantidade'][2], resumo_tcle['Quantidade'][2]]
+    assert resumo_pre['Quantidade'].tolist() == [0, 0, 0, 0]
+    assert cat_tcle.empty and cat_pre.empty
+
+    resumo_tcle, *_ = SCR_treats.gerar_relatorio_mes(*dfs, [3], [])
+    assert resumo_tcle['Quantidade'].tolist() == [0, 0, 0, 0]
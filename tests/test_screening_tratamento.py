@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from assets.Screening import Screening_Treatments as SCR_treats
+from conftest import Upload, planilha_screening
+
+
+def test_dimensoes_categoricas_com_a_caixa_padronizada(bytes_screening):
+    tcle = SCR_treats.tratar_planilha(Upload(bytes_screening, 'a.xlsx'))['tcles']['tcle']
+
+    for coluna in ['Estudo', 'Status', 'Médico que assinou', 'Onco/multi']:
+        assert isinstance(tcle[coluna].dtype, pd.CategoricalDtype)
+    assert set(tcle['Estudo'].cat.categories) == {'ALPHA', 'BETA', 'GAMMA', 'DELTA'}
+    assert set(tcle['Onco/multi'].cat.categories) == {'Onco', 'Multi'}
+    assert set(tcle['Status'].cat.categories) == {'Falha', 'Randomizado', 'Andamento'}
+
+
+@pytest.mark.parametrize('coluna', ['Onco/multi', 'Médico que assinou', 'Categoria'])
+def test_dimensao_sem_nenhum_valor_na_aba(coluna):
+    # Uma coluna toda em branco é lida como float pelo pandas: não pode impedir a leitura da planilha
+    dados = SCR_treats.tratar_planilha(Upload(planilha_screening(vazias=[coluna]), 'a.xlsx'))
+    tcle, mot_cat = dados['tcles']['tcle'], dados['mot_cat']
+
+    assert len(tcle) == 120
+    assert not mot_cat.empty
+    for df in [tcle, mot_cat]:
+        if coluna in df.columns:
+            assert isinstance(df[coluna].dtype, pd.CategoricalDtype)
+            assert df[coluna].cat.categories.dtype == object
+
+    falhas_tcle = mot_cat[mot_cat['Processo'] == 'TCLE']
+    assert falhas_tcle[coluna].isna().all()
@@ -0,0 +1,61 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import snapshots
+from conftest import Upload
+from leitor_planilhas import TIPO_TEXTO_LIVRE
+
+
+@pytest.fixture(autouse=True)
+def pasta_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshots, 'PASTA_SNAPSHOTS', str(tmp_path))
+    return tmp_path
+
+
+def _dados():
+    df = pd.DataFrame({
+        'Estudo': pd.Categorical(['ALPHA', 'BETA', 'ALPHA']),
+        'Motivo': pd.Series(['a', None, 'c'], dtype=TIPO_TEXTO_LIVRE),
+        'Data': pd.to_datetime(['2024-01-02', None, '2024-03-04']),
+        'Submissão': [datetime.datetime(2024, 1, 5), 'N/A', np.nan],
+        'Dias': [1.5, np.nan, 3.0],
+    })
+    return {'dfs': {'tcles': {'tcle': df, 'pre_tcle': pd.DataFrame()}}, 'estudos': ['ALPHA', 'BETA'], 'total': np.int64(3)}
+
+
+def test_salvar_e_abrir_devolve_os_mesmos_dados():
+    dados = _dados()
+    snapshots.salvar_snapshot('screening', dados, [Upload(b'planilha', 'PLAN.xlsx')], '1', dono='Pesquisa')
+
+    meta = snapshots.ultimo_snapshot('screening', '1', dono='Pesquisa')
+    reaberto = snapshots.abrir_snapshot(meta)
+
+    pd.testing.assert_frame_equal(reaberto['dfs']['tcles']['tcle'], dados['dfs']['tcles']['tcle'])
+    assert reaberto['dfs']['tcles']['pre_tcle'].empty
+    assert reaberto['estudos'] == ['ALPHA', 'BETA']
+    assert reaberto['total'] == 3
+    assert meta['arquivos'][0]['nome'] == 'PLAN.xlsx'
+
+
+def test_snapshot_so_e_oferecido_ao_setor_que_salvou():
+    snapshots.salvar_snapshot('screening', _dados(), [], '1', dono='Pesquisa')
+
+    assert snapshots.ultimo_snapshot('screening', '1', dono='Pesquisa') is not None
+    assert snapshots.ultimo_snapshot('screening', '1', dono='Qualidade') is None
+
+
+def test_snapshot_de_outra_versao_nao_e_reaberto():
+    snapshots.salvar_snapshot('screening', _dados(), [], '1', dono='Pesquisa')
+
+    assert snapshots.ultimo_snapshot('screening', '2', dono='Pesquisa') is None
+
+
+def test_mantem_so_os_snapshots_mais_recentes(monkeypatch):
+    monkeypatch.setattr(snapshots, 'MAX_SNAPSHOTS_POR_CONJUNTO', 2)
+    for _ in range(4):
+        snapshots.salvar_snapshot('qualidade', {'dados_qualidade': pd.DataFrame({'a': [1]})}, [], '1', dono='Qualidade')
+
+    assert len(snapshots._listar_snapshots('qualidade', 'Qualidade')) == 2